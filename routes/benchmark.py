@@ -0,0 +1,335 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Benchmarks the routing pipeline offline, and compares results between runs.
+
+Times parsing the distance matrix sheet and pairwise distances, merging them,
+solving the TSP, evaluating peak sequences (as ps2d.py does) and reading the
+recorded GPX tracks. The matrix benchmarks run on:
+  - snapshot: routes/sheet-snapshot.csv with routes/pairwise_distances.csv.
+  - synthetic-N: a generated sheet of N peaks with direct distances only to
+    each peak's nearest neighbors, like the real sheet, for --sizes N.
+
+sheet-snapshot.csv has the format and sparsity of the Google Sheet, but its
+cells were derived from pairwise_distances.csv and the summit elevations
+rather than exported from the sheet. --freeze_sheet replaces it with an
+export of the sheet at a url.
+
+Results are printed to stderr and written as JSON to --output. Passing a
+previous run's JSON as --compare reports the benchmarks that got slower by
+more than --tolerance, and exits with status 1 if any did.
+
+Dev command:
+    python3 routes/benchmark.py -o /tmp/benchmark.json --compare /tmp/baseline.json
+"""
+
+from __future__ import print_function
+import os
+import sys
+import argparse
+import csv
+import datetime
+import json
+import platform
+import time
+
+import numpy as np
+from io import StringIO
+
+import common
+import gpx
+import local_search
+import ps2d
+
+ROUTES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SNAPSHOT_PATH = os.path.join(ROUTES_DIR, 'sheet-snapshot.csv')
+PAIRWISE_DISTANCES_PATH = os.path.join(ROUTES_DIR, 'pairwise_distances.csv')
+GPX_PATHS = [
+    os.path.join(ROUTES_DIR, name)
+    for name in ('2019-fkt-combined.gpx', '2020-fkt-part-2.gpx')
+]
+
+MILES_PER_KM = 0.621371
+
+
+def synthetic_sheet(n, neighbors=4, seed=46):
+    """Returns (distance matrix sheet, pairwise distances csv) for `n` random
+    peaks, as csv strings.
+
+    Peaks are spread at the density of the 46ers, and the sheet has direct
+    distances between each peak and its `neighbors` nearest peaks, plus a
+    chain through all of them so that the matrix is connected. Pairwise
+    distances are given between all peaks.
+    """
+    rng = np.random.RandomState(seed)
+    # The 46ers span roughly 50 km by 50 km.
+    (x, y) = rng.uniform(0, 50 * np.sqrt(n / 46.), (2, n))
+    elevation = rng.uniform(3800, 5300, n)
+    km = np.hypot(x[:, np.newaxis] - x, y[:, np.newaxis] - y)
+    np.fill_diagonal(km, np.inf)
+
+    direct = np.zeros((n, n), dtype=bool)
+    nearest = np.argsort(km, axis=1)[:, :neighbors]
+    direct[np.arange(n)[:, np.newaxis], nearest] = True
+    order = np.argsort(x)
+    direct[order[:-1], order[1:]] = True
+    # Like the sheet, only one direction of each pair is filled in.
+    direct = np.triu(direct | direct.T)
+
+    names = ['Peak {}'.format(i) for i in range(n)]
+    sheet = StringIO()
+    writer = csv.writer(sheet)
+    writer.writerow([''] + names + ['Trailhead'])
+    for i in range(n):
+        row = [names[i]] + [''] * n
+        for j in np.nonzero(direct[i])[0]:
+            miles = km[i, j] * 1.3 * MILES_PER_KM
+            rolling = 150 * miles
+            row[j + 1] = _distance_string(
+                miles, max(0, elevation[j] - elevation[i]) + rolling,
+                max(0, elevation[i] - elevation[j]) + rolling)
+        row.append(
+            _distance_string(3 + km[i].min() * MILES_PER_KM, 300,
+                             elevation[i] - 1700))
+        writer.writerow(row)
+
+    pairs = StringIO()
+    writer = csv.writer(pairs)
+    for (i, j) in zip(*np.nonzero(np.isfinite(km))):
+        writer.writerow([names[i], names[j], '{:.3f}'.format(km[i, j] * 1.4)])
+    return sheet.getvalue(), pairs.getvalue()
+
+
+def _distance_string(miles, gain, loss):
+    return 'Distance: {:.1f} mi\n+{:,.0f} ft / -{:,.0f} ft'.format(
+        miles, gain, loss)
+
+
+def time_calls(function, repeat):
+    """Returns (seconds each of `repeat` calls to `function` took, the last
+    call's result)."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return times, result
+
+
+def _result(name, fixture, size, times, **extra):
+    result = {
+        'name': name,
+        'fixture': fixture,
+        'size': size,
+        'repeat': len(times),
+        'min': min(times),
+        'median': float(np.median(times)),
+    }
+    result.update(extra)
+    return result
+
+
+def benchmark_matrix(fixture, sheet, pairs, repeat, solvers, time_limit,
+                     sequences):
+    """Returns the results of the matrix benchmarks on a sheet and pairwise
+    distances csv."""
+    results = []
+    (times, distances) = time_calls(
+        lambda: common.parse_distance_matrix(csv.reader(StringIO(sheet)),
+                                             common.DEFAULT_COST), repeat)
+    n = len(distances)
+    results.append(_result('parse_distance_matrix', fixture, n, times))
+    (times, pairs_distances) = time_calls(
+        lambda: common.parse_distance_matrix_from_pairs(
+            csv.reader(StringIO(pairs))), repeat)
+    results.append(
+        _result('parse_distance_matrix_from_pairs', fixture, n, times))
+    (times, distances) = time_calls(
+        lambda: common.merge_pairwise_and_matrix_distances(
+            pairs_distances, distances), repeat)
+    results.append(
+        _result('merge_pairwise_and_matrix_distances', fixture, n, times))
+
+    costs = common.cost_matrix(distances, common.DEFAULT_COST)
+    depot = n - 1  # trailhead
+    if 'local_search' in solvers:
+        (times, tour) = time_calls(
+            lambda: local_search.solve(
+                costs, depot, time_limit=time_limit, max_stale=50), repeat)
+        results.append(
+            _result('local_search',
+                    fixture,
+                    n,
+                    times,
+                    objective=int(local_search.tour_cost(costs, tour))))
+    if 'ortools' in solvers:
+        # OR-Tools always searches until the time limit, so only the
+        # objective it reaches is worth comparing.
+        import solve_tsp
+        (times, (_, objective)) = time_calls(
+            lambda: solve_tsp._solve_ortools(
+                costs, depot, time_limit, log_search=False), 1)
+        results.append(
+            _result('ortools', fixture, n, times, objective=int(objective)))
+
+    rng = np.random.RandomState(46)
+    names = list(distances)
+    batch = [['Trailhead'] + [names[i] for i in rng.permutation(n - 1)] +
+             ['Trailhead'] for _ in range(sequences)]
+    (times, _) = time_calls(lambda: ps2d.sequence_totals(distances, batch),
+                            repeat)
+    results.append(
+        _result('sequence_totals', fixture, n, times, sequences=sequences))
+    return results
+
+
+def benchmark_gpx(paths, repeat):
+    results = []
+    for path in paths:
+        (times, track) = time_calls(lambda: gpx.read_track(path), repeat)
+        results.append(
+            _result('read_track', os.path.basename(path), len(track.lat),
+                    times))
+    return results
+
+
+def compare(results, baseline, tolerance, min_difference=0.01):
+    """Returns (result, baseline result, ratio of median times) for each
+    benchmark in both runs that got slower by more than `tolerance`, and by
+    more than `min_difference` seconds (to ignore noise in fast ones)."""
+    def key(r):
+        return r['name'], r['fixture'], r['size']
+
+    previous = {key(r): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+        ratio = result['median'] / old['median']
+        if (ratio > 1 + tolerance
+                and result['median'] - old['median'] > min_difference):
+            regressions.append((result, old, ratio))
+    return regressions
+
+
+def freeze_sheet(url, path=SNAPSHOT_PATH):
+    """Saves the sheet at `url` as the snapshot benchmarks run on."""
+    import requests
+    response = requests.get(url)
+    response.raise_for_status()
+    with open(path, 'wb') as f:
+        f.write(response.content)
+
+
+def main(arguments):
+
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o',
+                        '--output',
+                        help='JSON file to write results to',
+                        type=str)
+    parser.add_argument('--compare',
+                        help='JSON results of a previous run to compare with',
+                        type=argparse.FileType('r'))
+    parser.add_argument(
+        '--tolerance',
+        help='Fraction by which a median time may grow before it is '
+        'reported as a regression',
+        default=0.25,
+        type=float)
+    parser.add_argument('--sizes',
+                        help='Numbers of peaks in synthetic sheets',
+                        nargs='*',
+                        default=[46, 250, 1000],
+                        type=int)
+    parser.add_argument('-r',
+                        '--repeat',
+                        help='Number of times to time each benchmark',
+                        default=3,
+                        type=int)
+    parser.add_argument('--solvers',
+                        help='TSP solvers to benchmark',
+                        nargs='*',
+                        choices=['ortools', 'local_search'],
+                        default=['ortools', 'local_search'])
+    parser.add_argument('--time_limit',
+                        help='Search time limit in seconds of each solve',
+                        default=5.,
+                        type=float)
+    parser.add_argument('--sequences',
+                        help='Number of peak sequences to evaluate at once',
+                        default=1000,
+                        type=int)
+    parser.add_argument('--no_gpx',
+                        help='Skip reading the recorded GPX tracks',
+                        action='store_true')
+    parser.add_argument('--freeze_sheet',
+                        help='Url of a sheet to save as the snapshot, before '
+                        'running',
+                        type=str)
+
+    args = parser.parse_args(arguments)
+
+    if args.freeze_sheet:
+        freeze_sheet(args.freeze_sheet)
+
+    fixtures = []
+    with open(SNAPSHOT_PATH) as f, open(PAIRWISE_DISTANCES_PATH) as g:
+        fixtures.append(('snapshot', f.read(), g.read()))
+    for n in args.sizes:
+        fixtures.append(('synthetic-{}'.format(n), ) + synthetic_sheet(n))
+
+    results = []
+    for (fixture, sheet, pairs) in fixtures:
+        for result in benchmark_matrix(fixture, sheet, pairs, args.repeat,
+                                       args.solvers, args.time_limit,
+                                       args.sequences):
+            _print_result(result)
+            results.append(result)
+    if not args.no_gpx:
+        for result in benchmark_gpx(GPX_PATHS, args.repeat):
+            _print_result(result)
+            results.append(result)
+
+    run = {
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+
+    if args.compare:
+        regressions = compare(results, json.load(args.compare),
+                              args.tolerance)
+        for (result, old, ratio) in regressions:
+            print('Slower: {} on {} ({:.3f} s to {:.3f} s, {:.2f}x)'.format(
+                result['name'], result['fixture'], old['median'],
+                result['median'], ratio),
+                  file=sys.stderr)
+        print('{} regressions'.format(len(regressions)), file=sys.stderr)
+        return 1 if regressions else 0
+
+
+def _print_result(result):
+    print('{:<36} {:<20} {:>7} {:>9.4f} s{}'.format(
+        result['name'], result['fixture'], result['size'], result['median'],
+        '  (objective {})'.format(result['objective'])
+        if 'objective' in result else ''),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,104 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Tests for benchmark.py.
+"""
+
+import unittest
+import benchmark
+import common
+import csv
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+
+from io import StringIO
+
+
+class TestSyntheticSheet(unittest.TestCase):
+    def test_sparse_and_connected(self):
+        (sheet, pairs) = benchmark.synthetic_sheet(30)
+        (peaks, graph, _) = common._parse_sheet(csv.reader(StringIO(sheet)))
+        self.assertEqual(len(peaks), 30)
+        # Each peak has at most a few direct distances.
+        self.assertLess(len(graph.targets), 30 * 12)
+        distances = common.parse_distance_matrix(csv.reader(StringIO(sheet)),
+                                                 common.DEFAULT_COST)
+        self.assertTrue(np.isfinite(distances.distance).all())
+        self.assertEqual(len(pairs.splitlines()), 30 * 29)
+
+    def test_snapshot(self):
+        with open(benchmark.SNAPSHOT_PATH) as f:
+            distances = common.parse_distance_matrix(csv.reader(f),
+                                                     common.DEFAULT_COST)
+        self.assertEqual(len(distances), 47)
+        self.assertTrue(np.isfinite(distances.distance).all())
+
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_default_solvers(self):
+        output = os.path.join(self.directory, 'results.json')
+        start = time.monotonic()
+        benchmark.main([
+            '--sizes', '20', '-r', '1', '--time_limit', '0.5', '--no_gpx',
+            '-o', output
+        ])
+        # Two fixtures, with each solver stopping at the time limit.
+        self.assertLess(time.monotonic() - start, 2 * 2 * 0.5 + 5)
+        with open(output) as f:
+            results = json.load(f)['results']
+        self.assertEqual(
+            {(r['name'], r['fixture'])
+             for r in results if 'objective' in r},
+            {(s, f)
+             for s in ('local_search', 'ortools')
+             for f in ('snapshot', 'synthetic-20')})
+
+
+class TestCompare(unittest.TestCase):
+    def test_reports_regressions(self):
+        def result(name, median):
+            return {
+                'name': name,
+                'fixture': 'snapshot',
+                'size': 47,
+                'median': median
+            }
+
+        baseline = {
+            'results': [
+                result('parse', 1.),
+                result('merge', 0.001),
+                result('solve', 2.)
+            ]
+        }
+        regressions = benchmark.compare(
+            [
+                result('parse', 1.5),
+                # Too fast to tell.
+                result('merge', 0.002),
+                result('solve', 2.1),
+                result('new', 1.)
+            ],
+            baseline,
+            tolerance=0.25)
+        self.assertEqual([(r['name'], ratio) for (r, _, ratio) in regressions],
+                         [('parse', 1.5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,102 +13,856 @@ from __future__ import print_function
 import os
 import sys
 import argparse
-import requests
+import atexit
+import contextlib
 import csv
+import hashlib
+import heapq
+import json
 import re
-from collections import defaultdict
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from dijkstar import Graph, find_path
+import numpy as np
 from io import StringIO
 
 GAIA_REQUEST_PATTERN = 'https://routing.gaiagps.com/route?json=%7B%22locations%22%3A%5B%7B%22lon%22%3A{start_lon}%2C%22lat%22%3A{start_lat}%2C%22type%22%3A%22break%22%7D%2C%7B%22lon%22%3A{end_lon}%2C%22lat%22%3A{end_lat}%2C%22type%22%3A%22break%22%7D%5D%2C%22costing%22%3A%22pedestrian%22%7D&max_hiking_difficulty=6'
 
+# Costing options baked into GAIA_REQUEST_PATTERN, used to key cached routes.
+GAIA_COSTING_OPTIONS = 'pedestrian&max_hiking_difficulty=6'
+
 _TRAILHEAD_NAME = "Trailhead"
 
+_DISTANCE_GAIN_LOSS_PATTERN = re.compile(
+    r'Distance: (?P<distance>[^ ]*) mi\n\+(?P<gain>[^ ]*) ft / -(?P<loss>[^ ]*) ft')
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+    'fkt-attempt-46ers')
+
+
+def load_distance_matrix(url,
+                         cost_function,
+                         cache_dir=DEFAULT_CACHE_DIR,
+                         offline=False,
+                         session=None):
+    """Downloads and parses the distance matrix sheet at `url`.
+
+    The raw sheet is cached on disk keyed by url, and the parsed (shortest path
+    closed) matrix keyed by the sheet's content hash and the cost function.
+    Cached sheets are revalidated with ETag/If-Modified-Since, or used without
+    touching the network in offline mode.
+
+    When the sheet has changed since the last parsed version, only the
+    shortest paths affected by the changed cells are recomputed.
+
+    Downloads go through `session` (e.g. from make_session) if given.
+    """
+    sheets_dir = os.path.join(cache_dir, 'sheets')
+    matrices_dir = os.path.join(cache_dir, 'matrices')
+    os.makedirs(sheets_dir, exist_ok=True)
+    os.makedirs(matrices_dir, exist_ok=True)
+    meta_path = os.path.join(
+        sheets_dir,
+        hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+    if offline:
+        assert meta is not None, 'No cached distance matrix for {}'.format(
+            url)
+    else:
+        headers = {}
+        if meta is not None and meta['etag'] is not None:
+            headers['If-None-Match'] = meta['etag']
+        if meta is not None and meta['last_modified'] is not None:
+            headers['If-Modified-Since'] = meta['last_modified']
+        if session is None:
+            import requests as session
+        with TRACER.span('download_sheet'):
+            response = session.get(url, headers=headers)
+        TRACER.count('http_requests')
+        if meta is not None and response.status_code == 304:
+            TRACER.count('sheet_not_modified')
+        if meta is None or response.status_code != 304:
+            assert response.status_code == 200, 'Download failed'
+            sha256 = hashlib.sha256(response.content).hexdigest()
+            previous_sha256 = None
+            if meta is not None:
+                previous_sha256 = (meta['sha256'] if meta['sha256'] != sha256
+                                   else meta.get('previous_sha256'))
+            meta = {
+                'url': url,
+                'sha256': sha256,
+                'previous_sha256': previous_sha256,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+            _write_atomically(
+                os.path.join(sheets_dir, meta['sha256'] + '.csv'),
+                response.content)
+            _write_atomically(meta_path,
+                              json.dumps(meta).encode('utf-8'))
+
+    matrix_path = _matrix_path(matrices_dir, meta['sha256'], cost_function)
+    if os.path.exists(matrix_path):
+        TRACER.count('matrix_cache_hits')
+        with TRACER.span('load_matrix'):
+            return _load_matrix(matrix_path)[0]
+    with TRACER.span('parse_sheet'):
+        (peaks, graph,
+         trailhead_distances) = _read_sheet(sheets_dir, meta['sha256'])
+    direct_costs = _direct_costs(graph, cost_function)
+    previous = _load_previous_sheet(sheets_dir, matrices_dir,
+                                    meta.get('previous_sha256'),
+                                    cost_function, peaks)
+    if previous is None:
+        with TRACER.span('shortest_paths',
+                         nodes=len(peaks),
+                         edges=len(graph.targets)):
+            (costs, paths, _) = graph.shortest_paths(direct_costs)
+    else:
+        (previous_graph, previous_costs, previous_paths) = previous
+        (previous_edges, edges) = (previous_graph.edges(), graph.edges())
+        with TRACER.span('update_shortest_paths', nodes=len(peaks)):
+            (costs, paths, sources) = update_shortest_paths(
+                previous_costs, previous_paths,
+                previous_graph.costs(
+                    _direct_costs(previous_graph, cost_function)),
+                previous_edges, graph.costs(direct_costs), edges)
+        print('Updated distance matrix incrementally: {} changed edges, '
+              'recomputed paths from {} of {} peaks'.format(
+                  _changed_edges(previous_edges, edges).sum(), len(sources),
+                  len(peaks)),
+              file=sys.stderr)
+    distances = _add_trailhead(peaks, paths, trailhead_distances)
+    _save_matrix(matrix_path, distances, costs)
+    return distances
+
+
+def _matrix_path(matrices_dir, sha256, cost_function):
+    return os.path.join(matrices_dir,
+                        '{}-{}.npz'.format(sha256, cost_function.__name__))
+
+
+def _read_sheet(sheets_dir, sha256):
+    with open(os.path.join(sheets_dir, sha256 + '.csv'), 'rb') as f:
+        return _parse_sheet(csv.reader(StringIO(f.read().decode('utf-8'))))
+
+
+def _load_previous_sheet(sheets_dir, matrices_dir, sha256, cost_function,
+                         peaks):
+    """Returns (SparseGraph of direct edges, shortest path costs, shortest
+    path edges) of a previously parsed version of a sheet with the same peaks,
+    or None."""
+    if sha256 is None:
+        return None
+    matrix_path = _matrix_path(matrices_dir, sha256, cost_function)
+    if not (os.path.exists(matrix_path) and
+            os.path.exists(os.path.join(sheets_dir, sha256 + '.csv'))):
+        return None
+    (distances, costs) = _load_matrix(matrix_path)
+    (previous_peaks, graph, _) = _read_sheet(sheets_dir, sha256)
+    if costs is None or previous_peaks != peaks:
+        return None
+    n = len(peaks)
+    return graph, costs, distances.edges()[:n, :n]
+
+
+def _save_matrix(path, distances, costs=None):
+    """Saves a parsed matrix, and the shortest path costs between its peaks it
+    was computed from, if given."""
+    names = list(distances)
+    edges = edge_array(distances, names)
+    arrays = {'names': np.array(names), 'edges': edges}
+    if costs is not None:
+        arrays['costs'] = costs
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(path + '.tmp', path)
+
+
+def _load_matrix(path):
+    """Returns (DistanceMatrix, shortest path costs or None)."""
+    with np.load(path) as data:
+        return (DistanceMatrix.from_edges([str(n) for n in data['names']],
+                                          data['edges']),
+                data['costs'] if 'costs' in data else None)
+
+
+def _write_atomically(path, content):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(content)
+    os.replace(path + '.tmp', path)
+
+
+class RouteCache(object):
+    """SQLite-backed cache of Gaia route responses.
+
+    Routes are keyed by start/end coordinates rounded to `precision` decimal
+    places and the costing options. Entries older than `ttl` seconds are
+    ignored, and the least recently used entries are evicted beyond
+    `max_entries`.
+    """
+    def __init__(self,
+                 path=os.path.join(DEFAULT_CACHE_DIR, 'routes.sqlite'),
+                 ttl=None,
+                 max_entries=None,
+                 precision=5):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.precision = precision
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS routes ('
+                         'key TEXT PRIMARY KEY, trip TEXT, '
+                         'created REAL, accessed REAL)')
+        self._db.commit()
+
+    def _key(self, start, end, costing):
+        return '{:.{p}f},{:.{p}f}>{:.{p}f},{:.{p}f}:{}'.format(
+            float(start['lat']),
+            float(start['long']),
+            float(end['lat']),
+            float(end['long']),
+            costing,
+            p=self.precision)
+
+    def get(self, start, end, costing=GAIA_COSTING_OPTIONS):
+        key = self._key(start, end, costing)
+        with self._lock:
+            row = self._db.execute(
+                'SELECT trip, created FROM routes WHERE key = ?',
+                (key, )).fetchone()
+            now = time.time()
+            if row is None or (self.ttl is not None
+                               and row[1] < now - self.ttl):
+                self.misses += 1
+                TRACER.count('route_cache_misses')
+                return None
+            self._db.execute('UPDATE routes SET accessed = ? WHERE key = ?',
+                             (now, key))
+            self._db.commit()
+            self.hits += 1
+        TRACER.count('route_cache_hits')
+        return json.loads(row[0])
+
+    def put(self, start, end, trip, costing=GAIA_COSTING_OPTIONS):
+        with self._lock:
+            self._put(start, end, trip, costing)
+
+    def _put(self, start, end, trip, costing):
+        now = time.time()
+        self._db.execute('INSERT OR REPLACE INTO routes VALUES (?, ?, ?, ?)',
+                         (self._key(start, end,
+                                    costing), json.dumps(trip), now, now))
+        if self.max_entries is not None:
+            self._db.execute(
+                'DELETE FROM routes WHERE key NOT IN (SELECT key FROM routes '
+                'ORDER BY accessed DESC, rowid DESC LIMIT ?)',
+                (self.max_entries, ))
+        self._db.commit()
+
+    def stats(self):
+        return 'Route cache: {} hits, {} misses'.format(
+            self.hits, self.misses)
+
+
+def add_route_cache_arguments(parser):
+    parser.add_argument('--route_cache',
+                        help='SQLite file caching Gaia route responses',
+                        default=os.path.join(DEFAULT_CACHE_DIR,
+                                             'routes.sqlite'),
+                        type=str)
+    parser.add_argument('--route_cache_ttl',
+                        help='Days before a cached route is refetched',
+                        type=float)
+    parser.add_argument('--route_cache_max_entries',
+                        help='Number of cached routes to keep',
+                        type=int)
+
+
+def route_cache_from_args(args):
+    return RouteCache(args.route_cache,
+                      ttl=None if args.route_cache_ttl is None else
+                      args.route_cache_ttl * 24 * 3600,
+                      max_entries=args.route_cache_max_entries)
+
+
+class RateLimiter(object):
+    """Spaces out calls to wait() to at most `rate` per second, across threads.
+    """
+    def __init__(self, rate):
+        self.interval = 1. / rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        time.sleep(slot - now)
+
+
+class Tracer(object):
+    """Timed spans, counters and sampled values, written as a Chrome trace
+    (viewable in chrome://tracing or ui.perfetto.dev).
+
+    Does nothing until started, so that calls can be left in hot paths.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.counters = {}
+        self._events = []
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.enabled = True
+
+    def _now(self):
+        return (time.perf_counter() - self._start) * 1e6
+
+    def _append(self, event):
+        event.update(pid=os.getpid(), tid=threading.get_ident())
+        with self._lock:
+            self._events.append(event)
+
+    def span(self, name, **args):
+        """Returns a context manager timing its block as `name`."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(name, args)
+
+    @contextlib.contextmanager
+    def _span(self, name, args):
+        start = self._now()
+        try:
+            yield
+        finally:
+            self._append({
+                'name': name,
+                'ph': 'X',
+                'ts': start,
+                'dur': self._now() - start,
+                'args': args
+            })
+
+    def count(self, name, value=1):
+        """Adds `value` to the counter `name`."""
+        if not self.enabled:
+            return
+        with self._lock:
+            total = self.counters[name] = self.counters.get(name, 0) + value
+        self.sample(name, **{name: total})
+
+    def sample(self, name, **values):
+        """Records `values` at the current time, plotted as a series."""
+        if not self.enabled:
+            return
+        self._append({
+            'name': name,
+            'ph': 'C',
+            'ts': self._now(),
+            'args': values
+        })
+
+    def write(self, path):
+        with self._lock:
+            trace = {
+                'traceEvents': list(self._events),
+                'otherData': dict(self.counters)
+            }
+        with open(path, 'w') as f:
+            json.dump(trace, f)
+
+
+_NULL_SPAN = contextlib.nullcontext()
+
+# The process-wide tracer the scripts record to.
+TRACER = Tracer()
+
+
+def add_trace_arguments(parser):
+    parser.add_argument(
+        '--trace',
+        help='Write a Chrome trace of stage timings and counters to this '
+        'JSON file',
+        type=str)
+
+
+def trace_from_args(args):
+    """Starts TRACER if --trace was passed, writing it out on exit."""
+    if args.trace is None:
+        return
+    if not TRACER.enabled:
+        TRACER.start()
+    atexit.register(TRACER.write, args.trace)
+
+
+def make_session(pool_size=10, retries=5, backoff_factor=0.5):
+    """Returns a pooled requests session retrying failed calls with backoff."""
+    # requests is imported on first use, so that offline runs start faster.
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size,
+                          pool_maxsize=pool_size,
+                          max_retries=Retry(
+                              total=retries,
+                              backoff_factor=backoff_factor,
+                              status_forcelist=(429, 500, 502, 503, 504),
+                              allowed_methods=None))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def gaia_route(start, end, cache=None, session=None, rate_limiter=None):
+    """Returns the Gaia trip between two {'lat', 'long'} coordinates."""
+    if cache is not None:
+        trip = cache.get(start, end)
+        if trip is not None:
+            return trip
+    if session is None:
+        import requests as session
+    if rate_limiter is not None:
+        rate_limiter.wait()
+    with TRACER.span('gaia_route'):
+        res = session.post(
+            GAIA_REQUEST_PATTERN.format(start_lon=start['long'],
+                                        start_lat=start['lat'],
+                                        end_lon=end['long'],
+                                        end_lat=end['lat']))
+    TRACER.count('http_requests')
+    res.raise_for_status()
+    trip = res.json()['trip']
+    if cache is not None:
+        cache.put(start, end, trip)
+    return trip
+
+
+def gaia_routes(legs,
+                cache=None,
+                workers=8,
+                rate=None,
+                router=None,
+                session=None):
+    """Fetches Gaia trips for a list of (start, end) legs concurrently.
+
+    Yields (leg index, trip) pairs in completion order, using at most `workers`
+    pooled connections (of `session`, if given) and `rate` requests per second.
+
+    A `router` function of (start, end), like TrailNetwork.route, is called
+    instead of the Gaia API if given. Its trips may be None where it has no
+    route.
+    """
+    if router is not None:
+        for (i, (start, end)) in enumerate(legs):
+            with TRACER.span('route_leg'):
+                trip = router(start, end)
+            yield i, trip
+        return
+    if session is None:
+        session = make_session(pool_size=workers)
+    rate_limiter = None if rate is None else RateLimiter(rate)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(gaia_route,
+                            start,
+                            end,
+                            cache=cache,
+                            session=session,
+                            rate_limiter=rate_limiter): i
+            for (i, (start, end)) in enumerate(legs)
+        }
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+class DistanceMatrix(Mapping):
+    """(distance, gain, loss) between named points, stored as three (n, n)
+    float arrays with NaN for missing distances.
+
+    Also reads like the dict of dicts it replaces: matrix[p1][p2] is a
+    (distance, gain, loss) tuple, or None for missing distances.
+    """
+    __slots__ = ('names', 'index', 'distance', 'gain', 'loss')
+
+    def __init__(self, names, distance, gain, loss):
+        self.names = list(names)
+        self.index = {p: i for (i, p) in enumerate(self.names)}
+        self.distance = np.ascontiguousarray(distance, dtype=float)
+        self.gain = np.ascontiguousarray(gain, dtype=float)
+        self.loss = np.ascontiguousarray(loss, dtype=float)
+
+    @classmethod
+    def from_edges(cls, names, edges):
+        """Builds a matrix from an (n, n, 3) array of edges."""
+        return cls(names, edges[:, :, 0], edges[:, :, 1], edges[:, :, 2])
+
+    def edges(self, names=None):
+        """Returns the (n, n, 3) array of edges between `names` (default: all).
+        """
+        edges = np.stack([self.distance, self.gain, self.loss], axis=-1)
+        if names is None:
+            return edges
+        indices = [self.index[p] for p in names]
+        return edges[np.ix_(indices, indices)]
+
+    def get_index(self, i, j):
+        if np.isnan(self.distance[i, j]):
+            return None
+        return (float(self.distance[i, j]), float(self.gain[i, j]),
+                float(self.loss[i, j]))
+
+    def __getitem__(self, name):
+        return _DistanceRow(self, self.index[name])
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+
+class SparseGraph(object):
+    """Directed edges between named points, with (distance, gain, loss) per
+    edge, in compressed sparse row form.
+
+    The edges out of node i are offsets[i]:offsets[i + 1] of `targets`,
+    `distance`, `gain` and `loss`, sorted by target. The edges into node i are
+    reverse_edges[reverse_offsets[i]:reverse_offsets[i + 1]], indexing the
+    same arrays, sorted by source. Memory scales with the number of edges.
+    """
+    def __init__(self, names, sources, targets, distance, gain, loss):
+        self.names = list(names)
+        self.index = {p: i for (i, p) in enumerate(self.names)}
+        n = len(self.names)
+        order = np.lexsort((targets, sources))
+        self.sources = np.asarray(sources, dtype=np.int64)[order]
+        self.targets = np.asarray(targets, dtype=np.int64)[order]
+        self.distance = np.asarray(distance, dtype=float)[order]
+        self.gain = np.asarray(gain, dtype=float)[order]
+        self.loss = np.asarray(loss, dtype=float)[order]
+        self.offsets = np.searchsorted(self.sources, np.arange(n + 1))
+        self.reverse_edges = np.lexsort((self.sources, self.targets))
+        self.reverse_offsets = np.searchsorted(
+            self.targets[self.reverse_edges], np.arange(n + 1))
+
+    @classmethod
+    def from_edges(cls, names, edges):
+        """Builds a graph from an (n, n, 3) array of edges, NaN where there
+        is none."""
+        (i, j) = np.nonzero(~np.isnan(edges[:, :, 0]))
+        return cls(names, i, j, *edges[i, j].T)
+
+    def successors(self, i):
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+    def predecessors(self, i):
+        return self.sources[self.reverse_edges[
+            self.reverse_offsets[i]:self.reverse_offsets[i + 1]]]
+
+    def edges(self):
+        """Returns the (n, n, 3) array of edges, NaN where there is none."""
+        n = len(self.names)
+        edges = np.full((n, n, 3), np.nan)
+        edges[self.sources, self.targets] = np.stack(
+            [self.distance, self.gain, self.loss], axis=-1)
+        return edges
+
+    def costs(self, edge_costs):
+        """Returns the (n, n) matrix of `edge_costs`, inf where there is no
+        edge."""
+        n = len(self.names)
+        costs = np.full((n, n), np.inf)
+        costs[self.sources, self.targets] = edge_costs
+        return costs
+
+    def shortest_paths(self, edge_costs):
+        """Dijkstra's algorithm from every node, with a cost per edge. Returns
+        (costs, edges, predecessors) like all_pairs_shortest_paths, in
+        O(n E log n) time for E edges."""
+        n = len(self.names)
+        (offsets, targets) = (self.offsets.tolist(), self.targets.tolist())
+        weights = np.asarray(edge_costs, dtype=float).tolist()
+        costs = np.full((n, n), np.inf)
+        # The edge into each node on its shortest path from each source.
+        via = np.full((n, n), -1, dtype=np.int64)
+        for source in range(n):
+            (distances, edges) = ([np.inf] * n, [-1] * n)
+            distances[source] = 0.
+            queue = [(0., source)]
+            while queue:
+                (d, u) = heapq.heappop(queue)
+                if d > distances[u]:
+                    continue
+                for k in range(offsets[u], offsets[u + 1]):
+                    v = targets[k]
+                    if d + weights[k] < distances[v]:
+                        distances[v] = d + weights[k]
+                        edges[v] = k
+                        heapq.heappush(queue, (distances[v], v))
+            costs[source] = distances
+            via[source] = edges
+
+        # Sums the edges along every path at once by pointer jumping: each
+        # round, `sums` extends to twice as many edges before each node, and
+        # `parents` to the node before them (the source, once reached).
+        rows = np.arange(n)[:, np.newaxis]
+        has_edge = via >= 0
+        # Padded, so that the -1s in `via` index something with no edges.
+        parents = np.where(has_edge, np.append(self.sources, 0)[via], rows)
+        values = np.stack([self.distance, self.gain, self.loss], axis=-1)
+        sums = np.where(has_edge[:, :, np.newaxis],
+                        np.vstack([values, np.zeros((1, 3))])[via], 0.)
+        predecessors = np.where(np.isfinite(costs), parents, -1)
+        while (parents != rows).any():
+            sums = sums + sums[rows, parents]
+            parents = parents[rows, parents]
+        sums[~np.isfinite(costs)] = np.nan
+        return costs, sums, predecessors
+
+
+class _DistanceRow(Mapping):
+    """The distances from one point of a DistanceMatrix."""
+    __slots__ = ('_matrix', '_i')
+
+    def __init__(self, matrix, i):
+        self._matrix = matrix
+        self._i = i
+
+    def __getitem__(self, name):
+        return self._matrix.get_index(self._i, self._matrix.index[name])
+
+    def __iter__(self):
+        return iter(self._matrix.names)
+
+    def __len__(self):
+        return len(self._matrix.names)
+
+    def __contains__(self, name):
+        return name in self._matrix.index
+
 
 def merge_pairwise_and_matrix_distances(pairs, matrix):
-    merged = defaultdict(dict)
-    for p1 in matrix:
-        for p2 in matrix[p1]:
-            if p1 == p2 or not is_peak(p1) or not is_peak(p2):
-                merged[p1][p2] = matrix[p1][p2]
-            else:
-                merged[p1][p2] = (min(pairs[p1][p2][0], matrix[p1][p2][0]),
-                                  matrix[p1][p2][1], matrix[p1][p2][2])
-    return merged
+    """Takes the shorter of the pairwise and matrix distances between peaks,
+    keeping gain/loss from the matrix."""
+    indices = np.array([pairs.index.get(p, -1) for p in matrix.names])
+    pair_distances = pairs.distance[indices][:, indices]
+    known = (indices >= 0)[:, np.newaxis] & (indices >= 0)[np.newaxis, :]
+    peaks = np.array([is_peak(p) for p in matrix.names])
+    mask = (known & peaks[:, np.newaxis] & peaks[np.newaxis, :]
+            & ~np.eye(len(matrix), dtype=bool) & ~np.isnan(pair_distances))
+    return DistanceMatrix(
+        matrix.names,
+        np.where(mask, np.minimum(pair_distances, matrix.distance),
+                 matrix.distance), matrix.gain, matrix.loss)
 
 
 def parse_distance_matrix_from_pairs(pair_reader):
-    distance_matrix = defaultdict(dict)
+    index = {}
+    pairs = []
     for row in pair_reader:
         # Convert from miles to kilometers
         distance = float(row[2]) * 0.621371
-        distance_matrix[row[0]][row[1]] = (distance, 0, 0)
-    return distance_matrix
+        pairs.append((index.setdefault(row[0], len(index)),
+                      index.setdefault(row[1], len(index)), distance))
+    distances = np.full((len(index), len(index)), np.nan)
+    gains = np.full((len(index), len(index)), np.nan)
+    for (i, j, distance) in pairs:
+        distances[i, j] = distance
+        gains[i, j] = 0
+    return DistanceMatrix(index, distances, gains, gains)
 
 
 def parse_distance_matrix(csv_reader, cost_function):
-    # Ignore last column for trailhead.
-    peaks = csv_reader.__next__()[1:-1]
-    distances = {p: {p: None for p in peaks} for p in peaks}
+    (peaks, graph, trailhead_distances) = _parse_sheet(csv_reader)
+    (_, edges, _) = graph.shortest_paths(_direct_costs(graph, cost_function))
+    return _add_trailhead(peaks, edges, trailhead_distances)
+
+
+def _parse_sheet(csv_reader):
+    """Returns (peaks, SparseGraph of the direct distances between them,
+    {peak: distance to the trailhead})."""
+    header = csv_reader.__next__()[1:]
+    rows = [row for row in csv_reader if is_peak(row[0])]
+    # The last column holds trailhead distances, unless the sheet doesn't have
+    # one (i.e. the last column is itself a peak).
+    has_trailhead = (header[-1] == _TRAILHEAD_NAME
+                     or header[-1] not in set(row[0] for row in rows))
+    peaks = header[:-1] if has_trailhead else header
+    index = {p: i for (i, p) in enumerate(peaks)}
+    edges = {}
     trailhead_distances = {p: None for p in peaks + [_TRAILHEAD_NAME]}
-    for row in csv_reader:
-        if not is_peak(row[0]):
-            continue
+    for row in rows:
         # Note: trailhead distances are read as Peak > Trailhead, but here
         # stored as Trailhead > Peak, so they need to be reversed below.
-        trailhead_distances[row[0]] = _parse_distance_gain_loss_string(row[-1])
-        i = 0
-        for d in row[1:-1]:
-            distances[row[0]][peaks[i]] = _parse_distance_gain_loss_string(d)
-            i += 1
+        if has_trailhead:
+            trailhead_distances[row[0]] = _parse_distance_gain_loss_string(
+                row[len(peaks) + 1])
+        for (j, d) in enumerate(row[1:len(peaks) + 1]):
+            if d:
+                d = _parse_distance_gain_loss_string(d)
+                if d is not None:
+                    edges[(index[row[0]], j)] = d
 
     # Add back distances
-    for p1 in distances:
-        for p2 in distances[p1]:
-            if distances[p1][p2] is not None and distances[p2][p1] is None:
-                distances[p2][p1] = (
-                    distances[p1][p2][0],
-                    distances[p1][p2][2],  # swap climb/desc
-                    distances[p1][p2][1])
-    # Build graph for shortest path computation
-    g = Graph()
-    for p1 in distances:
-        for p2 in distances[p1]:
-            g.add_edge(p1, p2, distances[p1][p2])
-
-    def internal_cost_function(_0, _1, x, _2):
-        return cost_function(x)
-
-    for p1 in distances:
-        for p2 in distances[p1]:
-            distances[p1][p2] = tuple(
-                sum(x) for x in zip(*find_path(
-                    g, p1, p2, cost_func=internal_cost_function).edges))
+    for ((i, j), (distance, gain, loss)) in list(edges.items()):
+        if (j, i) not in edges:
+            edges[(j, i)] = (distance, loss, gain)  # swap climb/desc
+    (pairs, values) = (np.array(list(edges), dtype=np.int64).reshape(-1, 2),
+                       np.array(list(edges.values())).reshape(-1, 3))
+    return peaks, SparseGraph(peaks, pairs[:, 0], pairs[:, 1],
+                              *values.T), trailhead_distances
 
+
+def _direct_costs(graph, cost_function):
+    """Returns the cost of each edge of a SparseGraph."""
+    return np.array([
+        cost_function((d, g, l))
+        for (d, g, l) in zip(graph.distance, graph.gain, graph.loss)
+    ],
+                    dtype=float)
+
+
+def _add_trailhead(peaks, edges, trailhead_distances):
     # Trailhead has to be added after shortest path computation to make sure
     # shortest parths don't go through the artificial trailhead.
-    distances[_TRAILHEAD_NAME] = {}
-    for p in trailhead_distances:
+    n = len(peaks)
+    edges = np.concatenate([edges, np.full((n, 1, 3), np.nan)], axis=1)
+    edges = np.concatenate([edges, np.full((1, n + 1, 3), np.nan)], axis=0)
+    for (i, p) in enumerate(peaks + [_TRAILHEAD_NAME]):
         d = trailhead_distances[p]
         if d is None:
             d = (1e9, 1e9, 1e9)
-        distances[_TRAILHEAD_NAME][p] = (d[0], d[2], d[1])
-        distances[p].update({_TRAILHEAD_NAME: (d[0], d[1], d[2])})
+        edges[n, i] = (d[0], d[2], d[1])
+        edges[i, n] = (d[0], d[1], d[2])
 
     # Add self distance
-    for p1 in distances:
-        distances[p1][p1] = (0, 0, 0)
-    return distances
+    edges[np.arange(n + 1), np.arange(n + 1)] = 0
+    return DistanceMatrix.from_edges(peaks + [_TRAILHEAD_NAME], edges)
+
+
+def all_pairs_shortest_paths(costs, edges):
+    """Shortest paths over an (n, n) cost matrix (inf for missing edges).
+
+    Carries the (distance, gain, loss) triples in `edges`, an (n, n, 3) array,
+    along the cost-minimizing paths. Returns (costs, edges, predecessors), where
+    predecessors[i, j] is the node preceding j on the path from i to j, or -1 if
+    there is no such path.
+    """
+    costs = np.asarray(costs, dtype=float)
+    (i, j) = np.nonzero(np.isfinite(costs))
+    graph = SparseGraph(range(len(costs)), i, j,
+                        *np.asarray(edges, dtype=float)[i, j].T)
+    return graph.shortest_paths(costs[i, j])
+
+
+def update_shortest_paths(costs, edges, old_direct_costs, old_direct_edges,
+                          direct_costs, direct_edges):
+    """Updates the output of all_pairs_shortest_paths for changed direct edges.
+
+    Sources whose shortest paths went through an edge that got more expensive
+    (or was removed) are recomputed with Dijkstra's algorithm; edges that got
+    cheaper (or were added) are then relaxed into every pair at once. Returns
+    (costs, edges, recomputed sources). Of several equally short paths, the
+    one kept may differ from a full recomputation.
+    """
+    costs = np.array(costs, dtype=float)
+    edges = np.array(edges, dtype=float)
+    changed = _changed_edges(old_direct_edges, direct_edges)
+    cheaper = changed & (direct_costs < old_direct_costs)
+    sources = np.zeros(len(costs), dtype=bool)
+    for (u, v) in zip(*np.nonzero(changed & ~cheaper)):
+        if np.isfinite(old_direct_costs[u, v]):
+            via = (costs[:, u, np.newaxis] + old_direct_costs[u, v] +
+                   costs[np.newaxis, v, :])
+            # Allows for rounding in the summed costs of non-integer costs.
+            uses_edge = (via <= costs) | np.isclose(via, costs)
+            sources |= (uses_edge & np.isfinite(via)).any(axis=1)
+    sources = np.nonzero(sources)[0]
+    for s in sources:
+        (costs[s], edges[s]) = _single_source_shortest_paths(
+            direct_costs, direct_edges, s)
+    for (u, v) in zip(*np.nonzero(cheaper)):
+        via = (costs[:, u, np.newaxis] + direct_costs[u, v] +
+               costs[np.newaxis, v, :])
+        better = via < costs
+        costs = np.where(better, via, costs)
+        edges = np.where(
+            better[:, :, np.newaxis], edges[:, u, np.newaxis, :] +
+            direct_edges[u, v] + edges[np.newaxis, v, :, :], edges)
+    return costs, edges, sources
+
+
+def _changed_edges(old_edges, edges):
+    """(n, n) mask of the direct edges that differ between two sheets."""
+    same = (old_edges == edges) | (np.isnan(old_edges) & np.isnan(edges))
+    return ~same.all(axis=2)
+
+
+def _single_source_shortest_paths(costs, edges, source):
+    """Dijkstra's algorithm over a dense (n, n) cost matrix. Returns the costs
+    and summed (distance, gain, loss) of the shortest paths from `source`."""
+    n = len(costs)
+    distances = np.full(n, np.inf)
+    distances[source] = 0
+    paths = np.zeros((n, 3))
+    done = np.zeros(n, dtype=bool)
+    for _ in range(n):
+        k = np.argmin(np.where(done, np.inf, distances))
+        if not np.isfinite(distances[k]):
+            break
+        done[k] = True
+        via = distances[k] + costs[k]
+        better = (via < distances) & ~done
+        distances[better] = via[better]
+        paths[better] = paths[k] + edges[k][better]
+    paths[~np.isfinite(distances)] = np.nan
+    return distances, paths
+
+
+def shortest_path(predecessors, i, j):
+    """Rebuilds the node path i > ... > j from a predecessor matrix."""
+    if predecessors[i, j] < 0:
+        return None
+    path = [j]
+    while j != i:
+        j = predecessors[i, j]
+        path.append(j)
+    return [int(p) for p in reversed(path)]
 
 
-def peaks_connected_to(peak, sparse):
-    peaks = []
-    for (k0, v0) in sparse.items():
-        for (k1, v1) in v0.items():
-            if k1 == peak and v1 is not None:
-                peaks.append(k0)
-    return peaks
+def _edge_tuple(e):
+    if np.isnan(e[0]):
+        return None
+    return tuple(float(x) for x in e)
+
+
+def peaks_connected_to(peak, graph):
+    """Returns the peaks with a direct edge to `peak` in a SparseGraph."""
+    return [graph.names[i] for i in graph.predecessors(graph.index[peak])]
 
 
 def is_peak(string):
@@ -135,13 +889,62 @@ def mixed_cost(x):
     return mileage_only_cost(x) + climbing_only_cost(x)
 
 
+def weighted_cost(mileage_weight, climbing_weight):
+    """Returns a cost function blending mileage_only_cost and
+    climbing_only_cost; weighted_cost(1, 1) is equivalent to mixed_cost."""
+    def cost(x):
+        return (int(mileage_weight * mileage_only_cost(x)) +
+                int(climbing_weight * climbing_only_cost(x)))
+
+    cost.__name__ = 'weighted_cost_{:g}_{:g}'.format(mileage_weight,
+                                                     climbing_weight)
+    cost.weights = (mileage_weight, climbing_weight)
+    return cost
+
+
+def edge_array(distances, names=None):
+    """Returns the (n, n, 3) array of (distance, gain, loss) between `names`
+    (default: all of them, in order), with NaN for missing distances."""
+    if isinstance(distances, DistanceMatrix):
+        return distances.edges(names)
+    if names is None:
+        names = list(distances)
+    edges = np.full((len(names), len(names), 3), np.nan)
+    for (i, p1) in enumerate(names):
+        row = distances[p1]
+        for (j, p2) in enumerate(names):
+            if row.get(p2) is not None:
+                edges[i, j] = row[p2]
+    return edges
+
+
+def cost_matrix(distances, cost_function, names=None):
+    """Compiles a cost function over a distance matrix into a dense int64
+    matrix, so solvers don't have to call it per arc.
+
+    mileage_only_cost, climbing_only_cost, mixed_cost and weighted_cost blends
+    are evaluated vectorized; other cost functions are called per element.
+    """
+    edges = edge_array(distances, names)
+    weights = _COST_WEIGHTS.get(cost_function,
+                                getattr(cost_function, 'weights', None))
+    if weights is None:
+        return np.array([[cost_function(_edge_tuple(e)) for e in row]
+                         for row in edges],
+                        dtype=np.int64)
+    missing = np.isnan(edges[:, :, 0])
+    edges = np.nan_to_num(edges)
+    # Truncate like int() in mileage_only_cost and climbing_only_cost.
+    mileage = np.where(missing, int(1e9), np.trunc(100 * edges[:, :, 0]))
+    climbing = np.where(missing, int(1e9), np.trunc(edges[:, :, 1]))
+    return (np.trunc(weights[0] * mileage) +
+            np.trunc(weights[1] * climbing)).astype(np.int64)
+
+
 def _parse_distance_gain_loss_string(s):
     if s == '':
         return None
-    pat = re.compile(
-        'Distance: (?P<distance>[^ ]*) mi\\n\+(?P<gain>[^ ]*) ft / -(?P<loss>[^ ]*) ft'
-    )
-    res = pat.search(s)
+    res = _DISTANCE_GAIN_LOSS_PATTERN.search(s)
     assert res is not None, 'String ({}) does not match expected distance pattern'.format(
         s)
     return (_stof(res.group('distance')), _stof(res.group('gain')),
@@ -152,6 +955,12 @@ def _stof(s):
     return float(s.replace(',', ''))
 
 
+_COST_WEIGHTS = {
+    mileage_only_cost: (1, 0),
+    climbing_only_cost: (0, 1),
+    mixed_cost: (1, 1),
+}
+
 DEFAULT_COST = mixed_cost
 
 if __name__ == '__main__':
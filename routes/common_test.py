@@ -15,7 +15,18 @@ Dev command:
 import unittest
 import common
 import csv
+import json
 import re
+import shutil
+import tempfile
+import threading
+import time
+import numpy as np
+import os
+
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
 
 SPARSE_DISTANCE_CSV_STRING = """,p1,p2,p3
 p1,,"Distance: 1.0 mi\n+1,000 ft / -100 ft",
@@ -52,5 +63,446 @@ class TestParseDistanceMatrix(unittest.TestCase):
         self.assertEqual(self.distance['p3']['p1'], (3.0, 300.0, 3000.0))
 
 
+class TestDistanceMatrix(unittest.TestCase):
+    def setUp(self):
+        self.matrix = common.DistanceMatrix.from_edges(
+            ['p1', 'p2', 'Trailhead'],
+            np.array([
+                [(0, 0, 0), (2.0, 10, 20), (1.0, 1, 2)],
+                [(2.0, 20, 10), (0, 0, 0), (np.nan, np.nan, np.nan)],
+                [(1.0, 2, 1), (3.0, 5, 6), (0, 0, 0)],
+            ]))
+
+    def test_mapping_view(self):
+        self.assertEqual(list(self.matrix.keys()), ['p1', 'p2', 'Trailhead'])
+        self.assertEqual(self.matrix['p1']['p2'], (2.0, 10.0, 20.0))
+        self.assertIsNone(self.matrix['p2']['Trailhead'])
+        self.assertEqual(self.matrix['p2'].get('p3'), None)
+        self.assertIn('p2', self.matrix['p1'])
+        with self.assertRaises(KeyError):
+            self.matrix['p3']
+
+    def test_merge_pairwise(self):
+        pairs = common.parse_distance_matrix_from_pairs([
+            ['p2', 'p1', '1.609344'],
+            ['p1', 'p2', '16.09344'],
+            ['p1', 'Trailhead', '0'],
+        ])
+        merged = common.merge_pairwise_and_matrix_distances(
+            pairs, self.matrix)
+        self.assertAlmostEqual(merged['p2']['p1'][0], 1.0, places=5)
+        self.assertEqual(merged['p2']['p1'][1:], (20.0, 10.0))
+        self.assertEqual(merged['p1']['p2'], (2.0, 10.0, 20.0))
+        # Trailhead distances aren't merged.
+        self.assertEqual(merged['p1']['Trailhead'], (1.0, 1.0, 2.0))
+
+
+class TestCostMatrix(unittest.TestCase):
+    DISTANCES = {
+        'p1': {
+            'p1': (0, 0, 0),
+            'p2': (1.234, 1000.7, 100.0)
+        },
+        'p2': {
+            'p1': (1.234, 100.0, 1000.7),
+            'p2': (0, 0, 0)
+        },
+        'p3': {
+            'p1': None,
+            'p3': (0, 0, 0)
+        },
+    }
+
+    def test_matches_cost_functions(self):
+        names = ['p1', 'p2', 'p3']
+        for cost_function in (common.mileage_only_cost,
+                              common.climbing_only_cost, common.mixed_cost,
+                              common.weighted_cost(0.5, 2), lambda x: 7):
+            expected = [[
+                cost_function(self.DISTANCES[p1].get(p2)) for p2 in names
+            ] for p1 in names]
+            costs = common.cost_matrix(self.DISTANCES, cost_function)
+            self.assertEqual(costs.dtype, np.int64)
+            self.assertEqual(costs.tolist(), expected)
+
+
+class TestAllPairsShortestPaths(unittest.TestCase):
+    def setUp(self):
+        inf = np.inf
+        self.costs = np.array([[0, 1, 5], [inf, 0, 1], [inf, inf, 0]])
+        edges = np.zeros((3, 3, 3))
+        edges[0, 1] = (1.0, 10.0, 1.0)
+        edges[1, 2] = (1.0, 20.0, 2.0)
+        edges[0, 2] = (5.0, 0.0, 0.0)
+        (self.costs, self.edges,
+         self.predecessors) = common.all_pairs_shortest_paths(
+             self.costs, edges)
+
+    def test_carries_edge_attributes(self):
+        self.assertEqual(self.costs[0, 2], 2)
+        self.assertEqual(tuple(self.edges[0, 2]), (2.0, 30.0, 3.0))
+
+    def test_shortest_path(self):
+        self.assertEqual(common.shortest_path(self.predecessors, 0, 2),
+                         [0, 1, 2])
+        self.assertEqual(common.shortest_path(self.predecessors, 1, 1), [1])
+        self.assertIsNone(common.shortest_path(self.predecessors, 2, 0))
+
+
+class TestSparseGraph(unittest.TestCase):
+    def setUp(self):
+        (_, self.graph, _) = common._parse_sheet(
+            csv.reader(StringIO(SPARSE_DISTANCE_CSV_STRING)))
+
+    def test_adjacency(self):
+        self.assertEqual(len(self.graph.targets), 4)
+        self.assertEqual(self.graph.successors(1).tolist(), [0, 2])
+        self.assertEqual(self.graph.predecessors(0).tolist(), [1])
+        self.assertEqual(common.peaks_connected_to('p2', self.graph),
+                         ['p1', 'p3'])
+
+    def test_edges_round_trip(self):
+        edges = self.graph.edges()
+        self.assertEqual(tuple(edges[2, 1]), (2.0, 200.0, 2000.0))
+        self.assertTrue(np.isnan(edges[0, 2]).all())
+        graph = common.SparseGraph.from_edges(self.graph.names, edges)
+        for field in ('sources', 'targets', 'distance', 'gain', 'loss'):
+            np.testing.assert_array_equal(getattr(graph, field),
+                                          getattr(self.graph, field))
+
+    def test_no_edges(self):
+        graph = common.SparseGraph(['a', 'b'], [], [], [], [], [])
+        (costs, paths, predecessors) = graph.shortest_paths([])
+        self.assertEqual(costs.tolist(), [[0, np.inf], [np.inf, 0]])
+        self.assertEqual(paths[0, 0].tolist(), [0, 0, 0])
+        self.assertTrue(np.isnan(paths[0, 1]).all())
+        self.assertEqual(predecessors.tolist(), [[0, -1], [-1, 1]])
+        (costs, _, _) = common.all_pairs_shortest_paths(
+            np.full((2, 2), np.inf), np.full((2, 2, 3), np.nan))
+        self.assertEqual(costs.tolist(), [[0, np.inf], [np.inf, 0]])
+
+    def test_matches_dense_shortest_paths(self):
+        rng = np.random.RandomState(46)
+        n = 12
+        edges = rng.uniform(1, 10, (n, n, 3))
+        edges[rng.uniform(size=(n, n)) < 0.8] = np.nan
+        graph = common.SparseGraph.from_edges(range(n), edges)
+        (costs, paths,
+         predecessors) = graph.shortest_paths(graph.distance + graph.gain)
+
+        # Floyd-Warshall
+        expected = np.where(np.isnan(edges[:, :, 0]), np.inf,
+                            edges[:, :, 0] + edges[:, :, 1])
+        np.fill_diagonal(expected, 0)
+        for k in range(n):
+            expected = np.minimum(expected,
+                                  expected[:, k, None] + expected[None, k, :])
+        np.testing.assert_allclose(costs, expected)
+        np.testing.assert_allclose(paths[:, :, 0] + paths[:, :, 1],
+                                   np.where(np.isfinite(expected), expected,
+                                            np.nan))
+        for (i, j) in zip(*np.nonzero(np.isfinite(expected))):
+            path = common.shortest_path(predecessors, i, j)
+            self.assertAlmostEqual(
+                sum(costs[a, b] for (a, b) in zip(path, path[1:])),
+                costs[i, j])
+
+
+class TestUpdateShortestPaths(unittest.TestCase):
+    def _random_graph(self, rng, n):
+        edges = rng.uniform(1, 10, (n, n, 3))
+        edges[rng.uniform(size=(n, n)) < 0.7] = np.nan
+        return edges
+
+    def _direct_costs(self, edges):
+        return np.where(np.isnan(edges[:, :, 0]), np.inf, edges[:, :, 0])
+
+    def test_matches_full_recomputation(self):
+        rng = np.random.RandomState(46)
+        for _ in range(20):
+            edges = self._random_graph(rng, 12)
+            new_edges = edges.copy()
+            for (i, j) in rng.randint(0, 12, (3, 2)):
+                # Lengthen, remove or shorten/add an edge.
+                new_edges[i, j] = [
+                    edges[i, j] * 3, np.nan,
+                    rng.uniform(0.1, 1, 3)
+                ][rng.randint(3)]
+            (costs, paths, _) = common.all_pairs_shortest_paths(
+                self._direct_costs(edges), edges)
+            (expected_costs, expected_paths,
+             _) = common.all_pairs_shortest_paths(
+                 self._direct_costs(new_edges), new_edges)
+            (updated_costs, updated_paths,
+             _) = common.update_shortest_paths(
+                 costs, paths, self._direct_costs(edges), edges,
+                 self._direct_costs(new_edges), new_edges)
+            np.testing.assert_allclose(updated_costs, expected_costs)
+            np.testing.assert_allclose(updated_paths, expected_paths)
+
+    def test_only_recomputes_affected_sources(self):
+        inf = np.inf
+        edges = np.full((3, 3, 3), np.nan)
+        edges[0, 1] = edges[1, 2] = edges[2, 0] = (1.0, 0.0, 0.0)
+        costs = self._direct_costs(edges)
+        (apsp_costs, paths, _) = common.all_pairs_shortest_paths(costs, edges)
+        new_edges = edges.copy()
+        new_edges[0, 1] = (2.0, 0.0, 0.0)
+        (_, _, sources) = common.update_shortest_paths(
+            apsp_costs, paths, costs, edges, self._direct_costs(new_edges),
+            new_edges)
+        # 1 > 2 > 0 doesn't use 0 > 1, but 0 > 1 and 2 > 0 > 1 do.
+        self.assertEqual(list(sources), [0, 2])
+
+
+class _SheetHandler(BaseHTTPRequestHandler):
+    requests = []
+    etag = '"v1"'
+    content = SPARSE_DISTANCE_CSV_STRING
+
+    def do_GET(self):
+        _SheetHandler.requests.append(self.headers.get('If-None-Match'))
+        if self.headers.get('If-None-Match') == _SheetHandler.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        content = _SheetHandler.content.encode('utf-8')
+        self.send_response(200)
+        self.send_header('ETag', _SheetHandler.etag)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestLoadDistanceMatrix(unittest.TestCase):
+    def setUp(self):
+        _SheetHandler.requests = []
+        _SheetHandler.etag = '"v1"'
+        _SheetHandler.content = SPARSE_DISTANCE_CSV_STRING
+        self.server = HTTPServer(('127.0.0.1', 0), _SheetHandler)
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.url = 'http://127.0.0.1:{}/sheet.csv'.format(
+            self.server.server_port)
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir)
+
+    def _load(self, **kwargs):
+        return common.load_distance_matrix(self.url,
+                                           common.mileage_only_cost,
+                                           cache_dir=self.cache_dir,
+                                           **kwargs)
+
+    def test_revalidates_cached_sheet(self):
+        cold = self._load()
+        warm = self._load()
+        self.assertEqual(_SheetHandler.requests, [None, '"v1"'])
+        self.assertEqual(cold, warm)
+        self.assertEqual(warm['p1']['p3'], (3.0, 3000.0, 300.0))
+
+    def test_offline(self):
+        cold = self._load()
+        self.server.shutdown()
+        self.assertEqual(self._load(offline=True), cold)
+        self.assertEqual(len(_SheetHandler.requests), 1)
+
+    def test_offline_without_cache(self):
+        with self.assertRaises(AssertionError):
+            self._load(offline=True)
+
+    def test_updates_changed_sheet_incrementally(self):
+        self._load()
+        _SheetHandler.etag = '"v2"'
+        _SheetHandler.content = SPARSE_DISTANCE_CSV_STRING.replace(
+            '2.0 mi', '0.5 mi')
+        with mock.patch.object(common.SparseGraph,
+                               'shortest_paths') as full:
+            updated = self._load()
+        full.assert_not_called()
+        self.assertEqual(updated['p1']['p3'], (1.5, 3000.0, 300.0))
+        self.assertEqual(
+            updated,
+            common.parse_distance_matrix(
+                csv.reader(StringIO(_SheetHandler.content)),
+                common.mileage_only_cost))
+
+
+class TestRouteCache(unittest.TestCase):
+    START = {'lat': ' 44.387191', 'long': ' -73.889839'}
+    END = {'lat': '44.365795', 'long': '-73.903219'}
+    TRIP = {'summary': {'length': 3.989}, 'legs': [{'shape': 'abc'}]}
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.cache_dir, 'routes.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_hit_and_miss(self):
+        cache = common.RouteCache(self.path)
+        self.assertIsNone(cache.get(self.START, self.END))
+        cache.put(self.START, self.END, self.TRIP)
+        # Keys are rounded, so nearby coordinates share an entry.
+        self.assertEqual(
+            common.RouteCache(self.path).get(
+                {'lat': 44.3871912, 'long': -73.8898391}, self.END),
+            self.TRIP)
+        self.assertIsNone(cache.get(self.END, self.START))
+        self.assertIsNone(cache.get(self.START, self.END, costing='auto'))
+        self.assertEqual((cache.hits, cache.misses), (0, 3))
+
+    def test_ttl(self):
+        cache = common.RouteCache(self.path, ttl=60)
+        cache.put(self.START, self.END, self.TRIP)
+        self.assertEqual(cache.get(self.START, self.END), self.TRIP)
+        with mock.patch('common.time.time', return_value=time.time() + 61):
+            self.assertIsNone(cache.get(self.START, self.END))
+
+    def test_max_entries(self):
+        cache = common.RouteCache(self.path, max_entries=1)
+        cache.put(self.START, self.END, self.TRIP)
+        cache.put(self.END, self.START, self.TRIP)
+        self.assertIsNone(cache.get(self.START, self.END))
+        self.assertEqual(cache.get(self.END, self.START), self.TRIP)
+
+
+class _RoutingHandler(BaseHTTPRequestHandler):
+    requests = []
+    failures = 0
+
+    def do_POST(self):
+        _RoutingHandler.requests.append(self.path)
+        if _RoutingHandler.failures > 0:
+            _RoutingHandler.failures -= 1
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        content = json.dumps({
+            'trip': {
+                'summary': {
+                    'length': len(_RoutingHandler.requests)
+                }
+            }
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestGaiaRoutes(unittest.TestCase):
+    def setUp(self):
+        _RoutingHandler.requests = []
+        _RoutingHandler.failures = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _RoutingHandler)
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.pattern = mock.patch(
+            'common.GAIA_REQUEST_PATTERN',
+            'http://127.0.0.1:{}/route?'.format(self.server.server_port) +
+            common.GAIA_REQUEST_PATTERN.split('?', 1)[1])
+        self.pattern.start()
+        self.legs = [({
+            'lat': 44,
+            'long': -74 + i
+        }, {
+            'lat': 45,
+            'long': -74
+        }) for i in range(10)]
+
+    def tearDown(self):
+        self.pattern.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fetches_all_legs(self):
+        trips = dict(common.gaia_routes(self.legs, workers=4))
+        self.assertEqual(sorted(trips), list(range(10)))
+        self.assertEqual(len(_RoutingHandler.requests), 10)
+
+    def test_retries_failures(self):
+        _RoutingHandler.failures = 2
+        make_session = common.make_session
+        with mock.patch('common.make_session',
+                        lambda pool_size: make_session(pool_size,
+                                                       backoff_factor=0)):
+            trips = dict(common.gaia_routes(self.legs[:1]))
+        self.assertEqual(trips[0]['summary']['length'], 3)
+
+    def test_serves_cached_legs(self):
+        cache_dir = tempfile.mkdtemp()
+        cache = common.RouteCache(os.path.join(cache_dir, 'routes.sqlite'))
+        list(common.gaia_routes(self.legs, cache=cache))
+        list(common.gaia_routes(self.legs, cache=cache))
+        shutil.rmtree(cache_dir)
+        self.assertEqual(len(_RoutingHandler.requests), 10)
+        self.assertEqual((cache.hits, cache.misses), (10, 10))
+
+    def test_router(self):
+        trips = dict(
+            common.gaia_routes(self.legs,
+                               router=lambda start, end: {
+                                   'summary': {
+                                       'length': start['long']
+                                   }
+                               }))
+        self.assertEqual(trips[3]['summary']['length'], -71)
+        self.assertEqual(_RoutingHandler.requests, [])
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_spaces_calls(self):
+        limiter = common.RateLimiter(100)
+        start = time.monotonic()
+        for _ in range(6):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+
+class TestTracer(unittest.TestCase):
+    def test_disabled(self):
+        tracer = common.Tracer()
+        with tracer.span('stage'):
+            tracer.count('requests')
+        tracer.sample('objective', objective=1)
+        self.assertEqual((tracer._events, tracer.counters), ([], {}))
+
+    def test_writes_chrome_trace(self):
+        tracer = common.Tracer()
+        tracer.start()
+        with tracer.span('stage', nodes=3):
+            tracer.count('requests')
+            tracer.count('requests', 2)
+            tracer.sample('objective', objective=10)
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'trace.json')
+            tracer.write(path)
+            with open(path) as f:
+                trace = json.load(f)
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(trace['otherData'], {'requests': 3})
+        events = trace['traceEvents']
+        self.assertEqual([(e['name'], e['ph']) for e in events],
+                         [('requests', 'C'), ('requests', 'C'),
+                          ('objective', 'C'), ('stage', 'X')])
+        self.assertEqual(events[1]['args'], {'requests': 3})
+        self.assertEqual(events[3]['args'], {'nodes': 3})
+        self.assertGreaterEqual(events[3]['dur'], 0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,176 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Reads and writes GPX tracks as column arrays (lat, lon, ele, time).
+
+Files are parsed with a streaming reader that discards each trackpoint
+element once read, so memory only grows with the output arrays. Handles both
+the Garmin variant (<time> per point) and the AllTrails variant (<ele> per
+point); missing values are NaN. Times are seconds since the epoch (UTC).
+
+Dev command:
+    python3 routes/gpx.py routes/2020-fkt-part-2.gpx
+"""
+
+from __future__ import print_function
+import os
+import sys
+import argparse
+import calendar
+import datetime
+import math
+import re
+import xml.etree.ElementTree as ET
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+# segments holds the index of the first point of each <trkseg>.
+Track = namedtuple('Track', ['lat', 'lon', 'ele', 'time', 'segments'])
+
+# Also accepts the "00:00:00:000Z" millisecond separator used by some of our
+# generated files, and naive times (assumed UTC).
+_TIME_PATTERN = re.compile(
+    r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:[.:](\d+))?'
+    r'(Z|[+-]\d\d:?\d\d)?')
+
+GPX_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<gpx creator="fkt-attempt-46ers" version="1.1"
+  xsi:schemaLocation="http://www.topografix.com/GPX/1/1 http://www.topografix.com/GPX/11.xsd"
+  xmlns="http://www.topografix.com/GPX/1/1"
+  xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+  <trk>
+    <name>{name}</name>
+"""
+
+GPX_FOOTER = """  </trk>
+</gpx>
+"""
+
+
+def iter_trackpoints(source):
+    """Yields (segment start, lat, lon, ele, time) for each trackpoint.
+
+    `segment start` is True for the first point of each <trkseg>.
+    """
+    segment = None
+    segment_start = False
+    ele = time = np.nan
+    for (event, elem) in ET.iterparse(source, events=('start', 'end')):
+        tag = elem.tag.rsplit('}', 1)[-1]
+        if event == 'start':
+            if tag == 'trkseg':
+                segment = elem
+                segment_start = True
+            continue
+        if segment is None:
+            continue
+        if tag == 'ele':
+            ele = float(elem.text)
+        elif tag == 'time':
+            time = _parse_time(elem.text)
+        elif tag == 'trkpt':
+            yield (segment_start, float(elem.get('lat')),
+                   float(elem.get('lon')), ele, time)
+            segment_start = False
+            ele = time = np.nan
+            elem.clear()
+            segment.remove(elem)
+        elif tag == 'trkseg':
+            segment = None
+
+
+def read_track(source):
+    """Reads all trackpoints of a GPX file (path or file object) into a Track.
+    """
+    columns = [array('d') for _ in range(4)]
+    segments = array('q')
+    for (i, (segment_start, lat, lon, ele,
+             time)) in enumerate(iter_trackpoints(source)):
+        if segment_start:
+            segments.append(i)
+        columns[0].append(lat)
+        columns[1].append(lon)
+        columns[2].append(ele)
+        columns[3].append(time)
+    return Track(*[np.frombuffer(c, dtype=np.float64) for c in columns],
+                 segments=np.frombuffer(segments, dtype=np.int64))
+
+
+def write_track(out, track, name='46er FKT attempt', chunk_size=4096):
+    """Writes a Track as GPX to the file object `out`.
+
+    Trackpoints are formatted and written `chunk_size` at a time.
+    """
+    out.write(GPX_HEADER.format(name=name))
+    lat = track.lat.tolist()
+    lon = track.lon.tolist()
+    ele = [
+        '' if math.isnan(e) else '        <ele>{!r}</ele>\n'.format(e)
+        for e in track.ele.tolist()
+    ]
+    # Generated tracks share timestamps between many points.
+    times = {
+        t: '        <time>{}</time>\n'.format(format_time(t))
+        for t in set(track.time.tolist()) if not math.isnan(t)
+    }
+    time = [times.get(t, '') for t in track.time.tolist()]
+    bounds = list(track.segments) + [len(lat)]
+    for (start, end) in zip(bounds, bounds[1:]):
+        out.write('    <trkseg>\n')
+        for chunk in range(start, end, chunk_size):
+            out.write(''.join(
+                '      <trkpt lat="{!r}" lon="{!r}">\n{}{}      </trkpt>\n'.
+                format(lat[i], lon[i], ele[i], time[i])
+                for i in range(chunk, min(chunk + chunk_size, end))))
+        out.write('    </trkseg>\n')
+    out.write(GPX_FOOTER)
+
+
+def format_time(t):
+    """Formats epoch seconds as an ISO 8601 UTC time."""
+    return datetime.datetime.fromtimestamp(
+        t, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def _parse_time(s):
+    res = _TIME_PATTERN.match(s.strip())
+    assert res is not None, 'Unexpected time format: {}'.format(s)
+    (year, month, day, hour, minute, second, fraction,
+     zone) = res.groups()
+    t = calendar.timegm((int(year), int(month), int(day), int(hour),
+                         int(minute), int(second)))
+    if fraction is not None:
+        t += float('0.' + fraction)
+    if zone is not None and zone != 'Z':
+        offset = int(zone[1:3]) * 3600 + int(zone[-2:]) * 60
+        t -= offset if zone[0] == '+' else -offset
+    return t
+
+
+def main(arguments):
+
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('infiles', help="GPX files", nargs='+', type=str)
+
+    args = parser.parse_args(arguments)
+
+    for filename in args.infiles:
+        track = read_track(filename)
+        print('{}: {} points in {} segments, lat {:.5f}..{:.5f}, '
+              'lon {:.5f}..{:.5f}'.format(filename, len(track.lat),
+                                          len(track.segments),
+                                          track.lat.min(), track.lat.max(),
+                                          track.lon.min(), track.lon.max()))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
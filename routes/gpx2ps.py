@@ -0,0 +1,167 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Derives the peak sequence of recorded GPX tracks: the summits passed within a
+radius, in the order they were first reached.
+
+Prints the sequence to stdout, in the format read by ps2d.py and ps2gpx.py,
+and the time and distance of each summit visit to stderr. Tracks are read in
+the order given.
+
+Dev command:
+    python3 routes/gpx2ps.py -c summits/coordinates.csv routes/2019-fkt-part-*.gpx
+"""
+
+from __future__ import print_function
+import os
+import sys
+import argparse
+
+import numpy as np
+
+import common
+import gpx
+import track_store
+
+EARTH_RADIUS_METERS = 6371008.8
+
+
+class SummitIndex(object):
+    """Grid index over summit coordinates, with cells as wide as the search
+    radius, so that points are only compared against summits in their own and
+    adjacent cells."""
+    def __init__(self, names, lat, lon, radius):
+        self.names = list(names)
+        self.radius = radius
+        self._lat0 = np.radians(np.mean(lat))
+        (self._x, self._y) = self._project(np.asarray(lat, dtype=float),
+                                           np.asarray(lon, dtype=float))
+        # Each cell maps to the summits in the 3x3 block of cells around it.
+        self._cells = {}
+        for (i, (cx, cy)) in enumerate(zip(*self._cell(self._x, self._y))):
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    self._cells.setdefault((cx + dx, cy + dy), []).append(i)
+
+    def _project(self, lat, lon):
+        # Equirectangular projection to meters, accurate enough at this scale.
+        return (np.radians(lon) * EARTH_RADIUS_METERS * np.cos(self._lat0),
+                np.radians(lat) * EARTH_RADIUS_METERS)
+
+    def _cell(self, x, y):
+        return (np.floor(x / self.radius).astype(np.int64),
+                np.floor(y / self.radius).astype(np.int64))
+
+    def query(self, lat, lon):
+        """Returns (index of the nearest summit within the radius of each
+        point, or -1, distance to it in meters)."""
+        (x, y) = self._project(np.asarray(lat, dtype=float),
+                               np.asarray(lon, dtype=float))
+        nearest = np.full(len(x), -1, dtype=np.int64)
+        distances = np.full(len(x), np.inf)
+        (cells, inverse) = np.unique(np.stack(self._cell(x, y), axis=1),
+                                     axis=0,
+                                     return_inverse=True)
+        inverse = inverse.reshape(-1)
+        for (cell, summits) in ((i, self._cells.get(tuple(c)))
+                                for (i, c) in enumerate(cells)):
+            if summits is None:
+                continue
+            points = np.nonzero(inverse == cell)[0]
+            d = np.hypot(x[points, np.newaxis] - self._x[summits],
+                         y[points, np.newaxis] - self._y[summits])
+            closest = np.argmin(d, axis=1)
+            d = d[np.arange(len(points)), closest]
+            within = d <= self.radius
+            nearest[points[within]] = np.array(summits)[closest[within]]
+            distances[points[within]] = d[within]
+        return nearest, distances
+
+
+def summit_visits(track, index):
+    """Returns (summit, time, distance in meters) of each visit to a summit in
+    a gpx.Track, in order. A visit is a run of consecutive points nearest to
+    the same summit, timed at its closest point."""
+    (nearest, distances) = index.query(track.lat, track.lon)
+    within = np.nonzero(nearest >= 0)[0]
+    if len(within) == 0:
+        return []
+    breaks = np.nonzero((np.diff(within) != 1)
+                        | (np.diff(nearest[within]) != 0))[0] + 1
+    visits = []
+    for run in np.split(within, breaks):
+        closest = run[np.argmin(distances[run])]
+        visits.append((index.names[nearest[closest]], track.time[closest],
+                       distances[closest]))
+    return visits
+
+
+def peak_sequence(visits):
+    """Returns the visits to each summit that are its first, in order."""
+    seen = set()
+    first_visits = []
+    for visit in visits:
+        if visit[0] not in seen:
+            seen.add(visit[0])
+            first_visits.append(visit)
+    return first_visits
+
+
+def main(arguments):
+
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('infiles', help="GPX files", nargs='+', type=str)
+    parser.add_argument('-c',
+                        '--coordinates',
+                        help="Coordinates of peaks",
+                        type=argparse.FileType('r'))
+    parser.add_argument('-r',
+                        '--radius',
+                        help='Distance in meters within which a summit counts '
+                        'as visited',
+                        default=100.,
+                        type=float)
+    parser.add_argument('--store_dir',
+                        help='Directory of converted tracks',
+                        default=track_store.DEFAULT_STORE_DIR,
+                        type=str)
+
+    args = parser.parse_args(arguments)
+
+    peaks_to_lat_long = dict(
+        common.line_to_peak_lat_long(i)
+        for i in args.coordinates.readlines()[1:])
+    index = SummitIndex(
+        peaks_to_lat_long,
+        [float(c['lat']) for c in peaks_to_lat_long.values()],
+        [float(c['long']) for c in peaks_to_lat_long.values()], args.radius)
+
+    visits = []
+    for filename in args.infiles:
+        visits.extend(
+            summit_visits(track_store.load_track(filename, args.store_dir),
+                          index))
+    sequence = peak_sequence(visits)
+    for (peak, t, distance) in sequence:
+        print(peak)
+        print('{:<24}  {:<25} ({:.0f} m)'.format(
+            gpx.format_time(t) if not np.isnan(t) else '-', peak, distance),
+              file=sys.stderr)
+    missing = [p for p in peaks_to_lat_long if p not in set(
+        v[0] for v in sequence)]
+    print('Visited {} of {} summits'.format(len(sequence),
+                                            len(peaks_to_lat_long)),
+          file=sys.stderr)
+    if missing:
+        print('Not visited: {}'.format(', '.join(missing)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
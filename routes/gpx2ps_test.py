@@ -0,0 +1,59 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Tests for gpx2ps.py.
+"""
+
+import unittest
+import gpx
+import gpx2ps
+import numpy as np
+
+# Esther Mountain, Whiteface Mountain and Mount Marcy.
+NAMES = ['Esther', 'Whiteface', 'Marcy']
+LAT = [44.387191, 44.365795, 44.112739]
+LON = [-73.889839, -73.903219, -73.923807]
+
+
+class TestSummitIndex(unittest.TestCase):
+    def test_matches_brute_force(self):
+        index = gpx2ps.SummitIndex(NAMES, LAT, LON, 500)
+        rng = np.random.RandomState(46)
+        lat = np.concatenate(
+            [l + rng.normal(0, 0.005, 200) for l in LAT])
+        lon = np.concatenate(
+            [l + rng.normal(0, 0.005, 200) for l in LON])
+        (nearest, distances) = index.query(lat, lon)
+        (x, y) = index._project(lat, lon)
+        (sx, sy) = index._project(np.array(LAT), np.array(LON))
+        d = np.hypot(x[:, np.newaxis] - sx, y[:, np.newaxis] - sy)
+        expected = np.where(d.min(axis=1) <= 500, d.argmin(axis=1), -1)
+        self.assertEqual(list(nearest), list(expected))
+        self.assertTrue(0 < (nearest >= 0).sum() < len(lat))
+        np.testing.assert_allclose(distances[nearest >= 0],
+                                   d.min(axis=1)[nearest >= 0])
+
+
+class TestSummitVisits(unittest.TestCase):
+    def test_visits_in_order(self):
+        index = gpx2ps.SummitIndex(NAMES, LAT, LON, 100)
+        # Esther, Whiteface, back over Esther, then Marcy.
+        lat = np.array([44.38, LAT[0], 44.37, LAT[1], LAT[0], 44.2, LAT[2]])
+        lon = np.array([-73.88, LON[0], -73.9, LON[1], LON[0], -73.9, LON[2]])
+        track = gpx.Track(lat, lon, np.full(7, np.nan),
+                          np.arange(7, dtype=float), np.array([0]))
+        visits = gpx2ps.summit_visits(track, index)
+        self.assertEqual([(v[0], v[1]) for v in visits],
+                         [('Esther', 1.), ('Whiteface', 3.), ('Esther', 4.),
+                          ('Marcy', 6.)])
+        self.assertEqual([v[0] for v in gpx2ps.peak_sequence(visits)],
+                         ['Esther', 'Whiteface', 'Marcy'])
+
+
+if __name__ == '__main__':
+    unittest.main()
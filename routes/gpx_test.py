@@ -0,0 +1,98 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Tests for gpx.py.
+"""
+
+import unittest
+import gpx
+import math
+
+from io import BytesIO, StringIO
+
+GARMIN_GPX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<gpx creator="Garmin Connect" version="1.1"
+  xmlns="http://www.topografix.com/GPX/1/1">
+  <metadata>
+    <time>2019-08-18T20:28:51.000Z</time>
+  </metadata>
+  <trk>
+    <trkseg>
+      <trkpt lat="44.19148698449135" lon="-74.26357836462557">
+        <time>2019-08-18T20:28:51.000Z</time>
+      </trkpt>
+      <trkpt lat="44.1914514452219" lon="-74.2635076213628">
+        <time>2019-08-18T20:28:51.826Z</time>
+      </trkpt>
+    </trkseg>
+  </trk>
+</gpx>"""
+
+ALLTRAILS_GPX = b"""<?xml version="1.0"?>
+<gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1">
+  <trk>
+    <trkseg>
+      <trkpt lat="44.12675" lon="-73.96051">
+        <ele>1433.54</ele>
+      </trkpt>
+    </trkseg>
+    <trkseg>
+      <trkpt lat="44.12678" lon="-73.96049">
+        <ele>1433.26</ele>
+      </trkpt>
+      <trkpt lat="44.1268" lon="-73.96047">
+        <ele>1432.83</ele>
+      </trkpt>
+    </trkseg>
+  </trk>
+</gpx>"""
+
+
+class TestReadTrack(unittest.TestCase):
+    def test_garmin_time(self):
+        track = gpx.read_track(BytesIO(GARMIN_GPX))
+        self.assertEqual(list(track.lat),
+                         [44.19148698449135, 44.1914514452219])
+        self.assertEqual(list(track.lon),
+                         [-74.26357836462557, -74.2635076213628])
+        self.assertEqual(list(track.time), [1566160131.0, 1566160131.826])
+        self.assertTrue(all(math.isnan(e) for e in track.ele))
+        self.assertEqual(list(track.segments), [0])
+
+    def test_alltrails_ele(self):
+        track = gpx.read_track(BytesIO(ALLTRAILS_GPX))
+        self.assertEqual(list(track.ele), [1433.54, 1433.26, 1432.83])
+        self.assertTrue(all(math.isnan(t) for t in track.time))
+        self.assertEqual(list(track.segments), [0, 1])
+
+    def test_time_formats(self):
+        self.assertEqual(gpx._parse_time('2019-08-01T00:01:00:000Z'),
+                         1564617660)
+        self.assertEqual(gpx._parse_time('2019-08-01T00:01:00'), 1564617660)
+        self.assertEqual(gpx._parse_time('2019-08-01T02:01:00+02:00'),
+                         1564617660)
+
+
+class TestWriteTrack(unittest.TestCase):
+    def _round_trip(self, track):
+        out = StringIO()
+        gpx.write_track(out, track, chunk_size=2)
+        return gpx.read_track(BytesIO(out.getvalue().encode('utf-8')))
+
+    def test_round_trip(self):
+        for source in (GARMIN_GPX, ALLTRAILS_GPX):
+            track = gpx.read_track(BytesIO(source))
+            written = self._round_trip(track)
+            for (expected, actual) in zip(track, written):
+                self.assertEqual(
+                    [x for x in expected if not math.isnan(x)],
+                    [x for x in actual if not math.isnan(x)])
+
+
+if __name__ == '__main__':
+    unittest.main()
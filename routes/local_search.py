@@ -0,0 +1,187 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Local search TSP solver over a (possibly asymmetric) NumPy cost matrix.
+
+Alternates 2-opt and Or-opt moves until no move improves the tour, then kicks
+the tour with a double bridge and repeats (iterated local search). Every move
+of a kind is evaluated at once: deltas are O(1) each, using prefix sums of the
+forward and backward edge costs along the tour, and candidates are restricted
+to new edges between near neighbors.
+
+Tours are arrays of nodes starting at the depot, which is returned to at the
+end.
+"""
+
+from __future__ import print_function
+import os
+import sys
+import time
+
+import numpy as np
+
+import common
+
+
+def tour_cost(costs, tour):
+    return costs[tour, np.roll(tour, -1)].sum()
+
+
+def neighbor_mask(costs, k):
+    """mask[a, b] is True if b is one of the k cheapest successors of a."""
+    n = len(costs)
+    mask = np.zeros((n, n), dtype=bool)
+    if k is None or k >= n - 1:
+        mask[:] = True
+    else:
+        nearest = np.argsort(costs + np.diag(np.full(n, np.inf)),
+                             axis=1)[:, :k]
+        mask[np.arange(n)[:, np.newaxis], nearest] = True
+    return mask
+
+
+def nearest_neighbor_tour(costs, depot):
+    n = len(costs)
+    tour = [depot]
+    unvisited = np.ones(n, dtype=bool)
+    unvisited[depot] = False
+    for _ in range(n - 1):
+        row = np.where(unvisited, costs[tour[-1]], np.inf)
+        tour.append(int(np.argmin(row)))
+        unvisited[tour[-1]] = False
+    return np.array(tour)
+
+
+def two_opt_move(costs, tour, mask):
+    """Returns (delta, i, j) of the best move reversing tour[i + 1:j + 1]."""
+    n = len(tour)
+    succ = np.roll(tour, -1)
+    forward = np.concatenate([[0], np.cumsum(costs[tour, succ])])
+    backward = np.concatenate([[0], np.cumsum(costs[succ, tour])])
+    i = np.arange(n)[:, np.newaxis]
+    j = np.arange(n)[np.newaxis, :]
+    a, b, c, d = tour[i], succ[i], tour[j], succ[j]
+    delta = (costs[a, c] + costs[b, d] - costs[a, b] - costs[c, d] +
+             (backward[j] - backward[i + 1]) - (forward[j] - forward[i + 1]))
+    delta = np.where((j > i + 1) & mask[a, c], delta, np.inf)
+    (i, j) = np.unravel_index(np.argmin(delta), delta.shape)
+    return delta[i, j], i, j
+
+
+def or_opt_move(costs, tour, mask, max_length=3):
+    """Returns (delta, start, length, position, reversed) of the best move of
+    the segment tour[start:start + length] to after tour[position]."""
+    n = len(tour)
+    succ = np.roll(tour, -1)
+    forward = np.concatenate([[0], np.cumsum(costs[tour, succ])])
+    backward = np.concatenate([[0], np.cumsum(costs[succ, tour])])
+    p = np.arange(n)[np.newaxis, :]
+    best = (np.inf, None, None, None, None)
+    for length in range(1, min(max_length, n - 2) + 1):
+        # Segments never include the depot at position 0.
+        s = np.arange(1, n - length + 1)[:, np.newaxis]
+        e = s + length - 1
+        removed = (costs[tour[s - 1], tour[s]] + costs[tour[e], succ[e]] +
+                   costs[tour[p], succ[p]])
+        closed = costs[tour[s - 1], succ[e]]
+        valid = (p < s - 1) | (p > e)
+        internal = (backward[e] - backward[s]) - (forward[e] - forward[s])
+        for (reverse, first, last) in ((False, s, e), (True, e, s)):
+            delta = (closed + costs[tour[p], tour[first]] +
+                     costs[tour[last], succ[p]] - removed)
+            if reverse:
+                delta = delta + internal
+            delta = np.where(valid & mask[tour[p], tour[first]], delta,
+                             np.inf)
+            (si, pi) = np.unravel_index(np.argmin(delta), delta.shape)
+            if delta[si, pi] < best[0]:
+                best = (delta[si, pi], si + 1, length, pi, reverse)
+    return best
+
+
+def apply_two_opt(tour, i, j):
+    tour = tour.copy()
+    tour[i + 1:j + 1] = tour[i + 1:j + 1][::-1]
+    return tour
+
+
+def apply_or_opt(tour, start, length, position, reverse):
+    segment = tour[start:start + length]
+    if reverse:
+        segment = segment[::-1]
+    rest = np.concatenate([tour[:start], tour[start + length:]])
+    if position > start:
+        position -= length
+    return np.concatenate(
+        [rest[:position + 1], segment, rest[position + 1:]])
+
+
+def local_optimum(costs, tour, mask, epsilon=1e-9, deadline=None):
+    """Applies the best improving 2-opt or Or-opt move until there is none, or
+    until time.monotonic() passes `deadline`."""
+    while deadline is None or time.monotonic() < deadline:
+        (delta, i, j) = two_opt_move(costs, tour, mask)
+        or_opt = or_opt_move(costs, tour, mask)
+        if min(delta, or_opt[0]) > -epsilon:
+            return tour
+        if delta <= or_opt[0]:
+            tour = apply_two_opt(tour, i, j)
+        else:
+            tour = apply_or_opt(tour, *or_opt[1:])
+    return tour
+
+
+def double_bridge(tour, rng):
+    """Reconnects three random cuts of the tour (keeping the depot first)."""
+    (a, b, c) = np.sort(rng.choice(np.arange(2, len(tour)), 3,
+                                   replace=False))
+    return np.concatenate([tour[:a], tour[b:c], tour[a:b], tour[c:]])
+
+
+def solve(costs,
+          depot,
+          time_limit=1.,
+          neighbors=12,
+          initial_tour=None,
+          seed=0,
+          max_stale=None,
+          target=None):
+    """Returns the best tour found within `time_limit` seconds.
+
+    Stops early after `max_stale` kicks without improvement, or once a tour
+    costs at most `target`, if given.
+    """
+    deadline = time.monotonic() + time_limit
+    costs = np.asarray(costs, dtype=float)
+    mask = neighbor_mask(costs, neighbors)
+    rng = np.random.RandomState(seed)
+    if initial_tour is None:
+        tour = nearest_neighbor_tour(costs, depot)
+    else:
+        tour = np.asarray(initial_tour)
+        tour = np.roll(tour, -int(np.nonzero(tour == depot)[0][0]))
+    best = tour = local_optimum(costs, tour, mask, deadline=deadline)
+    if len(tour) < 5:
+        return best
+    best_cost = tour_cost(costs, best)
+    stale = 0
+    while (time.monotonic() < deadline
+           and (max_stale is None or stale < max_stale)
+           and (target is None or best_cost > target)):
+        tour = local_optimum(costs,
+                             double_bridge(best, rng),
+                             mask,
+                             deadline=deadline)
+        cost = tour_cost(costs, tour)
+        common.TRACER.count('kicks')
+        if cost < best_cost - 1e-9:
+            (best, best_cost, stale) = (tour, cost, 0)
+            common.TRACER.sample('objective', objective=best_cost)
+        else:
+            stale += 1
+    return best
@@ -0,0 +1,64 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Tests for local_search.py.
+"""
+
+import unittest
+import itertools
+import local_search
+import time
+import numpy as np
+
+
+def _brute_force_cost(costs, depot):
+    others = [i for i in range(len(costs)) if i != depot]
+    return min(
+        local_search.tour_cost(costs, np.array([depot] + list(p)))
+        for p in itertools.permutations(others))
+
+
+class TestLocalSearch(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.RandomState(46)
+
+    def test_moves_match_tour_cost(self):
+        costs = self.rng.randint(1, 100, (9, 9)).astype(float)
+        tour = np.arange(9)
+        mask = local_search.neighbor_mask(costs, None)
+        (delta, i, j) = local_search.two_opt_move(costs, tour, mask)
+        self.assertAlmostEqual(
+            local_search.tour_cost(costs,
+                                   local_search.apply_two_opt(tour, i, j)),
+            local_search.tour_cost(costs, tour) + delta)
+        move = local_search.or_opt_move(costs, tour, mask)
+        moved = local_search.apply_or_opt(tour, *move[1:])
+        self.assertEqual(sorted(moved), list(range(9)))
+        self.assertAlmostEqual(local_search.tour_cost(costs, moved),
+                               local_search.tour_cost(costs, tour) + move[0])
+
+    def test_finds_optimum(self):
+        for _ in range(5):
+            costs = self.rng.randint(1, 100, (8, 8)).astype(float)
+            tour = local_search.solve(costs, 7, time_limit=0.2)
+            self.assertEqual(tour[0], 7)
+            self.assertEqual(sorted(tour), list(range(8)))
+            self.assertEqual(local_search.tour_cost(costs, tour),
+                             _brute_force_cost(costs, 7))
+
+    def test_honors_time_limit(self):
+        points = self.rng.uniform(0, 100, (1000, 2))
+        costs = np.hypot(*(points[:, np.newaxis] - points[np.newaxis]).T)
+        start = time.monotonic()
+        tour = local_search.solve(costs, 0, time_limit=0.5)
+        self.assertLess(time.monotonic() - start, 0.5 + 1.5)
+        self.assertEqual(sorted(tour), list(range(1000)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Lower bounds on the cost of a TSP tour, to prove how close a route is to
+optimal.
+
+held_karp_bound() computes the Held-Karp 1-tree bound, maximized with
+subgradient optimization. Since 1-trees are undirected, asymmetric costs are
+first transformed into a symmetric instance over 2n nodes (Jonker and
+Volgenant): each node i gets a twin i' joined to it by a very cheap edge, and
+the arc i > j becomes the edge i' - j.
+"""
+
+from __future__ import print_function
+import os
+import sys
+import time
+
+import numpy as np
+
+import local_search
+
+
+def one_tree(costs, values=None):
+    """Returns (cost, degrees) of the minimum 1-tree of a symmetric cost
+    matrix: a minimum spanning tree of nodes 1..n-1 plus the two cheapest
+    edges from node 0. If given, the cost sums `values` of the tree's edges
+    instead of `costs`."""
+    if values is None:
+        values = costs
+    n = len(costs)
+    degrees = np.zeros(n, dtype=int)
+    in_tree = np.zeros(n, dtype=bool)
+    in_tree[[0, 1]] = True
+    nearest = costs[1].copy()
+    parent = np.ones(n, dtype=int)
+    total = 0.
+    # Prim's algorithm.
+    for _ in range(n - 2):
+        k = np.argmin(np.where(in_tree, np.inf, nearest))
+        total += values[k, parent[k]]
+        degrees[[k, parent[k]]] += 1
+        in_tree[k] = True
+        closer = costs[k] < nearest
+        nearest = np.where(closer, costs[k], nearest)
+        parent = np.where(closer, k, parent)
+    cheapest = np.argpartition(costs[0, 1:], 2)[:2] + 1
+    total += values[0, cheapest].sum()
+    degrees[0] = 2
+    degrees[cheapest] += 1
+    return total, degrees
+
+
+def symmetric_costs(costs):
+    """Returns (symmetric (2n, 2n) cost matrix, offset), such that a tour of
+    `costs` costs `offset` more than the corresponding symmetric tour."""
+    n = len(costs)
+    costs = np.array(costs, dtype=float)
+    costs[np.arange(n), np.arange(n)] = 0
+    twin_cost = -(costs.max() + 1) * n
+    symmetric = np.full((2 * n, 2 * n), np.inf)
+    symmetric[n:, :n] = costs
+    symmetric[:n, n:] = costs.T
+    symmetric[np.arange(n), n + np.arange(n)] = twin_cost
+    symmetric[n + np.arange(n), np.arange(n)] = twin_cost
+    return symmetric, -twin_cost * n
+
+
+def held_karp_bound(costs,
+                    upper_bound=None,
+                    time_limit=None,
+                    max_iterations=1000,
+                    patience=20):
+    """Returns a lower bound on the cost of any tour of `costs`.
+
+    Node penalties are adjusted with Polyak steps towards `upper_bound`
+    (default: the cost of a local search tour), halving the step size
+    after `patience` iterations without improvement. Stops after
+    `max_iterations`, `time_limit` seconds, or once the bound reaches
+    `upper_bound`.
+    """
+    costs = np.asarray(costs)
+    if upper_bound is None:
+        # Nearest neighbor tours can be forced through placeholder costs, which
+        # make for huge steps.
+        upper_bound = local_search.tour_cost(
+            costs, local_search.solve(costs, 0, time_limit=1., max_stale=0))
+    if len(costs) < 3:
+        return upper_bound
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    (symmetric, _) = symmetric_costs(costs)
+    # Minimum 1-trees always include the very cheap twin edges, which the
+    # offset makes up for. Summing them as 0 instead avoids adding the offset
+    # back, which loses precision when costs hold large placeholder values.
+    n = len(costs)
+    values = symmetric.copy()
+    values[np.arange(n), n + np.arange(n)] = 0
+    values[n + np.arange(n), np.arange(n)] = 0
+    penalties = np.zeros(len(symmetric))
+    (best, scale) = (-np.inf, 0.)
+    (step, stale) = (2., 0)
+    for _ in range(max_iterations):
+        penalty_matrix = penalties[:, np.newaxis] + penalties[np.newaxis, :]
+        (tree_cost, degrees) = one_tree(symmetric + penalty_matrix,
+                                        values + penalty_matrix)
+        bound = tree_cost - 2 * penalties.sum()
+        if bound > best:
+            (best, stale) = (bound, 0)
+            # The magnitude of the terms summed, for the rounding error.
+            scale = abs(tree_cost) + 2 * np.abs(penalties).sum()
+        else:
+            stale += 1
+            if stale >= patience:
+                (step, stale) = (step / 2, 0)
+        subgradient = degrees - 2
+        norm = (subgradient * subgradient).sum()
+        if (norm == 0 or best >= upper_bound or step < 1e-6 or
+            (deadline is not None and time.monotonic() > deadline)):
+            break
+        penalties += step * (upper_bound - bound) / norm * subgradient
+    best -= max(1e-6, 1e-9 * scale)
+    if np.issubdtype(costs.dtype, np.integer):
+        # Tours of integer costs cost an integer.
+        best = np.ceil(best)
+    return min(best, upper_bound)
+
+
+def gap(objective, bound):
+    """Relative optimality gap of a solution with cost `objective`."""
+    if objective <= 0:
+        return 0.
+    return max(objective - bound, 0) / objective
@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Tests for lower_bound.py.
+"""
+
+import unittest
+import itertools
+import local_search
+import lower_bound
+import numpy as np
+
+
+def _brute_force_cost(costs):
+    return min(
+        local_search.tour_cost(costs, np.array((0, ) + p))
+        for p in itertools.permutations(range(1, len(costs))))
+
+
+class TestOneTree(unittest.TestCase):
+    def test_square(self):
+        # Four corners of a unit square; diagonals cost 2.
+        costs = np.array([[0, 1, 2, 1], [1, 0, 1, 2], [2, 1, 0, 1],
+                          [1, 2, 1, 0]],
+                         dtype=float)
+        (cost, degrees) = lower_bound.one_tree(costs)
+        self.assertEqual(cost, 4)
+        self.assertEqual(list(degrees), [2, 2, 2, 2])
+
+
+class TestHeldKarpBound(unittest.TestCase):
+    def test_bounds_optimum(self):
+        rng = np.random.RandomState(46)
+        for _ in range(10):
+            costs = rng.randint(1, 100, (7, 7))
+            optimum = _brute_force_cost(costs)
+            bound = lower_bound.held_karp_bound(costs)
+            self.assertLessEqual(bound, optimum)
+            self.assertGreater(bound, 0.8 * optimum)
+
+    def test_bounds_optimum_with_large_costs(self):
+        # Placeholders for missing edges make the offset of the symmetric
+        # instance huge.
+        rng = np.random.RandomState(46)
+        for _ in range(40):
+            costs = rng.randint(1, 100, (7, 7))
+            costs[rng.uniform(size=(7, 7)) < 0.3] = 10**10
+            self.assertLessEqual(lower_bound.held_karp_bound(costs),
+                                 _brute_force_cost(costs))
+
+    def test_placeholder_costs(self):
+        # Like the trailhead cells missing from the sheet.
+        rng = np.random.RandomState(46)
+        for _ in range(10):
+            costs = rng.randint(1, 100, (7, 7))
+            costs[0, 1:4] = costs[1:4, 0] = int(1e9)
+            optimum = _brute_force_cost(costs)
+            bound = lower_bound.held_karp_bound(costs)
+            self.assertLessEqual(bound, optimum)
+            self.assertGreater(bound, 0.8 * optimum)
+
+    def test_gap(self):
+        self.assertEqual(lower_bound.gap(100, 90), 0.1)
+        self.assertEqual(lower_bound.gap(100, 110), 0.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,15 +7,35 @@
 # Distributed under terms of the MIT license.
 """
 Calls Gaiagps.com API to get hiking directions for all pairs of coordinates.
+
+With --output, distances are appended to a csv (e.g. pairwise_distances.csv)
+as they arrive, and pairs already present in it are skipped, so an interrupted
+run can be resumed.
 """
 
 from __future__ import print_function
 import os
 import sys
 import argparse
-import requests
+import contextlib
+import csv
 
 import common
+import trail_network
+
+
+def read_done(path):
+    """Returns {(p, q): distance} of the rows of a pairwise distances csv,
+    first truncating a partially written last row, so that it can be appended
+    to."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+    with open(path) as f:
+        return {(row[0], row[1]): row[2] for row in csv.reader(f)}
 
 
 def main(arguments):
@@ -27,27 +47,79 @@ def main(arguments):
                         '--coordinates',
                         help="Coordinates csv, with summit name, lat, long",
                         type=argparse.FileType('r'))
+    parser.add_argument(
+        '-o',
+        '--output',
+        help='Pairwise distances csv to append to, skipping existing pairs',
+        type=str)
+    parser.add_argument('-w',
+                        '--workers',
+                        help='Number of concurrent requests',
+                        default=8,
+                        type=int)
+    parser.add_argument('--rate',
+                        help='Maximum number of requests per second',
+                        type=float)
+    parser.add_argument('--symmetric',
+                        help='Reuse the distance of q > p for p > q',
+                        action='store_true')
+    common.add_route_cache_arguments(parser)
+    trail_network.add_trail_network_arguments(parser)
+    common.add_trace_arguments(parser)
 
     args = parser.parse_args(arguments)
+    common.trace_from_args(args)
+    cache = common.route_cache_from_args(args)
+    router = trail_network.router_from_args(args)
 
     peaks_to_lat_long = dict(
         common.line_to_peak_lat_long(i)
         for i in args.coordinates.readlines()[1:])
 
-    for p in peaks_to_lat_long:
-        for q in peaks_to_lat_long:
-            if p == q:
-                continue
-            res = requests.post(
-                common.GAIA_REQUEST_PATTERN.format(
-                    start_lon=peaks_to_lat_long[p]['long'],
-                    start_lat=peaks_to_lat_long[p]['lat'],
-                    end_lon=peaks_to_lat_long[q]['long'],
-                    end_lat=peaks_to_lat_long[q]['lat']))
-            print("{}({}, {}) > {}({}, {}): {}km".format(
-                p, peaks_to_lat_long[p]['long'], peaks_to_lat_long[p]['lat'],
-                q, peaks_to_lat_long[q]['long'], peaks_to_lat_long[q]['lat'],
-                res.json()['trip']['summary']['length']))
+    done = {} if args.output is None else read_done(args.output)
+    with (contextlib.nullcontext() if args.output is None else open(
+            args.output, 'a')) as out:
+        writer = None if out is None else csv.writer(out, lineterminator='\n')
+
+        def emit(p, q, length):
+            if writer is None:
+                print("{}({}, {}) > {}({}, {}): {}km".format(
+                    p, peaks_to_lat_long[p]['long'],
+                    peaks_to_lat_long[p]['lat'], q,
+                    peaks_to_lat_long[q]['long'],
+                    peaks_to_lat_long[q]['lat'], length))
+            else:
+                writer.writerow([p, q, length])
+                out.flush()
+
+        pairs = []
+        scheduled = set()
+        for p in peaks_to_lat_long:
+            for q in peaks_to_lat_long:
+                if p == q or (p, q) in done:
+                    continue
+                if args.symmetric and (q, p) in done:
+                    emit(p, q, done[(q, p)])
+                elif not args.symmetric or (q, p) not in scheduled:
+                    pairs.append((p, q))
+                    scheduled.add((p, q))
+
+        legs = [(peaks_to_lat_long[p], peaks_to_lat_long[q])
+                for (p, q) in pairs]
+        with common.TRACER.span('route_pairs', pairs=len(legs)):
+            for (i, trip) in common.gaia_routes(legs,
+                                                cache=cache,
+                                                workers=args.workers,
+                                                rate=args.rate,
+                                                router=router):
+                (p, q) = pairs[i]
+                if trip is None:
+                    print('No route: {} > {}'.format(p, q), file=sys.stderr)
+                    continue
+                emit(p, q, trip['summary']['length'])
+                if args.symmetric and (q, p) not in done:
+                    emit(q, p, trip['summary']['length'])
+    print(cache.stats(), file=sys.stderr)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,85 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Tests for pairwise_distance.py.
+"""
+
+import unittest
+import common
+import os
+import pairwise_distance
+import shutil
+import tempfile
+
+from unittest import mock
+
+COORDINATES = """Peak name, Description, Lat, Long
+p1, "p1", 44.1, -73.9
+p2, "p2", 44.2, -73.8
+p3, "p3", 44.3, -73.7
+"""
+
+
+class TestResume(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, 'pairwise_distances.csv')
+        self.coordinates = os.path.join(self.directory, 'coordinates.csv')
+        with open(self.coordinates, 'w') as f:
+            f.write(COORDINATES)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_truncates_partial_row(self):
+        # Interrupted while writing the second row.
+        with open(self.output, 'w') as f:
+            f.write('p1,p2,1.5\np2,p')
+
+        def gaia_routes(legs, **kwargs):
+            for i in range(len(legs)):
+                yield i, {'summary': {'length': 2.5}}
+
+        with mock.patch.object(common, 'gaia_routes', gaia_routes):
+            pairwise_distance.main([
+                '-c', self.coordinates, '-o', self.output, '--route_cache',
+                os.path.join(self.directory, 'routes.sqlite')
+            ])
+        with open(self.output) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], 'p1,p2,1.5')
+        self.assertEqual(len(lines), 6)
+        self.assertIn('p2,p1,2.5', lines)
+
+
+    def test_symmetric(self):
+        with open(self.output, 'w') as f:
+            f.write('p1,p2,1.5\n')
+        routed = []
+
+        def gaia_routes(legs, **kwargs):
+            for (i, (start, end)) in enumerate(legs):
+                routed.append((start['lat'], end['lat']))
+                yield i, {'summary': {'length': 2.5}}
+
+        with mock.patch.object(common, 'gaia_routes', gaia_routes):
+            pairwise_distance.main([
+                '-c', self.coordinates, '-o', self.output, '--route_cache',
+                os.path.join(self.directory, 'routes.sqlite'), '--symmetric'
+            ])
+        # p2 > p1 is reused, and each other pair is routed once.
+        self.assertEqual(routed, [('44.1', '44.3'), ('44.2', '44.3')])
+        with open(self.output) as f:
+            self.assertEqual(
+                sorted(f.read().splitlines()),
+                ['p1,p2,1.5', 'p1,p3,2.5', 'p2,p1,1.5', 'p2,p3,2.5',
+                 'p3,p1,2.5', 'p3,p2,2.5'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Runs the route scripts from a single process.
+
+`pipeline.py <script> [arguments]` runs routes/<script>.py with its usual
+arguments, importing only the modules that script needs, so that e.g.
+`pipeline.py ps2d` starts without loading OR-Tools.
+
+`pipeline.py run` solves for the optimal route, writes its peak sequence to
+<output>-ps.txt and its GPX route to <output>-ps.gpx, and prints its distance,
+like the three chained commands in the README. The distance matrix is loaded
+and parsed once, and the sheet download and Gaia requests share one HTTP
+session. Arguments `run` doesn't know are passed on to solve_tsp.py.
+
+Dev command:
+    python3 routes/pipeline.py run -pw routes/pairwise_distances.csv -c summits/coordinates.csv -d '<distance matrix url>'
+"""
+
+from __future__ import print_function
+import sys
+import argparse
+import contextlib
+import csv
+import importlib
+
+SCRIPTS = [
+    'benchmark', 'gpx2ps', 'pairwise_distance', 'ps2d', 'ps2gpx', 'simplify',
+    'solve_tsp', 'topo_maps', 'track_stats', 'track_store', 'trail_network'
+]
+
+
+def run(arguments):
+    # Modules with heavier imports are only loaded here, not for other
+    # subcommands.
+    import common
+    import trail_network
+
+    parser = argparse.ArgumentParser(
+        prog='pipeline.py run',
+        description='Solves, writes and evaluates the optimal route',
+        epilog='Other arguments are passed on to solve_tsp.py')
+    parser.add_argument('-d',
+                        '--distance_matrix',
+                        help='Url of distance matrix',
+                        type=str)
+    parser.add_argument(
+        '-pw',
+        '--pairwise_distances',
+        help='csv file containing pairwise distances between peaks',
+        type=argparse.FileType('r'))
+    parser.add_argument('-c',
+                        '--coordinates',
+                        help="Coordinates csv, with summit name, lat, long",
+                        required=True,
+                        type=str)
+    parser.add_argument('-o',
+                        '--output',
+                        help='Prefix of the peak sequence and GPX files',
+                        default='/tmp/optimal',
+                        type=str)
+    parser.add_argument(
+        '-t',
+        '--tolerance',
+        help="Simplify the GPX route, keeping it within this many meters",
+        type=float)
+    parser.add_argument('--cache_dir',
+                        help='Directory for cached distance matrices',
+                        default=common.DEFAULT_CACHE_DIR,
+                        type=str)
+    parser.add_argument(
+        '--offline',
+        help='Use the cached distance matrix without checking for updates',
+        action='store_true')
+    common.add_route_cache_arguments(parser)
+    trail_network.add_trail_network_arguments(parser)
+    common.add_trace_arguments(parser)
+
+    (args, solve_arguments) = parser.parse_known_args(arguments)
+    common.trace_from_args(args)
+
+    session = common.make_session()
+    distances = common.load_distance_matrix(args.distance_matrix,
+                                            common.DEFAULT_COST,
+                                            cache_dir=args.cache_dir,
+                                            offline=args.offline,
+                                            session=session)
+    pairs_distances = common.parse_distance_matrix_from_pairs(
+        csv.reader(args.pairwise_distances))
+    distances = common.merge_pairwise_and_matrix_distances(
+        pairs_distances, distances)
+
+    import solve_tsp
+    sequence_path = args.output + '-ps.txt'
+    with open(sequence_path, 'w') as f, contextlib.redirect_stdout(f):
+        solve_tsp.main(solve_arguments, distances=distances)
+
+    import ps2gpx
+    gpx_arguments = ['-c', args.coordinates, '-ps', sequence_path]
+    for (flag, value) in (('-t', args.tolerance),
+                          ('--route_cache', args.route_cache),
+                          ('--route_cache_ttl', args.route_cache_ttl),
+                          ('--route_cache_max_entries',
+                           args.route_cache_max_entries),
+                          ('--trail_network', args.trail_network)):
+        if value is not None:
+            gpx_arguments += [flag, str(value)]
+    with open(args.output + '-ps.gpx', 'w') as f, \
+            contextlib.redirect_stdout(f):
+        ps2gpx.main(gpx_arguments, session=session)
+
+    import ps2d
+    return ps2d.main(['-ps', sequence_path], distances=distances)
+
+
+def main(arguments):
+
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command',
+                        help='Script to run, or run for the whole pipeline',
+                        choices=['run'] + SCRIPTS)
+    parser.add_argument('arguments',
+                        help='Arguments of the script',
+                        nargs=argparse.REMAINDER)
+
+    args = parser.parse_args(arguments)
+
+    if args.command == 'run':
+        return run(args.arguments)
+    return importlib.import_module(args.command).main(args.arguments)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
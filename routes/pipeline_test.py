@@ -0,0 +1,114 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Tests for pipeline.py.
+"""
+
+import unittest
+import common
+import csv
+import gpx
+import os
+import pipeline
+import shutil
+import subprocess
+import sys
+import tempfile
+import trail_network
+import numpy as np
+
+from io import StringIO
+from unittest import mock
+
+DISTANCE_CSV_STRING = """,p1,p2,p3,Trailhead
+p1,,"Distance: 1.0 mi\n+1,000 ft / -100 ft",,"Distance: 3.0 mi\n+0 ft / -900 ft"
+p2,,,"Distance: 2.0 mi\n+2,000 ft / -200 ft",
+p3,,,,"Distance: 4.0 mi\n+0 ft / -2,700 ft"
+"""
+
+COORDINATES_CSV_STRING = """Peak name, Description, Lat, Long
+p1, "p1", 44.1, -73.9
+p2, "p2", 44.101, -73.9
+p3, "p3", 44.102, -73.9
+"""
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _path(self, name, content=None):
+        path = os.path.join(self.directory, name)
+        if content is not None:
+            with open(path, 'w') as f:
+                f.write(content)
+        return path
+
+    def test_imports_lazily(self):
+        code = ('import sys, pipeline\n'
+                'try:\n'
+                '    pipeline.main(["ps2d", "-h"])\n'
+                'except SystemExit:\n'
+                '    pass\n'
+                'print("ortools" in sys.modules, "requests" in sys.modules)')
+        output = subprocess.check_output(
+            [sys.executable, '-c', code],
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(output.decode('utf-8').split()[-2:],
+                         ['False', 'False'])
+
+    def test_run(self):
+        distances = common.parse_distance_matrix(
+            csv.reader(StringIO(DISTANCE_CSV_STRING)), common.DEFAULT_COST)
+        steps = np.arange(30) * 0.0001
+        network = trail_network.TrailNetwork.build([
+            gpx.Track(44.1 + steps, np.full(30, -73.9), np.full(30, np.nan),
+                      np.full(30, np.nan), np.array([0]))
+        ],
+                                                   landmarks=2)
+        network.save(self._path('network.npz'))
+        output = self._path('optimal')
+        stdout = StringIO()
+        with mock.patch.object(common,
+                               'load_distance_matrix',
+                               return_value=distances) as load, \
+                mock.patch('sys.stdout', stdout), \
+                mock.patch('sys.stderr', StringIO()):
+            pipeline.main([
+                'run', '-d', 'http://localhost/sheet.csv', '-pw',
+                self._path('pairs.csv', 'p1,p2,5.0\n'), '-c',
+                self._path('coordinates.csv', COORDINATES_CSV_STRING),
+                '--route_cache',
+                self._path('routes.sqlite'), '--trail_network',
+                self._path('network.npz'), '-o', output, '--solver',
+                'local_search', '--no_lower_bound'
+            ])
+        self.assertEqual(load.call_count, 1)
+        with open(output + '-ps.txt') as f:
+            sequence = [line.strip() for line in f if line.strip()]
+        self.assertEqual(sorted(sequence),
+                         ['Trailhead', 'Trailhead', 'p1', 'p2', 'p3'])
+        with open(output + '-ps.gpx') as f:
+            track = gpx.read_track(f)
+        self.assertGreater(len(track.lat), 3)
+        self.assertIn('Distance: 10.0 miles', stdout.getvalue())
+
+
+    def test_run_requires_coordinates(self):
+        with mock.patch.object(common, 'load_distance_matrix') as load, \
+                mock.patch('sys.stderr', StringIO()), \
+                self.assertRaises(SystemExit):
+            pipeline.main(['run', '-d', 'http://localhost/sheet.csv'])
+        load.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
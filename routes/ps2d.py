@@ -11,6 +11,9 @@ Computes the distance and elevation gain/loss of a particular peak sequence.
 This assumes that the provided distance matrix has distances for all of the
 implied transitions, and does not do any path finding.
 
+With --batch, evaluates many peak sequences at once and prints them ranked by
+cost, e.g. `-b routes/*-ps.txt` or `-b -` for sequences on stdin.
+
 Dev command:  ls routes/ps2d.py | entr -c -s "python3 routes/ps2d.py '-ps routes/2019-fkt-peak-sequence.txt -d https://docs.google.com/spreadsheets/u/0/d/19ft1S-RoGl5jbBcyiCKPZuqL4a4MvFkjW_hu6I87Fhc/export?format=csv&id=19ft1S-RoGl5jbBcyiCKPZuqL4a4MvFkjW_hu6I87Fhc&gid=0'"
 
 Google sheet with distance matrix is at:
@@ -21,15 +24,83 @@ from __future__ import print_function
 import os
 import sys
 import argparse
-import requests
 import csv
+import glob
 import re
 import common
+import numpy as np
 
 from io import StringIO
 
+COST_FUNCTIONS = {
+    f.__name__: f
+    for f in (common.mileage_only_cost, common.climbing_only_cost,
+              common.mixed_cost)
+}
+
+
+def read_sequences(paths, stdin=sys.stdin):
+    """Yields (name, list of peaks) for each peak sequence in `paths`, which
+    may be files, directories of .txt files or globs. '-' reads sequences from
+    stdin, separated by blank lines."""
+    for path in paths:
+        if path == '-':
+            for (i, sequence) in enumerate(_split_sequences(stdin)):
+                yield 'stdin:{}'.format(i + 1), sequence
+            continue
+        if os.path.isdir(path):
+            filenames = sorted(glob.glob(os.path.join(path, '*.txt')))
+        else:
+            filenames = sorted(glob.glob(path)) or [path]
+        for filename in filenames:
+            with open(filename) as f:
+                yield filename, [p.strip() for p in f if p.strip()]
+
+
+def _split_sequences(lines):
+    sequence = []
+    for line in lines:
+        if line.strip():
+            sequence.append(line.strip())
+        elif sequence:
+            yield sequence
+            sequence = []
+    if sequence:
+        yield sequence
+
+
+def sequence_totals(distances, sequences):
+    """Returns an (n, 3) array of the total (distance, gain, loss) of each
+    sequence of peak names, with NaN rows for sequences with a missing
+    distance.
+
+    All legs are gathered from the matrix arrays and summed per sequence at
+    once.
+    """
+    indices = [
+        np.array([distances.index[p] for p in sequence], dtype=np.intp)
+        for sequence in sequences
+    ]
+    starts = np.concatenate([i[:-1] for i in indices] + [[]]).astype(np.intp)
+    ends = np.concatenate([i[1:] for i in indices] + [[]]).astype(np.intp)
+    legs = np.repeat(np.arange(len(indices)),
+                     [max(len(i) - 1, 0) for i in indices])
+    return np.stack([
+        np.bincount(legs, weights=a[starts, ends], minlength=len(indices))
+        for a in (distances.distance, distances.gain, distances.loss)
+    ],
+                    axis=1)
+
 
-def main(arguments):
+def _missing_leg(distances, sequence):
+    for (p1, p2) in zip(sequence, sequence[1:]):
+        if distances[p1][p2] is None:
+            return p1, p2
+
+
+def main(arguments, distances=None):
+    """Evaluates peak sequences. `distances` is an already loaded and merged
+    matrix to use instead of -d and -pw, as pipeline.py passes."""
 
     parser = argparse.ArgumentParser(
         description=__doc__,
@@ -38,6 +109,17 @@ def main(arguments):
                         '--peak_sequence',
                         help='Filename of peak sequence to evaluate',
                         type=argparse.FileType('r'))
+    parser.add_argument(
+        '-b',
+        '--batch',
+        help='Peak sequence files, directories or globs to evaluate and '
+        'rank; - reads sequences separated by blank lines from stdin',
+        nargs='+',
+        type=str)
+    parser.add_argument('--rank_by',
+                        help='Cost function to rank batch sequences by',
+                        choices=sorted(COST_FUNCTIONS),
+                        default=common.DEFAULT_COST.__name__)
     parser.add_argument('-d',
                         '--distance_matrix',
                         help='Url of distance matrix',
@@ -47,32 +129,74 @@ def main(arguments):
         '--pairwise_distances',
         help='csv file containing pairwise distances between peaks',
         type=argparse.FileType('r'))
+    parser.add_argument('--cache_dir',
+                        help='Directory for cached distance matrices',
+                        default=common.DEFAULT_CACHE_DIR,
+                        type=str)
+    parser.add_argument(
+        '--offline',
+        help='Use the cached distance matrix without checking for updates',
+        action='store_true')
+    common.add_trace_arguments(parser)
 
     args = parser.parse_args(arguments)
+    common.trace_from_args(args)
+    tracer = common.TRACER
 
-    response = requests.get(args.distance_matrix)
-    assert response.status_code == 200, 'Download failed'
-
-    reader = csv.reader(StringIO(response.content.decode("utf-8")))
-    distances = common.parse_distance_matrix(reader, common.DEFAULT_COST)
-    # Parse pairwise distances
-    pairs_distances = common.parse_distance_matrix_from_pairs(
-        csv.reader(args.pairwise_distances))
-    distances = common.merge_pairwise_and_matrix_distances(
-        pairs_distances, distances)
-    totals = [0., 0., 0.]
-    curr = None
-    for p in args.peak_sequence.readlines():
-        pe = p.strip()
-        if curr is not None:
-            assert distances[curr][
-                pe] is not None, 'Missing distance: {} > {}'.format(curr, pe)
-            totals[0] += distances[curr][pe][0]
-            totals[1] += distances[curr][pe][1]
-            totals[2] += distances[curr][pe][2]
-        curr = pe
+    if distances is None:
+        distances = common.load_distance_matrix(args.distance_matrix,
+                                                common.DEFAULT_COST,
+                                                cache_dir=args.cache_dir,
+                                                offline=args.offline)
+        # Parse pairwise distances
+        with tracer.span('merge_pairwise_distances'):
+            pairs_distances = common.parse_distance_matrix_from_pairs(
+                csv.reader(args.pairwise_distances))
+            distances = common.merge_pairwise_and_matrix_distances(
+                pairs_distances, distances)
+
+    if args.batch:
+        with tracer.span('rank'):
+            return _rank(distances, read_sequences(args.batch),
+                         COST_FUNCTIONS[args.rank_by])
+
+    sequence = [p.strip() for p in args.peak_sequence if p.strip()]
+    missing = _missing_leg(distances, sequence)
+    assert missing is None, 'Missing distance: {} > {}'.format(*missing)
+    with tracer.span('sequence_totals'):
+        totals = sequence_totals(distances, [sequence])[0]
     print('Distance: {:.1f} miles\n+{:.0f} ft / -{:.0f} ft'.format(*totals))
 
 
+def _rank(distances, sequences, cost_function):
+    """Prints a table of sequences ranked by cost."""
+    (names, valid) = ([], [])
+    for (name, sequence) in sequences:
+        unknown = [p for p in sequence if p not in distances]
+        if unknown:
+            print('{}: skipped (unknown peak: {})'.format(name, unknown[0]),
+                  file=sys.stderr)
+            continue
+        if not sequence:
+            print('{}: skipped (empty sequence)'.format(name),
+                  file=sys.stderr)
+            continue
+        names.append(name)
+        valid.append(sequence)
+    totals = sequence_totals(distances, valid)
+    for i in np.nonzero(np.isnan(totals[:, 0]))[0]:
+        print('{}: skipped (missing distance: {} > {})'.format(
+            names[i], *_missing_leg(distances, valid[i])),
+              file=sys.stderr)
+    known = np.nonzero(~np.isnan(totals[:, 0]))[0]
+    costs = np.array([cost_function(tuple(totals[i])) for i in known])
+    order = np.argsort(costs, kind='stable')
+    print('{:>4}  {:>8}  {:>7}  {:>7}  {:>7}  {}'.format(
+        'Rank', 'Cost', 'Miles', '+ft', '-ft', 'Sequence'))
+    for (rank, (i, cost)) in enumerate(zip(known[order], costs[order])):
+        print('{:>4}  {:>8}  {:>7.1f}  {:>7.0f}  {:>7.0f}  {}'.format(
+            rank + 1, cost, *totals[i], names[i]))
+
+
 if __name__ == '__main__':
     sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,81 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Tests for ps2d.py.
+"""
+
+import unittest
+import common
+import csv
+import math
+import os
+import ps2d
+import shutil
+import tempfile
+
+from io import StringIO
+
+DISTANCE_CSV_STRING = """,p1,p2,p3,Trailhead
+p1,,"Distance: 1.0 mi\n+1,000 ft / -100 ft",,"Distance: 3.0 mi\n+0 ft / -900 ft"
+p2,,,"Distance: 2.0 mi\n+2,000 ft / -200 ft",
+p3,,,,"Distance: 4.0 mi\n+0 ft / -2,700 ft"
+"""
+
+
+class TestSequenceTotals(unittest.TestCase):
+    def setUp(self):
+        self.distances = common.parse_distance_matrix(
+            csv.reader(StringIO(DISTANCE_CSV_STRING)),
+            common.mileage_only_cost)
+
+    def test_totals(self):
+        totals = ps2d.sequence_totals(self.distances, [
+            ['Trailhead', 'p1', 'p2', 'p3', 'Trailhead'],
+            ['p3', 'p2'],
+            ['p1'],
+        ])
+        self.assertEqual([list(t) for t in totals],
+                         [[10.0, 3900.0, 3000.0], [2.0, 200.0, 2000.0],
+                          [0.0, 0.0, 0.0]])
+
+    def test_missing_distance(self):
+        distances = common.parse_distance_matrix_from_pairs(
+            csv.reader(StringIO('p1,p2,1.0\n')))
+        totals = ps2d.sequence_totals(distances, [['p1', 'p2'], ['p2', 'p1']])
+        self.assertFalse(math.isnan(totals[0, 0]))
+        self.assertTrue(math.isnan(totals[1, 0]))
+
+
+class TestReadSequences(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        for (name, peaks) in (('a-ps.txt', 'p1\np2\n'), ('b-ps.txt', 'p2\n')):
+            with open(os.path.join(self.directory, name), 'w') as f:
+                f.write(peaks)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_directory_and_glob(self):
+        self.assertEqual(
+            [s for (_, s) in ps2d.read_sequences([self.directory])],
+            [['p1', 'p2'], ['p2']])
+        self.assertEqual([
+            os.path.basename(n) for (n, _) in ps2d.read_sequences(
+                [os.path.join(self.directory, 'b*.txt')])
+        ], ['b-ps.txt'])
+
+    def test_stdin(self):
+        self.assertEqual(
+            list(ps2d.read_sequences(['-'],
+                                     stdin=StringIO('p1\np2\n\n\np3\n'))),
+            [('stdin:1', ['p1', 'p2']), ('stdin:2', ['p3'])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,40 +19,31 @@ from __future__ import print_function
 import os
 import sys
 import argparse
+import calendar
 import re
-import requests
 import polyline
 import datetime
+import numpy as np
 
 import common
+import gpx
+import simplify
+import trail_network
 
-GPX_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
-<gpx creator="Garmin Connect" version="1.1"
-  xsi:schemaLocation="http://www.topografix.com/GPX/1/1 http://www.topografix.com/GPX/11.xsd"
-  xmlns:ns3="http://www.garmin.com/xmlschemas/TrackPointExtension/v1"
-  xmlns="http://www.topografix.com/GPX/1/1"
-  xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:ns2="http://www.garmin.com/xmlschemas/GpxExtensions/v3">
-  <metadata>
-    <name>46er FKT attempt proposed peak sequence</name>
-    <link href="connect.garmin.com">
-      <text>Garmin Connect</text>
-    </link>
-    <time>2019-08-18T20:28:51.000Z</time>
-  </metadata>
-  <trk>
-    <name>46er FKT attempt proposed route</name>
-    <trkseg>"""
 
-GPX_FOOTER = """    </trkseg>
-  </trk>
-</gpx>"""
+def _leg_points(leg, trip):
+    """Returns the (lat, lon) points of a trip, or the ends of the leg if there
+    is no trip."""
+    if trip is None:
+        return [(float(c['lat']), float(c['long'])) for c in leg]
+    # Shapes are encoded with 6 digits of precision.
+    return [(lat / 10, lon / 10)
+            for (lat, lon) in polyline.decode(trip['legs'][0]['shape'])]
 
-TRKPT_PATTERN = """      <trkpt lat="%s" lon="%s">
-        <time>%s</time>
-      </trkpt>"""
 
-
-def main(arguments):
+def main(arguments, session=None):
+    """Writes the GPX route. Gaia requests go through `session` if given, as
+    pipeline.py passes."""
 
     parser = argparse.ArgumentParser(
         description=__doc__,
@@ -70,45 +61,71 @@ def main(arguments):
                         '--peak_sequence',
                         help="Peak sequence file, one summit per line",
                         type=argparse.FileType('r'))
+    parser.add_argument(
+        '-t',
+        '--tolerance',
+        help="Simplify the full route, keeping it within this many meters",
+        type=float)
+    parser.add_argument('-w',
+                        '--workers',
+                        help='Number of legs to fetch concurrently',
+                        default=8,
+                        type=int)
+    common.add_route_cache_arguments(parser)
+    trail_network.add_trail_network_arguments(parser)
+    common.add_trace_arguments(parser)
 
     args = parser.parse_args(arguments)
+    common.trace_from_args(args)
+    tracer = common.TRACER
+    cache = common.route_cache_from_args(args)
 
     peaks_to_lat_long = dict(
         common.line_to_peak_lat_long(i)
         for i in args.coordinates.readlines()[1:])
 
-    print(GPX_HEADER)
-    start_time = datetime.datetime(2018, 8, 1)
-    i = 0
-    last = None
-    for p in args.peak_sequence.readlines():
-        peak = p.strip()
-        if not common.is_peak(peak):
-            continue
-        if args.simplify:
-            print(TRKPT_PATTERN %
-                  (peaks_to_lat_long[peak]['lat'],
-                   peaks_to_lat_long[peak]['long'],
-                   (start_time + datetime.timedelta(0, i * 3600)).isoformat()))
-        else:
-            if last is None:
-                last = peak
-                continue
-            res = requests.post(
-                common.GAIA_REQUEST_PATTERN.format(
-                    start_lon=peaks_to_lat_long[last]['long'],
-                    start_lat=peaks_to_lat_long[last]['lat'],
-                    end_lon=peaks_to_lat_long[peak]['long'],
-                    end_lat=peaks_to_lat_long[peak]['lat']))
-            for point in polyline.decode(
-                    res.json()['trip']['legs'][0]['shape']):
-                print(TRKPT_PATTERN %
-                      (point[0] / 10, point[1] / 10,
-                       (start_time +
-                        datetime.timedelta(0, i * 3600)).isoformat()))
-        i += 1
-        last = peak
-    print(GPX_FOOTER)
+    peaks = [p.strip() for p in args.peak_sequence.readlines()]
+    peaks = [p for p in peaks if common.is_peak(p)]
+    start_time = calendar.timegm(datetime.datetime(2018, 8, 1).timetuple())
+    # Points are timestamped an hour apart per summit (or per leg).
+    if args.simplify:
+        points = [(float(peaks_to_lat_long[p]['lat']),
+                   float(peaks_to_lat_long[p]['long']), i)
+                  for (i, p) in enumerate(peaks)]
+    else:
+        legs = [(peaks_to_lat_long[p], peaks_to_lat_long[q])
+                for (p, q) in zip(peaks, peaks[1:])]
+        with tracer.span('route_legs', legs=len(legs)):
+            trips = dict(
+                common.gaia_routes(legs,
+                                   cache=cache,
+                                   workers=args.workers,
+                                   router=trail_network.router_from_args(args),
+                                   session=session))
+        for (i, (p, q)) in enumerate(zip(peaks, peaks[1:])):
+            if trips[i] is None:
+                print('No route: {} > {}, using a straight line'.format(p, q),
+                      file=sys.stderr)
+        points = [(lat, lon, i) for i in range(len(legs))
+                  for (lat, lon) in _leg_points(legs[i], trips[i])]
+    points = np.array(points, dtype=float).reshape(-1, 3)
+    track = gpx.Track(points[:, 0], points[:, 1],
+                      np.full(len(points), np.nan),
+                      start_time + points[:, 2] * 3600,
+                      np.array([0]))
+    if not args.simplify and args.tolerance is not None:
+        with tracer.span('simplify'):
+            (simplified, max_deviation) = simplify.simplify_track(
+                track, args.tolerance)
+        print('Kept {} of {} points (max deviation {:.1f} m)'.format(
+            len(simplified.lat), len(track.lat), max_deviation),
+              file=sys.stderr)
+        track = simplified
+    with tracer.span('write_track'):
+        gpx.write_track(sys.stdout,
+                        track,
+                        name='46er FKT attempt proposed route')
+    print(cache.stats(), file=sys.stderr)
 
 
 if __name__ == '__main__':
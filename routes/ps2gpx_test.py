@@ -0,0 +1,126 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Tests for ps2gpx.py, routing legs with a stub router.
+"""
+
+import unittest
+import common
+import contextlib
+import gpx
+import os
+import polyline
+import ps2gpx
+import shutil
+import tempfile
+import trail_network
+import numpy as np
+
+from io import StringIO
+from unittest import mock
+
+# p1 > p2 heads north, and p2 > p3 east.
+COORDINATES = """Peak name, Description, Lat, Long
+p1, "p1", 44.0, -74.0
+p2, "p2", 44.1, -74.0
+p3, "p3", 44.1, -73.9
+"""
+
+PEAK_SEQUENCE = 'Trailhead\np1\np2\np3\nTrailhead\n'
+
+
+def _straight_router(start, end, points=11):
+    """Routes along a straight line of `points` points."""
+    (lat, lon) = [
+        np.linspace(float(start[k]), float(end[k]), points)
+        for k in ('lat', 'long')
+    ]
+    return {
+        'summary': {
+            'length': 1.
+        },
+        'legs': [{
+            'shape': polyline.encode(list(zip(lat, lon)), 6)
+        }]
+    }
+
+
+class TestPs2Gpx(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.coordinates = os.path.join(self.directory, 'coordinates.csv')
+        with open(self.coordinates, 'w') as f:
+            f.write(COORDINATES)
+        self.peak_sequence = os.path.join(self.directory, 'ps.txt')
+        with open(self.peak_sequence, 'w') as f:
+            f.write(PEAK_SEQUENCE)
+        self.router = _straight_router
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _main(self, *arguments):
+        gaia_routes = common.gaia_routes
+
+        def reversed_routes(legs, **kwargs):
+            # Legs come back in completion order, which needn't be theirs.
+            return reversed(list(gaia_routes(legs, **kwargs)))
+
+        out = StringIO()
+        with mock.patch.object(trail_network,
+                               'router_from_args',
+                               return_value=self.router), \
+                mock.patch.object(common, 'gaia_routes', reversed_routes), \
+                contextlib.redirect_stdout(out), \
+                contextlib.redirect_stderr(StringIO()):
+            ps2gpx.main([
+                '-c', self.coordinates, '-ps', self.peak_sequence,
+                '--route_cache',
+                os.path.join(self.directory, 'routes.sqlite')
+            ] + list(arguments))
+        return gpx.read_track(StringIO(out.getvalue()))
+
+    def test_legs_in_order(self):
+        track = self._main()
+        self.assertEqual(len(track.lat), 2 * 11)
+        np.testing.assert_allclose(track.lat[:11], np.linspace(44., 44.1, 11))
+        np.testing.assert_allclose(track.lon[11:],
+                                   np.linspace(-74., -73.9, 11))
+        # An hour per leg.
+        self.assertEqual(track.time[11] - track.time[10], 3600)
+        self.assertTrue(np.isnan(track.ele).all())
+        self.assertEqual(list(track.segments), [0])
+
+    def test_missing_leg_is_a_straight_line(self):
+        # No route from p2.
+        self.router = lambda start, end: (None if start['lat'] == '44.1' else
+                                          _straight_router(start, end))
+        track = self._main()
+        self.assertEqual(len(track.lat), 11 + 2)
+        np.testing.assert_allclose(track.lon[-2:], [-74., -73.9])
+
+    def test_simplify_keeps_endpoints(self):
+        track = self._main('-t', '5')
+        # Only the summits are needed to stay on the route.
+        self.assertLess(len(track.lat), 5)
+        np.testing.assert_allclose((track.lat[0], track.lon[0]),
+                                   (44., -74.))
+        np.testing.assert_allclose((track.lat[-1], track.lon[-1]),
+                                   (44.1, -73.9))
+        # And the corner at p2.
+        self.assertTrue(
+            (np.isclose(track.lat, 44.1) & np.isclose(track.lon, -74.)).any())
+
+    def test_summits_only(self):
+        track = self._main('-s', '1')
+        np.testing.assert_allclose(track.lat, [44., 44.1, 44.1])
+        np.testing.assert_allclose(track.lon, [-74., -74., -73.9])
+
+
+if __name__ == '__main__':
+    unittest.main()
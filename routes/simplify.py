@@ -0,0 +1,115 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Simplifies GPX tracks with the Douglas-Peucker algorithm, dropping points that
+deviate less than a tolerance (in meters) from the simplified track.
+
+Prints the simplified GPX to stdout, and the number of points kept and the
+maximum deviation to stderr.
+
+Dev command:
+    python3 routes/simplify.py -t 5 routes/mixed-optimal.gpx > /tmp/mixed-optimal.gpx
+"""
+
+from __future__ import print_function
+import os
+import sys
+import argparse
+
+import numpy as np
+
+import gpx
+
+EARTH_RADIUS_METERS = 6371008.8
+
+
+def douglas_peucker(lat, lon, tolerance):
+    """Returns (mask of points to keep, max deviation in meters).
+
+    The first and last points are always kept.
+    """
+    n = len(lat)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep, 0.
+    # Equirectangular projection to meters, accurate enough at track scale.
+    lat0 = np.radians(np.mean(lat))
+    x = np.radians(lon) * EARTH_RADIUS_METERS * np.cos(lat0)
+    y = np.radians(lat) * EARTH_RADIUS_METERS
+    keep[[0, n - 1]] = True
+    max_deviation = 0.
+    stack = [(0, n - 1)]
+    while stack:
+        (start, end) = stack.pop()
+        if end - start < 2:
+            continue
+        deviations = _segment_distances(x[start + 1:end], y[start + 1:end],
+                                        x[start], y[start], x[end], y[end])
+        i = np.argmax(deviations)
+        if deviations[i] > tolerance:
+            keep[start + 1 + i] = True
+            stack.append((start, start + 1 + i))
+            stack.append((start + 1 + i, end))
+        else:
+            max_deviation = max(max_deviation, deviations[i])
+    return keep, max_deviation
+
+
+def simplify_track(track, tolerance):
+    """Simplifies each segment of a gpx.Track.
+
+    Returns (simplified track, max deviation in meters).
+    """
+    bounds = list(track.segments) + [len(track.lat)]
+    keep = np.zeros(len(track.lat), dtype=bool)
+    max_deviation = 0.
+    for (start, end) in zip(bounds, bounds[1:]):
+        (keep[start:end],
+         deviation) = douglas_peucker(track.lat[start:end],
+                                      track.lon[start:end], tolerance)
+        max_deviation = max(max_deviation, deviation)
+    kept_before = np.concatenate([[0], np.cumsum(keep)])
+    return gpx.Track(track.lat[keep], track.lon[keep], track.ele[keep],
+                     track.time[keep],
+                     kept_before[track.segments]), max_deviation
+
+
+def _segment_distances(x, y, x0, y0, x1, y1):
+    """Distances from points (x, y) to the segment (x0, y0) > (x1, y1)."""
+    (dx, dy) = (x1 - x0, y1 - y0)
+    length = dx * dx + dy * dy
+    if length == 0:
+        return np.hypot(x - x0, y - y0)
+    t = np.clip(((x - x0) * dx + (y - y0) * dy) / length, 0, 1)
+    return np.hypot(x - (x0 + t * dx), y - (y0 + t * dy))
+
+
+def main(arguments):
+
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('infile', help="GPX file", type=str)
+    parser.add_argument('-t',
+                        '--tolerance',
+                        help='Maximum deviation in meters',
+                        default=5.,
+                        type=float)
+
+    args = parser.parse_args(arguments)
+
+    track = gpx.read_track(args.infile)
+    (simplified, max_deviation) = simplify_track(track, args.tolerance)
+    gpx.write_track(sys.stdout, simplified)
+    print('Kept {} of {} points (max deviation {:.1f} m)'.format(
+        len(simplified.lat), len(track.lat), max_deviation),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,48 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Tests for simplify.py.
+"""
+
+import unittest
+import gpx
+import simplify
+import numpy as np
+
+# About 1.1 meters of latitude.
+METER = 1e-5
+
+
+class TestDouglasPeucker(unittest.TestCase):
+    def test_drops_collinear_points(self):
+        lat = np.linspace(44, 44.01, 101)
+        lon = np.full(101, -74.)
+        (keep, max_deviation) = simplify.douglas_peucker(lat, lon, 1)
+        self.assertEqual(list(np.nonzero(keep)[0]), [0, 100])
+        self.assertAlmostEqual(max_deviation, 0)
+
+    def test_keeps_deviating_points(self):
+        lat = np.array([44., 44.001, 44.002, 44.003])
+        lon = np.array([-74., -74. + 10 * METER, -74. + 2 * METER, -74.])
+        (keep, max_deviation) = simplify.douglas_peucker(lat, lon, 5)
+        self.assertEqual(list(keep), [True, True, False, True])
+        self.assertLess(max_deviation, 5)
+
+    def test_simplify_track_segments(self):
+        track = gpx.Track(lat=np.array([44., 44.001, 44.002, 45., 45.001]),
+                          lon=np.full(5, -74.),
+                          ele=np.arange(5.),
+                          time=np.arange(5.),
+                          segments=np.array([0, 3]))
+        (simplified, _) = simplify.simplify_track(track, 1)
+        self.assertEqual(list(simplified.ele), [0., 2., 3., 4.])
+        self.assertEqual(list(simplified.segments), [0, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
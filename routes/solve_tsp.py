@@ -18,19 +18,24 @@ from __future__ import print_function
 import os
 import sys
 import argparse
-import requests
 import csv
 import re
+from concurrent.futures import ProcessPoolExecutor
 
 from ortools.constraint_solver import routing_enums_pb2
 from ortools.constraint_solver import pywrapcp
 
 import common
+import local_search
+import lower_bound
+import numpy as np
 
 from io import StringIO
 
 
-def main(arguments):
+def main(arguments, distances=None):
+    """Runs the solver. `distances` is an already loaded and merged matrix
+    to use instead of -d and -pw, as pipeline.py passes."""
     parser = argparse.ArgumentParser(
         description=__doc__,
         formatter_class=argparse.RawDescriptionHelpFormatter)
@@ -43,77 +48,482 @@ def main(arguments):
         '--pairwise_distances',
         help='csv file containing pairwise distances between peaks',
         type=argparse.FileType('r'))
+    parser.add_argument(
+        '-ps',
+        '--peak_sequence',
+        help='Peak sequence to start the search from (e.g. '
+        'routes/mixed-optimal-ps.txt), reporting how the route changed',
+        type=argparse.FileType('r'))
+    parser.add_argument('--cache_dir',
+                        help='Directory for cached distance matrices',
+                        default=common.DEFAULT_CACHE_DIR,
+                        type=str)
+    parser.add_argument(
+        '--offline',
+        help='Use the cached distance matrix without checking for updates',
+        action='store_true')
+    parser.add_argument('--solver',
+                        help='TSP solver backend',
+                        choices=['ortools', 'local_search'],
+                        default='ortools')
+    parser.add_argument(
+        '--time_limit',
+        help='Search time limit in seconds (default: 30 for ortools, 1 for '
+        'local_search)',
+        type=float)
+    parser.add_argument(
+        '--multi_start',
+        help='Number of differently configured OR-Tools searches to run in '
+        'parallel, keeping the best route',
+        default=1,
+        type=int)
+    parser.add_argument(
+        '--max_stale',
+        help='Stop local_search after this many kicks without improvement',
+        default=50,
+        type=int)
+    parser.add_argument(
+        '--gap',
+        help='Stop once the route is proven to be within this fraction of '
+        'optimal',
+        default=0.005,
+        type=float)
+    parser.add_argument(
+        '--no_lower_bound',
+        help='Skip computing a lower bound (and stopping early on the gap)',
+        action='store_true')
+    parser.add_argument(
+        '--sweep',
+        help='Solve for this many blends of mileage and climbing, from '
+        'climbing only to mileage only, and print the Pareto frontier',
+        type=int)
+    parser.add_argument(
+        '--warm_time_limit',
+        help='Search time limit in seconds for solves warm-started from '
+        '--peak_sequence or, in a sweep, the previous blend\'s route '
+        '(default: a fifth of --time_limit)',
+        type=float)
+    parser.add_argument(
+        '--sweep_dir',
+        help='Directory to write the peak sequences of the Pareto frontier to',
+        type=str)
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        help='Number of sweep chains to run in parallel (default: one per '
+        'CPU)',
+        type=int)
+    common.add_trace_arguments(parser)
 
     args = parser.parse_args(arguments)
+    common.trace_from_args(args)
+    tracer = common.TRACER
 
-    response = requests.get(args.distance_matrix)
-    assert response.status_code == 200, 'Download failed'
+    if args.sweep:
+        with tracer.span('sweep', blends=args.sweep):
+            return _sweep(args)
 
-    reader = csv.reader(StringIO(response.content.decode("utf-8")))
     print('Using cost function:',
           common.DEFAULT_COST.__name__,
           file=sys.stderr)
-    distance_matrix = common.parse_distance_matrix(reader, common.DEFAULT_COST)
+    distance_matrix = distances
+    if distance_matrix is None:
+        distance_matrix = common.load_distance_matrix(args.distance_matrix,
+                                                      common.DEFAULT_COST,
+                                                      cache_dir=args.cache_dir,
+                                                      offline=args.offline)
 
-    # Parse pairwise distances
-    pairs_distances = common.parse_distance_matrix_from_pairs(
-        csv.reader(args.pairwise_distances))
-    distance_matrix = common.merge_pairwise_and_matrix_distances(
-        pairs_distances, distance_matrix)
+        # Parse pairwise distances
+        pairs_distances = common.parse_distance_matrix_from_pairs(
+            csv.reader(args.pairwise_distances))
+        distance_matrix = common.merge_pairwise_and_matrix_distances(
+            pairs_distances, distance_matrix)
     peaks = list(distance_matrix.keys())
+    depot = len(distance_matrix) - 1  # trailhead
+
+    with tracer.span('cost_matrix'):
+        costs = common.cost_matrix(distance_matrix, common.DEFAULT_COST,
+                                   peaks)
+    initial_route = None
+    if args.peak_sequence:
+        initial_route = _read_route(args.peak_sequence, peaks, depot)
+    time_limit = _time_limit(args, warm=initial_route is not None)
+    (bound, target) = (None, None)
+    if not args.no_lower_bound:
+        with tracer.span('lower_bound'):
+            bound = lower_bound.held_karp_bound(
+                costs,
+                upper_bound=None if initial_route is None else
+                local_search.tour_cost(costs, np.array(initial_route[:-1])))
+        # Any route costing at most `target` is within the gap.
+        target = int(bound / (1 - args.gap))
+        print('Lower bound: {:.0f}'.format(bound), file=sys.stderr)
+    search = tracer.span('search',
+                         solver=args.solver,
+                         multi_start=args.multi_start)
+    if args.solver == 'local_search':
+        with search:
+            tour = local_search.solve(
+                costs,
+                depot,
+                time_limit=time_limit,
+                initial_tour=None
+                if initial_route is None else initial_route[:-1],
+                max_stale=args.max_stale,
+                target=target)
+        route = [int(node) for node in tour] + [depot]
+    elif args.multi_start > 1:
+        # Workers run in other processes, so only the whole search is traced.
+        with search:
+            route = _solve_multi_start(costs, depot, time_limit,
+                                       args.multi_start, initial_route,
+                                       target)
+    else:
+        with search:
+            (route, _) = _solve_ortools(costs,
+                                        depot,
+                                        time_limit,
+                                        initial_route=initial_route,
+                                        bound=bound,
+                                        target=target)
+
+    if route:
+        _print_solution(route, peaks, distance_matrix)
+        if bound is not None:
+            objective = int(costs[route[:-1], route[1:]].sum())
+            print('Proven gap: {:.2%} (Objective value {}, lower bound '
+                  '{:.0f})'.format(lower_bound.gap(objective, bound),
+                                   objective, bound),
+                  file=sys.stderr)
+        if initial_route is not None:
+            _print_route_change(initial_route, route, distance_matrix)
+
+
+def _time_limit(args, warm=False):
+    time_limit = args.time_limit or (1 if args.solver == 'local_search' else
+                                     30)
+    if warm:
+        return args.warm_time_limit or time_limit / 5
+    return time_limit
+
+
+def _read_route(peak_sequence, peaks, depot):
+    """Reads a peak sequence file into a route of node indices from and back
+    to the depot."""
+    index = {p: i for (i, p) in enumerate(peaks)}
+    names = [line.strip() for line in peak_sequence if line.strip()]
+    for name in names:
+        assert name in index, 'Unknown peak: {}'.format(name)
+    route = [index[name] for name in names]
+    if route[0] != depot:
+        route.insert(0, depot)
+    if route[-1] != depot:
+        route.append(depot)
+    assert sorted(route[:-1]) == list(range(len(peaks))), (
+        'Peak sequence must visit every peak once')
+    return route
+
+
+def _print_route_change(initial_route, route, distances):
+    """Prints how `route` differs from the route the search started from."""
+    def legs(r):
+        return set(zip(r, r[1:]))
+
+    def objective(r):
+        return common.DEFAULT_COST(
+            tuple(a[r[:-1], r[1:]].sum()
+                  for a in (distances.distance, distances.gain,
+                            distances.loss)))
+
+    (before, after) = (objective(initial_route), objective(route))
+    if legs(route) == legs(initial_route):
+        print('Route unchanged (Objective value: {})'.format(after),
+              file=sys.stderr)
+    else:
+        print('Route changed: {} of {} legs differ (Objective value: {} to '
+              '{}, {:+d})'.format(len(legs(route) - legs(initial_route)),
+                              len(route) - 1, before, after, after - before),
+              file=sys.stderr)
+
+
+def _solve_ortools(costs,
+                   depot,
+                   time_limit,
+                   first_solution_strategy='SAVINGS',
+                   metaheuristic='GUIDED_LOCAL_SEARCH',
+                   seed=0,
+                   log_search=True,
+                   initial_route=None,
+                   bound=None,
+                   target=None):
+    """Returns (route, objective value) of the solution found by OR-Tools,
+    where route lists node indices from and back to the depot.
+
+    A nonzero `seed` shuffles node order, which changes the search path. The
+    search starts from `initial_route`, if given, and stops once a solution
+    costs at most `target`. Each solution's gap to the lower `bound` is
+    printed.
+    """
+    permutation = np.arange(len(costs))
+    if seed:
+        permutation = np.random.RandomState(seed).permutation(len(costs))
+    inverse = np.argsort(permutation)
+    costs = np.asarray(costs)[permutation][:, permutation].tolist()
 
     manager = pywrapcp.RoutingIndexManager(
-        len(distance_matrix),
+        len(costs),
         1,  # num_vehicles
-        len(distance_matrix) - 1)  # trailhead
+        int(np.nonzero(permutation == depot)[0][0]))
 
     routing = pywrapcp.RoutingModel(manager)
 
-    def distance_callback(from_index, to_index):
-        """Returns the distance between the two nodes."""
-        # Convert from routing variable Index to distance matrix NodeIndex.
-        from_node = manager.IndexToNode(from_index)
-        to_node = manager.IndexToNode(to_index)
-        return common.DEFAULT_COST(
-            distance_matrix[peaks[from_node]][peaks[to_node]])
-
-    transit_callback_index = routing.RegisterTransitCallback(distance_callback)
+    # Registering the matrix keeps arc cost evaluation out of Python.
+    transit_callback_index = routing.RegisterTransitMatrix(costs)
     routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
 
     search_parameters = pywrapcp.DefaultRoutingSearchParameters()
-    search_parameters.first_solution_strategy = (
-        routing_enums_pb2.FirstSolutionStrategy.SAVINGS)
-    search_parameters.local_search_metaheuristic = (
-        routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH)
-    search_parameters.time_limit.seconds = 30
-    search_parameters.log_search = True
+    search_parameters.first_solution_strategy = getattr(
+        routing_enums_pb2.FirstSolutionStrategy, first_solution_strategy)
+    search_parameters.local_search_metaheuristic = getattr(
+        routing_enums_pb2.LocalSearchMetaheuristic, metaheuristic)
+    search_parameters.time_limit.FromMilliseconds(int(time_limit * 1000))
+    search_parameters.log_search = log_search
 
-    assignment = routing.SolveWithParameters(search_parameters)
+    def on_solution():
+        objective = routing.CostVar().Max()
+        # Traces the objective over time, with the search effort so far.
+        common.TRACER.sample('objective',
+                             objective=objective,
+                             branches=routing.solver().Branches(),
+                             failures=routing.solver().Failures())
+        if bound is not None:
+            print('Solution: {} (gap {:.2%})'.format(
+                objective, lower_bound.gap(objective, bound)),
+                  file=sys.stderr)
+        if target is not None and objective <= target:
+            routing.solver().FinishCurrentSearch()
 
-    if assignment:
-        _print_solution(manager, routing, assignment, peaks, distance_matrix)
+    routing.AddAtSolutionCallback(on_solution)
 
-
-def _print_solution(manager, routing, assignment, peaks, distances):
-    """Prints assignment on console."""
+    if initial_route is None:
+        assignment = routing.SolveWithParameters(search_parameters)
+    else:
+        initial_assignment = routing.ReadAssignmentFromRoutes(
+            [[manager.NodeToIndex(int(inverse[node]))
+              for node in initial_route[1:-1]]], True)
+        assignment = routing.SolveFromAssignmentWithParameters(
+            initial_assignment, search_parameters)
+    if not assignment:
+        return None, None
     index = routing.Start(0)
-    route_distance = (0, 0, 0)
+    route = [manager.IndexToNode(index)]
     while not routing.IsEnd(index):
-        print(peaks[manager.IndexToNode(index)], file=sys.stdout)
-        previous_index = index
         index = assignment.Value(routing.NextVar(index))
-        edge_distance = distances[peaks[manager.IndexToNode(previous_index)]][
-            peaks[manager.IndexToNode(index)]]
+        route.append(manager.IndexToNode(index))
+    return ([int(permutation[node]) for node in route],
+            assignment.ObjectiveValue())
+
+
+# (first solution strategy, metaheuristic) pairs tried by multi-start workers,
+# in order; later workers reuse them with different seeds.
+_MULTI_START_CONFIGS = [
+    ('SAVINGS', 'GUIDED_LOCAL_SEARCH'),
+    ('PATH_CHEAPEST_ARC', 'GUIDED_LOCAL_SEARCH'),
+    ('SEQUENTIAL_CHEAPEST_INSERTION', 'GUIDED_LOCAL_SEARCH'),
+    ('PARALLEL_CHEAPEST_INSERTION', 'GUIDED_LOCAL_SEARCH'),
+    ('SAVINGS', 'SIMULATED_ANNEALING'),
+    ('PATH_CHEAPEST_ARC', 'TABU_SEARCH'),
+    ('GLOBAL_CHEAPEST_ARC', 'GUIDED_LOCAL_SEARCH'),
+    ('LOCAL_CHEAPEST_INSERTION', 'TABU_SEARCH'),
+]
+
+# Cost matrix shared with multi-start workers, set once per process.
+_worker_costs = None
+
+
+def _init_worker(costs):
+    global _worker_costs
+    _worker_costs = costs
+
+
+def _multi_start_worker(args):
+    (depot, time_limit, first_solution_strategy, metaheuristic, seed,
+     initial_route, target) = args
+    return _solve_ortools(_worker_costs,
+                          depot,
+                          time_limit,
+                          first_solution_strategy,
+                          metaheuristic,
+                          seed,
+                          log_search=False,
+                          initial_route=initial_route,
+                          target=target)
+
+
+def _solve_multi_start(costs,
+                       depot,
+                       time_limit,
+                       workers,
+                       initial_route=None,
+                       target=None):
+    """Runs `workers` differently configured OR-Tools searches in parallel and
+    returns the best route."""
+    configs = [(depot, time_limit) +
+               _MULTI_START_CONFIGS[i % len(_MULTI_START_CONFIGS)] +
+               (i // len(_MULTI_START_CONFIGS), initial_route, target)
+               for i in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=_init_worker,
+                             initargs=(costs, )) as executor:
+        results = list(executor.map(_multi_start_worker, configs))
+    for (config, (_, objective)) in zip(configs, results):
+        print('Worker ({}, {}, seed {}): objective {}'.format(
+            *(config[2:5] + (objective, ))),
+              file=sys.stderr)
+    solved = [r for r in results if r[0] is not None]
+    if not solved:
+        return None
+    return min(solved, key=lambda r: r[1])[0]
+
+
+def _sweep_weights(n):
+    """Returns n (mileage weight, climbing weight) pairs from climbing only to
+    mileage only; the middle of an odd sweep is mixed_cost."""
+    if n == 1:
+        return [(1., 1.)]
+    return [(2. * i / (n - 1), 2. - 2. * i / (n - 1)) for i in range(n)]
+
+
+def _sweep_chain(args):
+    """Solves a chain of cost matrices in order, warm-starting each solve from
+    the previous route, and returns the routes."""
+    (solver, depot, time_limit, warm_time_limit, max_stale, chain) = args
+    routes = []
+    route = None
+    for costs in chain:
+        limit = time_limit if route is None else warm_time_limit
+        if solver == 'local_search':
+            tour = local_search.solve(
+                costs,
+                depot,
+                time_limit=limit,
+                initial_tour=None if route is None else route[:-1],
+                max_stale=max_stale)
+            route = [int(node) for node in tour] + [depot]
+        else:
+            (solved, _) = _solve_ortools(costs,
+                                         depot,
+                                         limit,
+                                         log_search=False,
+                                         initial_route=route)
+            route = solved or route
+        routes.append(route)
+    return routes
+
+
+def pareto_frontier(candidates):
+    """Returns the candidates, (route, (miles, gain, loss), ...) tuples, that
+    no other candidate beats on both miles and gain, by increasing miles.
+
+    Candidates with equal totals are only returned once.
+    """
+    frontier = []
+    for candidate in sorted(candidates, key=lambda c: c[1][:2]):
+        if not frontier or candidate[1][1] < frontier[-1][1][1]:
+            frontier.append(candidate)
+    return frontier
+
+
+def _sweep(args):
+    """Solves for blends of mileage and climbing cost, and prints the Pareto
+    frontier of the distinct routes found.
+
+    The blends are split into contiguous chains solved in parallel; within a
+    chain each solve is warm-started from the previous blend's route, which
+    is usually close to optimal already.
+    """
+    (time_limit, warm_time_limit) = (_time_limit(args),
+                                     _time_limit(args, warm=True))
+    pairs_distances = None
+    if args.pairwise_distances:
+        pairs_distances = common.parse_distance_matrix_from_pairs(
+            csv.reader(args.pairwise_distances))
+
+    cost_functions = [
+        common.weighted_cost(*weights)
+        for weights in _sweep_weights(args.sweep)
+    ]
+    matrices = []
+    for (i, cost_function) in enumerate(cost_functions):
+        # The sheet only needs revalidating once.
+        distance_matrix = common.load_distance_matrix(
+            args.distance_matrix,
+            cost_function,
+            cache_dir=args.cache_dir,
+            offline=args.offline or i > 0)
+        if pairs_distances is not None:
+            distance_matrix = common.merge_pairwise_and_matrix_distances(
+                pairs_distances, distance_matrix)
+        matrices.append(distance_matrix)
+    peaks = list(matrices[0].keys())
+    depot = len(peaks) - 1  # trailhead
+
+    costs = [
+        common.cost_matrix(m, f, peaks)
+        for (m, f) in zip(matrices, cost_functions)
+    ]
+    jobs = min(args.jobs or os.cpu_count() or 1, len(costs))
+    chains = np.array_split(np.arange(len(costs)), jobs)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        routes = sum(
+            executor.map(_sweep_chain,
+                         [(args.solver, depot, time_limit, warm_time_limit,
+                           args.max_stale, [costs[i] for i in chain])
+                          for chain in chains]), [])
+
+    candidates = []
+    for (route, distance_matrix, cost_function) in zip(
+            routes, matrices, cost_functions):
+        if route is None:
+            print('{}: no solution'.format(cost_function.__name__),
+                  file=sys.stderr)
+            continue
+        totals = tuple(
+            float(a[route[:-1], route[1:]].sum())
+            for a in (distance_matrix.distance, distance_matrix.gain,
+                      distance_matrix.loss))
+        print('{}: {:.1f} miles, +{:.0f} ft / -{:.0f} ft'.format(
+            cost_function.__name__, *totals),
+              file=sys.stderr)
+        candidates.append((route, totals, cost_function.__name__))
+
+    print('Pareto frontier:')
+    for (route, totals, name) in pareto_frontier(candidates):
+        print('{}: {:.1f} miles, +{:.0f} ft / -{:.0f} ft'.format(
+            name, *totals))
+        if args.sweep_dir:
+            if not os.path.isdir(args.sweep_dir):
+                os.makedirs(args.sweep_dir)
+            with open(os.path.join(args.sweep_dir, name + '-ps.txt'),
+                      'w') as f:
+                f.writelines(peaks[node] + '\n' for node in route)
+
+
+def _print_solution(route, peaks, distances):
+    """Prints route on console."""
+    route_distance = (0, 0, 0)
+    for (previous, node) in zip(route, route[1:]):
+        print(peaks[previous], file=sys.stdout)
+        edge_distance = distances[peaks[previous]][peaks[node]]
 
         route_distance = tuple(map(sum, zip(route_distance, edge_distance)))
         print(
             '{0:<25}     >     {1: <25} ({2:.1f} miles, +{3:.0f} ft / -{4:.0f} ft)'
-            .format(peaks[manager.IndexToNode(previous_index)],
-                    peaks[manager.IndexToNode(index)], edge_distance[0],
+            .format(peaks[previous], peaks[node], edge_distance[0],
                     edge_distance[1], edge_distance[2]),
             file=sys.stderr)
-    print(peaks[manager.IndexToNode(index)], file=sys.stdout)
-    print('Optimal route computed (Objective value: {})'.format(
+    print(peaks[route[-1]], file=sys.stdout)
+    print('Route computed (Objective value: {})'.format(
         common.DEFAULT_COST(route_distance)),
           file=sys.stderr)
 
@@ -0,0 +1,54 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Tests for solve_tsp.py.
+"""
+
+import unittest
+import solve_tsp
+import numpy as np
+
+
+class TestSweep(unittest.TestCase):
+    def test_weights(self):
+        self.assertEqual(solve_tsp._sweep_weights(3),
+                         [(0., 2.), (1., 1.), (2., 0.)])
+        self.assertEqual(solve_tsp._sweep_weights(1), [(1., 1.)])
+
+    def test_pareto_frontier(self):
+        candidates = [
+            ([0, 1, 2, 0], (10., 300., 300.), 'a'),
+            ([0, 2, 1, 0], (12., 200., 200.), 'b'),
+            ([0, 2, 1, 0], (12., 200., 200.), 'c'),
+            ([0, 1, 2, 0], (13., 250., 250.), 'd'),
+            ([0, 1, 2, 0], (14., 100., 100.), 'e'),
+        ]
+        self.assertEqual(
+            [c[2] for c in solve_tsp.pareto_frontier(candidates)],
+            ['a', 'b', 'e'])
+
+    def test_warm_start(self):
+        costs = np.random.RandomState(46).randint(1, 100, (8, 8))
+        (route, objective) = solve_tsp._solve_ortools(costs,
+                                                      7,
+                                                      0.5,
+                                                      log_search=False)
+        (warm_route,
+         warm_objective) = solve_tsp._solve_ortools(costs,
+                                                    7,
+                                                    0.1,
+                                                    seed=3,
+                                                    log_search=False,
+                                                    initial_route=route)
+        self.assertEqual(warm_route[0], 7)
+        self.assertEqual(sorted(warm_route[:-1]), list(range(8)))
+        self.assertLessEqual(warm_objective, objective)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,279 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Indexes the USGS topo quads in maps/*.kmz, and bundles the parts of them a
+route passes through into a single KMZ.
+
+Each quad is indexed from its zip directory, the ground overlay bounds in its
+KML and the frame header of its JPEG, without reading the rest of the image.
+Quads are only decoded (with Pillow, if installed) when a crop of them is
+needed, and decoded images and crops are kept in small LRU caches. Without
+Pillow, bundles include the whole image of each quad the route passes
+through, copied without decoding.
+
+Dev command:
+    python3 routes/topo_maps.py routes/2019-fkt-combined.gpx -o /tmp/2019-fkt-maps.kmz
+"""
+
+from __future__ import print_function
+import os
+import sys
+import argparse
+import functools
+import glob
+import io
+import struct
+import xml.etree.ElementTree as ET
+import zipfile
+from collections import namedtuple
+
+import numpy as np
+
+import gpx
+import track_store
+
+MAPS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'maps')
+
+_KML = {'kml': 'http://www.opengis.net/kml/2.2'}
+
+# JPEG start of frame markers, which hold the image size.
+_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# Bounds are in degrees, and the image size in pixels.
+Quad = namedtuple('Quad', [
+    'path', 'name', 'image', 'north', 'south', 'east', 'west', 'width',
+    'height'
+])
+
+
+def jpeg_size(f):
+    """Returns (width, height) of the JPEG read from `f`, from its frame
+    header."""
+    assert f.read(2) == b'\xff\xd8', 'Not a JPEG'
+    while True:
+        marker = f.read(2)
+        # Markers may be padded with any number of 0xff bytes.
+        while marker[1:] == b'\xff':
+            marker = marker[1:] + f.read(1)
+        assert len(marker) == 2 and marker[0] == 0xff, 'No JPEG frame header'
+        (length, ) = struct.unpack('>H', f.read(2))
+        if marker[1] in _SOF_MARKERS:
+            (height, width) = struct.unpack('>xHH', f.read(5))
+            return width, height
+        f.read(length - 2)
+
+
+def read_quad(path):
+    """Reads a KMZ's ground overlay into a Quad, touching only its zip
+    directory, its KML and the header of its image."""
+    with zipfile.ZipFile(path) as kmz:
+        kml_name = next(n for n in kmz.namelist() if n.endswith('.kml'))
+        document = ET.fromstring(kmz.read(kml_name))
+        overlay = document.find('.//kml:GroundOverlay', _KML)
+        image = overlay.find('kml:Icon/kml:href', _KML).text
+        box = overlay.find('kml:LatLonBox', _KML)
+        with kmz.open(image) as f:
+            (width, height) = jpeg_size(f)
+    return Quad(path,
+                document.find('kml:Document/kml:name', _KML).text, image,
+                *(float(box.find('kml:' + side, _KML).text)
+                  for side in ('north', 'south', 'east', 'west')), width,
+                height)
+
+
+class QuadIndex(object):
+    """Bounding box index over quads."""
+    def __init__(self, quads):
+        self.quads = list(quads)
+        # (south, west, north, east) of each quad.
+        self._bounds = np.array([(q.south, q.west, q.north, q.east)
+                                 for q in self.quads]).reshape(-1, 4)
+
+    @classmethod
+    def from_directory(cls, maps_dir=MAPS_DIR):
+        return cls(
+            read_quad(path)
+            for path in sorted(glob.glob(os.path.join(maps_dir, '*.kmz'))))
+
+    def query(self, south, west, north, east):
+        """Returns the quads intersecting a bounding box."""
+        (s, w, n, e) = self._bounds.T
+        hits = (s <= north) & (n >= south) & (w <= east) & (e >= west)
+        return [self.quads[i] for i in np.nonzero(hits)[0]]
+
+    def covering(self, lat, lon, margin=0.):
+        """Returns the quads within `margin` degrees of any of the points, with
+        the bounding box (south, west, north, east) of those points, grown by
+        the margin, in each."""
+        (lat, lon) = (np.asarray(lat, dtype=float),
+                      np.asarray(lon, dtype=float))
+        (s, w, n, e) = self._bounds.T
+        inside = ((lat[:, np.newaxis] >= s - margin)
+                  & (lat[:, np.newaxis] <= n + margin)
+                  & (lon[:, np.newaxis] >= w - margin)
+                  & (lon[:, np.newaxis] <= e + margin))
+        covering = []
+        for i in np.nonzero(inside.any(axis=0))[0]:
+            (plat, plon) = (lat[inside[:, i]], lon[inside[:, i]])
+            covering.append((self.quads[i],
+                             (plat.min() - margin, plon.min() - margin,
+                              plat.max() + margin, plon.max() + margin)))
+        return covering
+
+
+def pixel_window(quad, south, west, north, east):
+    """Returns the (left, top, right, bottom) pixel box of a quad's image
+    covering a bounding box, clipped to the image."""
+    # Rounded so that bounds on pixel edges don't gain a pixel.
+    def x(lon):
+        return round((lon - quad.west) / (quad.east - quad.west) * quad.width,
+                     6)
+
+    def y(lat):
+        return round(
+            (quad.north - lat) / (quad.north - quad.south) * quad.height, 6)
+
+    return (int(np.clip(np.floor(x(west)), 0, quad.width)),
+            int(np.clip(np.floor(y(north)), 0, quad.height)),
+            int(np.clip(np.ceil(x(east)), 0, quad.width)),
+            int(np.clip(np.ceil(y(south)), 0, quad.height)))
+
+
+def window_bounds(quad, window):
+    """Returns the (south, west, north, east) bounds of a pixel box."""
+    (left, top, right, bottom) = window
+    lon_per_pixel = (quad.east - quad.west) / quad.width
+    lat_per_pixel = (quad.north - quad.south) / quad.height
+    return (quad.north - bottom * lat_per_pixel,
+            quad.west + left * lon_per_pixel,
+            quad.north - top * lat_per_pixel,
+            quad.west + right * lon_per_pixel)
+
+
+def read_image(quad):
+    """Returns the JPEG bytes of a quad's image, reading only that member."""
+    with zipfile.ZipFile(quad.path) as kmz:
+        return kmz.read(quad.image)
+
+
+@functools.lru_cache(maxsize=2)
+def _decode(quad):
+    # A decoded 5300 x 5300 quad takes about 80 MB, so only a couple are kept.
+    from PIL import Image
+    image = Image.open(io.BytesIO(read_image(quad)))
+    image.load()
+    return image
+
+
+@functools.lru_cache(maxsize=64)
+def crop(quad, window):
+    """Returns a pixel box of a quad's image, as a Pillow image."""
+    return _decode(quad).crop(window)
+
+
+def can_crop():
+    try:
+        import PIL
+    except ImportError:
+        return False
+    return True
+
+
+def write_bundle(out, track, index, margin=0.01, name='46er FKT attempt'):
+    """Writes a KMZ to the file `out`, with the track and the parts of the
+    quads within `margin` degrees of it as ground overlays. Returns the
+    (quad, pixel box) of each overlay."""
+    overlays = []
+    document = ET.Element('kml', xmlns=_KML['kml'])
+    folder = ET.SubElement(document, 'Document')
+    ET.SubElement(folder, 'name').text = name
+    with zipfile.ZipFile(out, 'w') as kmz:
+        for (i, (quad, bounds)) in enumerate(
+                index.covering(track.lat, track.lon, margin)):
+            if can_crop():
+                window = pixel_window(quad, *bounds)
+                data = io.BytesIO()
+                crop(quad, window).save(data, format='JPEG', quality=90)
+                data = data.getvalue()
+            else:
+                window = (0, 0, quad.width, quad.height)
+                data = read_image(quad)
+            image = 'images/{}.jpg'.format(i)
+            # JPEGs don't compress any further.
+            kmz.writestr(image, data, compress_type=zipfile.ZIP_STORED)
+            overlays.append((quad, window))
+            overlay = ET.SubElement(folder, 'GroundOverlay')
+            ET.SubElement(overlay, 'name').text = quad.name
+            ET.SubElement(ET.SubElement(overlay, 'Icon'), 'href').text = image
+            box = ET.SubElement(overlay, 'LatLonBox')
+            for (side, value) in zip(('south', 'west', 'north', 'east'),
+                                     window_bounds(quad, window)):
+                ET.SubElement(box, side).text = repr(value)
+        placemark = ET.SubElement(folder, 'Placemark')
+        ET.SubElement(placemark, 'name').text = name
+        ET.SubElement(ET.SubElement(placemark, 'LineString'),
+                      'coordinates').text = ' '.join(
+                          '{:.6f},{:.6f}'.format(lon, lat)
+                          for (lat, lon) in zip(track.lat, track.lon))
+        kmz.writestr('doc.kml',
+                     ET.tostring(document, encoding='utf-8'),
+                     compress_type=zipfile.ZIP_DEFLATED)
+    return overlays
+
+
+def main(arguments):
+
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('infiles', help="GPX files", nargs='+', type=str)
+    parser.add_argument('-o',
+                        '--output',
+                        help='KMZ file to write the route and its maps to',
+                        type=str)
+    parser.add_argument('-m',
+                        '--margin',
+                        help='Degrees of map to include around the route',
+                        default=0.01,
+                        type=float)
+    parser.add_argument('--maps_dir',
+                        help='Directory of KMZ quads',
+                        default=MAPS_DIR,
+                        type=str)
+    parser.add_argument('--store_dir',
+                        help='Directory of converted tracks',
+                        default=track_store.DEFAULT_STORE_DIR,
+                        type=str)
+
+    args = parser.parse_args(arguments)
+
+    index = QuadIndex.from_directory(args.maps_dir)
+    tracks = [track_store.load_track(f, args.store_dir) for f in args.infiles]
+    track = gpx.Track(*(np.concatenate([getattr(t, field) for t in tracks])
+                        for field in ('lat', 'lon', 'ele', 'time')),
+                      np.array([0]))
+
+    if args.output is None:
+        for (quad, bounds) in index.covering(track.lat, track.lon,
+                                             args.margin):
+            print('{}: {}'.format(os.path.basename(quad.path),
+                                  pixel_window(quad, *bounds)))
+        return
+    if not can_crop():
+        print('Pillow is not installed, so whole quads are included',
+              file=sys.stderr)
+    with open(args.output, 'wb') as out:
+        overlays = write_bundle(out, track, index, args.margin)
+    for (quad, window) in overlays:
+        print('{}: {}'.format(os.path.basename(quad.path), window),
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
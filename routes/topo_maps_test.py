@@ -0,0 +1,184 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Tests for topo_maps.py.
+"""
+
+import unittest
+import gpx
+import io
+import os
+import shutil
+import struct
+import tempfile
+import topo_maps
+import xml.etree.ElementTree as ET
+import zipfile
+import numpy as np
+
+from unittest import mock
+
+KML = """<?xml version="1.0" encoding="iso-8859-1"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+<Document>
+<name>{name}</name>
+<GroundOverlay>
+  <Icon><href>{name}.jpg</href></Icon>
+  <LatLonBox>
+    <north>{north}</north><south>{south}</south>
+    <east>{east}</east><west>{west}</west>
+  </LatLonBox>
+</GroundOverlay>
+</Document>
+</kml>
+"""
+
+
+def _jpeg_header(width, height):
+    """Returns the start of a JPEG, up to its frame header."""
+    return (b'\xff\xd8' + b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\0' +
+            b'\0' * 9 + b'\xff\xff\xc0' +
+            struct.pack('>HBHHB', 11, 8, height, width, 1) + b'\1\x11\0' +
+            b'\xff\xd9')
+
+
+def _write_kmz(path, name, south, west, north, east, width, height):
+    with zipfile.ZipFile(path, 'w') as kmz:
+        kmz.writestr(
+            'doc.kml',
+            KML.format(name=name,
+                       north=north,
+                       south=south,
+                       east=east,
+                       west=west))
+        kmz.writestr(name + '.jpg', _jpeg_header(width, height))
+
+
+class TestQuadIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # Two quads side by side, the western one twice as wide in pixels.
+        _write_kmz(os.path.join(self.directory, 'a.kmz'), 'a', 44., -74.,
+                   44.25, -73.75, 2000, 1000)
+        _write_kmz(os.path.join(self.directory, 'b.kmz'), 'b', 44., -73.75,
+                   44.25, -73.5, 1000, 1000)
+        self.index = topo_maps.QuadIndex.from_directory(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_reads_quads(self):
+        self.assertEqual([(q.name, q.south, q.east, q.width, q.height)
+                          for q in self.index.quads],
+                         [('a', 44., -73.75, 2000, 1000),
+                          ('b', 44., -73.5, 1000, 1000)])
+
+    def test_query(self):
+        self.assertEqual(
+            [q.name for q in self.index.query(44.1, -73.8, 44.2, -73.7)],
+            ['a', 'b'])
+        self.assertEqual(
+            [q.name for q in self.index.query(44.1, -73.6, 44.2, -73.55)],
+            ['b'])
+        self.assertEqual(self.index.query(45, -74, 45.1, -73.9), [])
+
+    def test_covering(self):
+        covering = self.index.covering([44.1, 44.2, 45.], [-73.9, -73.8, -73.])
+        self.assertEqual(len(covering), 1)
+        (quad, bounds) = covering[0]
+        self.assertEqual(quad.name, 'a')
+        np.testing.assert_allclose(bounds, (44.1, -73.9, 44.2, -73.8))
+        self.assertEqual(
+            [q.name for (q, _) in self.index.covering([44.1], [-73.76], 0.02)],
+            ['a', 'b'])
+
+    def test_pixel_window(self):
+        quad = self.index.quads[0]
+        window = topo_maps.pixel_window(quad, 44.1, -73.9, 44.2, -73.8)
+        self.assertEqual(window, (800, 200, 1600, 600))
+        np.testing.assert_allclose(topo_maps.window_bounds(quad, window),
+                                   (44.1, -73.9, 44.2, -73.8))
+        self.assertEqual(
+            topo_maps.pixel_window(quad, 43., -75., 45., -73.),
+            (0, 0, 2000, 1000))
+
+    def test_bundle_without_cropping(self):
+        track = gpx.Track(np.array([44.1, 44.2]), np.array([-73.9, -73.8]),
+                          np.full(2, np.nan), np.full(2, np.nan),
+                          np.array([0]))
+        out = io.BytesIO()
+        with mock.patch.object(topo_maps, 'can_crop', return_value=False):
+            overlays = topo_maps.write_bundle(out, track, self.index)
+        self.assertEqual([(q.name, w) for (q, w) in overlays],
+                         [('a', (0, 0, 2000, 1000))])
+        with zipfile.ZipFile(io.BytesIO(out.getvalue())) as kmz:
+            self.assertEqual(kmz.read('images/0.jpg'),
+                             _jpeg_header(2000, 1000))
+            self.assertIn(b'-73.900000,44.100000', kmz.read('doc.kml'))
+
+    def test_bundle_with_cropping(self):
+        crops = []
+
+        class StubImage(object):
+            def crop(self, window):
+                crops.append(window)
+                return self
+
+            def save(self, f, format, quality):
+                f.write(b'cropped')
+
+        track = gpx.Track(np.array([44.1, 44.2]), np.array([-73.9, -73.8]),
+                          np.full(2, np.nan), np.full(2, np.nan),
+                          np.array([0]))
+        out = io.BytesIO()
+        topo_maps.crop.cache_clear()
+        with mock.patch.object(topo_maps, 'can_crop', return_value=True), \
+                mock.patch.object(topo_maps, '_decode',
+                                  return_value=StubImage()) as decode:
+            overlays = topo_maps.write_bundle(out, track, self.index, 0.)
+            # Crops are cached.
+            topo_maps.write_bundle(io.BytesIO(), track, self.index, 0.)
+        topo_maps.crop.cache_clear()
+        decode.assert_called_once_with(self.index.quads[0])
+        self.assertEqual(crops, [(800, 200, 1600, 600)])
+        self.assertEqual([(q.name, w) for (q, w) in overlays],
+                         [('a', (800, 200, 1600, 600))])
+        with zipfile.ZipFile(io.BytesIO(out.getvalue())) as kmz:
+            self.assertEqual(kmz.read('images/0.jpg'), b'cropped')
+            box = ET.fromstring(kmz.read('doc.kml')).find(
+                './/kml:LatLonBox', topo_maps._KML)
+            np.testing.assert_allclose(
+                [float(box.find('kml:' + side, topo_maps._KML).text)
+                 for side in ('south', 'west', 'north', 'east')],
+                (44.1, -73.9, 44.2, -73.8))
+
+
+class TestMaps(unittest.TestCase):
+    def test_reads_only_headers(self):
+        path = os.path.join(topo_maps.MAPS_DIR,
+                            'NY_Mt_Marcy_144109_1895_62500.kmz')
+        read = []
+
+        class CountingFile(io.FileIO):
+            def readinto(self, b):
+                n = super().readinto(b)
+                read.append(n)
+                return n
+
+        ZipFile = zipfile.ZipFile
+        with mock.patch('topo_maps.zipfile.ZipFile',
+                        lambda path: ZipFile(CountingFile(path))):
+            quad = topo_maps.read_quad(path)
+        self.assertEqual((quad.width, quad.height), (5300, 5300))
+        self.assertAlmostEqual(quad.north, 44.25, places=3)
+        self.assertAlmostEqual(quad.west, -74., places=3)
+        self.assertLess(sum(read), 0.01 * os.path.getsize(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Computes the distance, elevation gain/loss and moving time of recorded GPX
+tracks, in the same format as ps2d.py so planned and actual routes can be
+compared.
+
+Elevation is only reported for tracks with <ele> points, and moving time and
+pace only for tracks with <time> points.
+
+Dev command:
+    python3 routes/track_stats.py routes/2019-fkt-part-*.gpx
+"""
+
+from __future__ import print_function
+import os
+import sys
+import argparse
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import track_store
+
+EARTH_RADIUS_MILES = 3958.8
+FEET_PER_METER = 3.28084
+
+# Per trkseg values are (distance, moving time) pairs.
+TrackStats = namedtuple(
+    'TrackStats', ['distance', 'gain', 'loss', 'moving_time', 'segments'])
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great circle distance in miles between arrays of coordinates."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2)**2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2)
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
+
+
+def smooth(values, segments, window):
+    """Centered moving average of `values`, not mixing separate segments."""
+    if window <= 1 or len(values) < 2:
+        return values
+    kernel = np.ones(window) / window
+    bounds = list(segments) + [len(values)]
+    return np.concatenate([
+        np.convolve(np.pad(values[start:end], (window // 2,
+                                               (window - 1) // 2),
+                           mode='edge'),
+                    kernel,
+                    mode='valid') for (start, end) in zip(bounds, bounds[1:])
+    ])
+
+
+def track_stats(track, smoothing=9, min_speed=0.5):
+    """Computes TrackStats for a gpx.Track.
+
+    Elevation is smoothed with a `smoothing` point moving average before
+    summing gain and loss, and time spent below `min_speed` (mph) doesn't count
+    as moving time.
+    """
+    # Steps between consecutive points, excluding jumps between segments.
+    within_segment = np.ones(max(len(track.lat) - 1, 0), dtype=bool)
+    within_segment[track.segments[1:] - 1] = False
+
+    distances = haversine(track.lat[:-1], track.lon[:-1], track.lat[1:],
+                          track.lon[1:]) * within_segment
+    climbs = np.diff(smooth(track.ele, track.segments, smoothing))
+    climbs = climbs[within_segment] * FEET_PER_METER
+    durations = np.diff(track.time) * within_segment
+    with np.errstate(divide='ignore', invalid='ignore'):
+        moving = distances / (durations / 3600) >= min_speed
+    moving_durations = np.where(moving, durations, 0.)
+
+    bounds = list(track.segments) + [len(track.lat)]
+    segments = [(distances[start:end - 1].sum(),
+                 moving_durations[start:end - 1].sum())
+                for (start, end) in zip(bounds, bounds[1:])]
+    gain = climbs[climbs > 0].sum()
+    loss = -climbs[climbs < 0].sum()
+    if np.isnan(track.ele).all():
+        gain = loss = np.nan
+    moving_time = moving_durations.sum()
+    if np.isnan(track.time).all():
+        moving_time = np.nan
+    return TrackStats(distances.sum(), gain, loss, moving_time, segments)
+
+
+def format_stats(stats, timed_distance=None):
+    """Formats TrackStats, with the pace over `timed_distance` miles (default:
+    the whole distance) when only part of it has times."""
+    if timed_distance is None:
+        timed_distance = stats.distance
+    lines = ['Distance: {:.1f} miles'.format(stats.distance)]
+    if not np.isnan(stats.gain):
+        lines.append('+{:.0f} ft / -{:.0f} ft'.format(stats.gain, stats.loss))
+    if not np.isnan(stats.moving_time):
+        lines.append('Moving time: {} ({}/mi)'.format(
+            _format_duration(stats.moving_time),
+            _format_pace(stats.moving_time, timed_distance)))
+        if len(stats.segments) > 1:
+            for (i, (distance, moving_time)) in enumerate(stats.segments):
+                lines.append('  Segment {}: {:.1f} miles, {} ({}/mi)'.format(
+                    i + 1, distance, _format_duration(moving_time),
+                    _format_pace(moving_time, distance)))
+    return '\n'.join(lines)
+
+
+def _file_stats(args):
+    (filename, store_dir, smoothing, min_speed) = args
+    with np.errstate(invalid='ignore'):
+        return track_stats(track_store.load_track(filename, store_dir),
+                           smoothing, min_speed)
+
+
+def _total(values):
+    values = np.array(list(values))
+    if np.isnan(values).all():
+        return np.nan
+    return np.nansum(values)
+
+
+def _format_duration(seconds):
+    return '{:.0f}:{:02.0f}:{:02.0f}'.format(seconds // 3600,
+                                             seconds % 3600 // 60,
+                                             seconds % 60)
+
+
+def _format_pace(seconds, miles):
+    if miles == 0:
+        return '-'
+    pace = seconds / miles
+    return '{:.0f}:{:02.0f}'.format(pace // 60, pace % 60)
+
+
+def main(arguments):
+
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('infiles', help="GPX files", nargs='+', type=str)
+    parser.add_argument(
+        '-s',
+        '--smoothing',
+        help='Number of points to average elevation over',
+        default=9,
+        type=int)
+    parser.add_argument('--min_speed',
+                        help='Speed (mph) below which time is not moving',
+                        default=0.5,
+                        type=float)
+    parser.add_argument('--store_dir',
+                        help='Directory of converted tracks',
+                        default=track_store.DEFAULT_STORE_DIR,
+                        type=str)
+    parser.add_argument('-j',
+                        '--jobs',
+                        help='Number of files to process in parallel',
+                        type=int)
+
+    args = parser.parse_args(arguments)
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        all_stats = list(
+            executor.map(_file_stats, [(f, args.store_dir, args.smoothing,
+                                        args.min_speed)
+                                       for f in args.infiles]))
+    for (filename, stats) in zip(args.infiles, all_stats):
+        print(filename)
+        print(format_stats(stats))
+    if len(all_stats) > 1:
+        print('Total')
+        # Moving time only adds up over the files with times.
+        timed_distance = sum(s.distance for s in all_stats
+                             if not np.isnan(s.moving_time))
+        print(
+            format_stats(
+                TrackStats(*[_total(s[i] for s in all_stats)
+                             for i in range(4)],
+                           segments=[]), timed_distance))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,66 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Tests for track_stats.py.
+"""
+
+import unittest
+import gpx
+import track_stats
+import numpy as np
+
+
+class TestTrackStats(unittest.TestCase):
+    def setUp(self):
+        # Two segments, each of two points 0.01 degrees of latitude apart.
+        self.track = gpx.Track(lat=np.array([44., 44.01, 45., 45.01]),
+                               lon=np.array([-74., -74., -74., -74.]),
+                               ele=np.array([100., 200., 200., 150.]),
+                               time=np.array([0., 600., 3600., 3660.]),
+                               segments=np.array([0, 2]))
+
+    def test_haversine(self):
+        self.assertAlmostEqual(track_stats.haversine(44., -74., 45., -74.),
+                               69.09,
+                               places=2)
+
+    def test_stats(self):
+        stats = track_stats.track_stats(self.track, smoothing=1)
+        self.assertAlmostEqual(stats.distance, 2 * 0.6909, places=3)
+        self.assertAlmostEqual(stats.gain, 100 * track_stats.FEET_PER_METER)
+        self.assertAlmostEqual(stats.loss, 50 * track_stats.FEET_PER_METER)
+        self.assertEqual(stats.moving_time, 660)
+        self.assertEqual([t for (_, t) in stats.segments], [600, 60])
+
+    def test_min_speed(self):
+        stats = track_stats.track_stats(self.track, min_speed=5)
+        self.assertEqual(stats.moving_time, 60)
+
+    def test_missing_elevation(self):
+        track = self.track._replace(ele=np.full(4, np.nan))
+        self.assertTrue(np.isnan(track_stats.track_stats(track).gain))
+
+    def test_smoothing_keeps_segments_apart(self):
+        smoothed = track_stats.smooth(self.track.ele, self.track.segments, 3)
+        self.assertTrue(
+            np.allclose(smoothed, [400 / 3, 500 / 3, 550 / 3, 500 / 3]))
+
+    def test_smoothing_short_tracks(self):
+        for ele in ([], [400.]):
+            ele = np.array(ele)
+            self.assertIs(track_stats.smooth(ele, np.array([0]), 9), ele)
+
+    def test_pace_over_timed_distance(self):
+        stats = track_stats.TrackStats(10., np.nan, np.nan, 3600., [])
+        self.assertIn('Moving time: 1:00:00 (12:00/mi)',
+                      track_stats.format_stats(stats, timed_distance=5.))
+        self.assertIn('(6:00/mi)', track_stats.format_stats(stats))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Converts GPX tracks into a columnar store (one .npy file per column) and loads
+them back memory-mapped, so repeated analysis of a track skips XML parsing.
+
+Converted tracks are cached per source file, and reconverted when the source's
+content changes (checked by mtime and size, then by hash).
+
+Dev command:
+    python3 routes/track_store.py routes/*.gpx
+"""
+
+from __future__ import print_function
+import os
+import sys
+import argparse
+import hashlib
+import json
+import shutil
+
+import numpy as np
+
+import common
+import gpx
+
+DEFAULT_STORE_DIR = os.path.join(common.DEFAULT_CACHE_DIR, 'tracks')
+
+
+def load_track(path, store_dir=DEFAULT_STORE_DIR):
+    """Returns the gpx.Track for the GPX file at `path`, memory-mapped from the
+    store, converting it first if needed."""
+    track_dir = os.path.join(
+        store_dir,
+        hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest())
+    meta_path = os.path.join(track_dir, 'meta.json')
+    stat = os.stat(path)
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+    if meta is not None and (meta['mtime'], meta['size']) != (stat.st_mtime,
+                                                             stat.st_size):
+        if meta['sha256'] == _file_hash(path):
+            meta.update(mtime=stat.st_mtime, size=stat.st_size)
+            _write_meta(meta_path, meta)
+        else:
+            meta = None
+    if meta is None:
+        convert(path, track_dir)
+    return gpx.Track(*[
+        np.load(os.path.join(track_dir, c + '.npy'), mmap_mode='r')
+        for c in gpx.Track._fields
+    ])
+
+
+def convert(path, track_dir):
+    """Converts the GPX file at `path` into a store directory."""
+    stat = os.stat(path)
+    track = gpx.read_track(path)
+    tmp_dir = track_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for (column, values) in zip(gpx.Track._fields, track):
+        np.save(os.path.join(tmp_dir, column + '.npy'), values)
+    _write_meta(
+        os.path.join(tmp_dir, 'meta.json'), {
+            'source': os.path.abspath(path),
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'sha256': _file_hash(path),
+            'points': len(track.lat),
+        })
+    shutil.rmtree(track_dir, ignore_errors=True)
+    os.replace(tmp_dir, track_dir)
+
+
+def slice_track(track, start, stop):
+    """Returns points [start, stop) of a track, as views into its arrays."""
+    segments = track.segments[(track.segments > start)
+                              & (track.segments < stop)] - start
+    return gpx.Track(track.lat[start:stop], track.lon[start:stop],
+                     track.ele[start:stop], track.time[start:stop],
+                     np.concatenate([[0], segments]).astype(np.int64))
+
+
+def time_range(track, start_time, end_time):
+    """Returns the points of a track from the first to the last with
+    start_time <= time < end_time, or None if no point has a time.
+
+    Points without a time (NaN) are kept if they fall between those.
+    """
+    if np.isnan(track.time).all():
+        return None
+    inside = np.flatnonzero((track.time >= start_time)
+                            & (track.time < end_time))
+    if len(inside) == 0:
+        return slice_track(track, 0, 0)
+    return slice_track(track, inside[0], inside[-1] + 1)
+
+
+def _file_hash(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _write_meta(path, meta):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(path + '.tmp', path)
+
+
+def main(arguments):
+
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('infiles', help="GPX files", nargs='+', type=str)
+    parser.add_argument('--store_dir',
+                        help='Directory of converted tracks',
+                        default=DEFAULT_STORE_DIR,
+                        type=str)
+
+    args = parser.parse_args(arguments)
+
+    for filename in args.infiles:
+        track = load_track(filename, args.store_dir)
+        print('{}: {} points'.format(filename, len(track.lat)))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,86 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Tests for track_store.py.
+"""
+
+import unittest
+import os
+import shutil
+import tempfile
+import gpx
+import gpx_test
+import track_store
+import numpy as np
+
+from unittest import mock
+
+
+class TestLoadTrack(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store_dir = os.path.join(self.dir, 'store')
+        self.path = os.path.join(self.dir, 'track.gpx')
+        with open(self.path, 'wb') as f:
+            f.write(gpx_test.ALLTRAILS_GPX)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_round_trip(self):
+        track = track_store.load_track(self.path, self.store_dir)
+        self.assertEqual(list(track.ele), [1433.54, 1433.26, 1432.83])
+        self.assertEqual(list(track.segments), [0, 1])
+
+    def test_cached(self):
+        track_store.load_track(self.path, self.store_dir)
+        with mock.patch('track_store.convert') as convert:
+            track_store.load_track(self.path, self.store_dir)
+            # Touching the file without changing it keeps the cache.
+            os.utime(self.path, (0, 0))
+            track_store.load_track(self.path, self.store_dir)
+        convert.assert_not_called()
+
+    def test_invalidated_by_content(self):
+        track_store.load_track(self.path, self.store_dir)
+        with open(self.path, 'wb') as f:
+            f.write(gpx_test.GARMIN_GPX)
+        track = track_store.load_track(self.path, self.store_dir)
+        self.assertEqual(len(track.lat), 2)
+
+
+class TestSlicing(unittest.TestCase):
+    def setUp(self):
+        self.track = gpx.Track(*[np.arange(10.) for _ in range(4)],
+                               segments=np.array([0, 4, 8]))
+
+    def test_slice_track(self):
+        track = track_store.slice_track(self.track, 2, 9)
+        self.assertEqual(list(track.lat), [2., 3., 4., 5., 6., 7., 8.])
+        self.assertEqual(list(track.segments), [0, 2, 6])
+
+    def test_time_range(self):
+        track = track_store.time_range(self.track, 4, 6.5)
+        self.assertEqual(list(track.time), [4., 5., 6.])
+        self.assertEqual(list(track.segments), [0])
+
+    def test_time_range_missing_times(self):
+        time = self.track.time.copy()
+        time[[0, 5]] = np.nan
+        track = track_store.time_range(self.track._replace(time=time), 0,
+                                       6.5)
+        self.assertEqual(list(track.lat), [1., 2., 3., 4., 5., 6.])
+        self.assertEqual(len(track_store.time_range(self.track, 20, 30).lat),
+                         0)
+        self.assertIsNone(
+            track_store.time_range(
+                self.track._replace(time=np.full(10, np.nan)), 0, 10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,378 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Builds a trail network from recorded GPX tracks, and routes between
+coordinates on it offline, as a stand-in for the Gaia routing API.
+
+Trackpoints are snapped to a grid of `--snap` meter cells, each occupied cell
+becoming a node. Nodes are joined along the tracks and to occupied
+neighboring cells, which merges repeated recordings of the same trail. Edges
+carry distance (miles) and elevation gain/loss (ft, where the tracks have
+elevation). Queries use A* with landmark (ALT) lower bounds, precomputed
+when the network is built.
+
+Prints statistics of the built network, including how long queries take,
+and saves it to --output for ps2gpx.py and pairwise_distance.py
+--trail_network.
+
+Dev command:
+    python3 routes/trail_network.py routes/2019-fkt-part-*.gpx routes/2020-fkt-part-*.gpx
+"""
+
+from __future__ import print_function
+import os
+import sys
+import argparse
+import heapq
+import time
+
+import numpy as np
+import polyline
+
+import common
+import track_stats
+import track_store
+
+DEFAULT_NETWORK_PATH = os.path.join(common.DEFAULT_CACHE_DIR,
+                                    'trail_network.npz')
+
+EARTH_RADIUS_METERS = 6371008.8
+MILES_PER_KM = 0.621371
+
+
+class TrailNetwork(object):
+    """Undirected trail graph in CSR form: the edges of node i are
+    targets[offsets[i]:offsets[i + 1]], with per edge distance, gain and loss.
+    """
+    def __init__(self, lat, lon, ele, offsets, targets, distance, gain, loss,
+                 landmark_distances):
+        self.lat = lat
+        self.lon = lon
+        self.ele = ele
+        self.offsets = offsets
+        self.targets = targets
+        self.distance = distance
+        self.gain = gain
+        self.loss = loss
+        # (landmarks, nodes) distances in miles, inf if unreachable.
+        self.landmark_distances = landmark_distances
+        self._lat0 = np.radians(np.mean(lat)) if len(lat) else 0.
+        (self._x, self._y) = self._project(lat, lon)
+        # (target, distance, edge) lists, which heapq based searches iterate
+        # much faster than arrays.
+        self._adjacency = [
+            list(
+                zip(targets[start:end].tolist(),
+                    distance[start:end].tolist(), range(start, end)))
+            for (start, end) in zip(offsets[:-1].tolist(),
+                                    offsets[1:].tolist())
+        ]
+
+    @classmethod
+    def build(cls, tracks, snap=20., max_step=500., landmarks=16):
+        """Builds a network from gpx.Tracks.
+
+        Steps between consecutive trackpoints longer than `max_step` meters
+        (signal loss) are not joined.
+        """
+        lat = np.concatenate([t.lat for t in tracks])
+        lon = np.concatenate([t.lon for t in tracks])
+        ele = np.concatenate([t.ele for t in tracks])
+        # Steps between consecutive points of the same segment.
+        steps = np.ones(len(lat), dtype=bool)
+        start = 0
+        for track in tracks:
+            steps[start + track.segments] = False
+            start += len(track.lat)
+        steps = steps[1:]
+
+        lat0 = np.radians(np.mean(lat))
+        cx = np.floor(np.radians(lon) * EARTH_RADIUS_METERS * np.cos(lat0) /
+                      snap).astype(np.int64)
+        cy = np.floor(np.radians(lat) * EARTH_RADIUS_METERS /
+                      snap).astype(np.int64)
+        (cx, cy) = (cx - cx.min() + 1, cy - cy.min() + 1)
+        width = cy.max() + 2
+        (keys, nodes) = np.unique(cx * width + cy, return_inverse=True)
+        nodes = nodes.reshape(-1)
+        n = len(keys)
+        counts = np.bincount(nodes, minlength=n)
+        node_lat = np.bincount(nodes, weights=lat, minlength=n) / counts
+        node_lon = np.bincount(nodes, weights=lon, minlength=n) / counts
+        has_ele = ~np.isnan(ele)
+        with np.errstate(invalid='ignore'):
+            node_ele = (np.bincount(nodes[has_ele],
+                                    weights=ele[has_ele],
+                                    minlength=n) /
+                        np.bincount(nodes[has_ele], minlength=n))
+
+        # Edges along the tracks, and between neighboring occupied cells.
+        (a, b) = (nodes[:-1][steps], nodes[1:][steps])
+        step_lengths = track_stats.haversine(
+            lat[:-1][steps], lon[:-1][steps], lat[1:][steps],
+            lon[1:][steps]) / MILES_PER_KM * 1000
+        (a, b) = (a[step_lengths <= max_step], b[step_lengths <= max_step])
+        for offset in (width, 1, width + 1, width - 1):
+            neighbors = np.searchsorted(keys, keys + offset)
+            found = neighbors < n
+            found[found] = keys[neighbors[found]] == keys[found] + offset
+            a = np.concatenate([a, np.nonzero(found)[0]])
+            b = np.concatenate([b, neighbors[found]])
+        pairs = np.unique(np.stack([np.minimum(a, b),
+                                    np.maximum(a, b)])[:, a != b],
+                          axis=1)
+        (sources, targets) = (np.concatenate([pairs[0], pairs[1]]),
+                              np.concatenate([pairs[1], pairs[0]]))
+        order = np.argsort(sources, kind='stable')
+        (sources, targets) = (sources[order], targets[order])
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(sources,
+                                                             minlength=n))])
+        distance = track_stats.haversine(node_lat[sources], node_lon[sources],
+                                         node_lat[targets], node_lon[targets])
+        climb = np.nan_to_num(
+            (node_ele[targets] - node_ele[sources]) *
+            track_stats.FEET_PER_METER)
+        network = cls(node_lat, node_lon, node_ele, offsets, targets,
+                      distance, np.maximum(climb, 0), np.maximum(-climb, 0),
+                      np.zeros((0, n)))
+        network.landmark_distances = network._select_landmarks(landmarks)
+        return network
+
+    @classmethod
+    def load(cls, path=DEFAULT_NETWORK_PATH):
+        with np.load(path) as data:
+            return cls(*[data[f] for f in _FIELDS])
+
+    def save(self, path=DEFAULT_NETWORK_PATH):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, **{field: getattr(self, field) for field in _FIELDS})
+        os.replace(path + '.tmp', path)
+
+    def _project(self, lat, lon):
+        return (np.radians(lon) * EARTH_RADIUS_METERS * np.cos(self._lat0),
+                np.radians(lat) * EARTH_RADIUS_METERS)
+
+    def _select_landmarks(self, count):
+        """Distances from `count` landmarks in the largest connected component,
+        each as far as possible from the previous ones."""
+        if len(self.lat) == 0 or count == 0:
+            return np.zeros((0, len(self.lat)))
+        components = self.components()
+        largest = np.argmax(np.bincount(components))
+        nearest = self.distances_from(int(np.argmax(components == largest)))
+        distances = []
+        for _ in range(count):
+            landmark = int(
+                np.argmax(np.where(np.isfinite(nearest), nearest, -1)))
+            distances.append(self.distances_from(landmark))
+            nearest = np.minimum(nearest, distances[-1]) if len(
+                distances) > 1 else distances[-1]
+        return np.array(distances)
+
+    def components(self):
+        """Labels each node with its connected component."""
+        labels = np.full(len(self.lat), -1, dtype=np.int64)
+        label = 0
+        for node in range(len(self.lat)):
+            if labels[node] >= 0:
+                continue
+            labels[node] = label
+            stack = [node]
+            while stack:
+                for (target, _, _) in self._adjacency[stack.pop()]:
+                    if labels[target] < 0:
+                        labels[target] = label
+                        stack.append(target)
+            label += 1
+        return labels
+
+    def distances_from(self, source):
+        """Dijkstra's algorithm: distances in miles from `source` to every
+        node, inf if unreachable."""
+        distances = [np.inf] * len(self.lat)
+        distances[source] = 0.
+        queue = [(0., source)]
+        while queue:
+            (d, node) = heapq.heappop(queue)
+            if d > distances[node]:
+                continue
+            for (target, length, _) in self._adjacency[node]:
+                if d + length < distances[target]:
+                    distances[target] = d + length
+                    heapq.heappush(queue, (d + length, target))
+        return np.array(distances)
+
+    def nearest_node(self, lat, lon):
+        """Returns (nearest node to a coordinate, its distance in meters)."""
+        (x, y) = self._project(np.float64(lat), np.float64(lon))
+        d = (self._x - x)**2 + (self._y - y)**2
+        node = int(np.argmin(d))
+        return node, float(np.sqrt(d[node]))
+
+    def _lower_bounds(self, source, target, active=4):
+        """Lower bounds on the distance from every node to `target`.
+
+        Uses the triangle inequality bounds of the `active` landmarks giving
+        the best bound for `source`, or the straight line distance if no
+        landmark reaches `target`. Bounds are only meaningful for nodes
+        connected to `target`.
+        """
+        landmarks = self.landmark_distances[np.isfinite(
+            self.landmark_distances[:, target])]
+        if len(landmarks) == 0:
+            return track_stats.haversine(self.lat, self.lon, self.lat[target],
+                                         self.lon[target])
+        landmarks = landmarks[np.argsort(
+            -np.abs(landmarks[:, source] - landmarks[:, target]))[:active]]
+        with np.errstate(invalid='ignore'):
+            return np.abs(landmarks - landmarks[:, [target]]).max(axis=0)
+
+    def shortest_path(self, source, target):
+        """A* search between two nodes. Returns the list of edges on the path,
+        or None if the nodes aren't connected."""
+        bounds = self._lower_bounds(source, target).tolist()
+        distances = {source: 0.}
+        # Node > (previous node, edge into it).
+        previous = {source: None}
+        queue = [(bounds[source], source)]
+        while queue:
+            (_, node) = heapq.heappop(queue)
+            if node == target:
+                edges = []
+                while previous[node] is not None:
+                    (node, edge) = previous[node]
+                    edges.append(edge)
+                return edges[::-1]
+            d = distances[node]
+            for (neighbor, length, edge) in self._adjacency[node]:
+                if d + length < distances.get(neighbor, np.inf):
+                    distances[neighbor] = d + length
+                    previous[neighbor] = (node, edge)
+                    heapq.heappush(queue,
+                                   (d + length + bounds[neighbor], neighbor))
+        return None
+
+    def path_totals(self, edges):
+        """Returns (distance, gain, loss) along a path of edges."""
+        edges = np.asarray(edges, dtype=np.intp)
+        return (float(self.distance[edges].sum()),
+                float(self.gain[edges].sum()), float(self.loss[edges].sum()))
+
+    def route(self, start, end, max_snap=1000.):
+        """Returns a trip between two {'lat', 'long'} coordinates in the format
+        of the Gaia routing API (length in km, shape as a precision 6
+        polyline), or None if there is no route within `max_snap` meters of
+        both."""
+        (start_lat, start_lon) = (float(start['lat']), float(start['long']))
+        (end_lat, end_lon) = (float(end['lat']), float(end['long']))
+        (source, source_snap) = self.nearest_node(start_lat, start_lon)
+        (target, target_snap) = self.nearest_node(end_lat, end_lon)
+        if max(source_snap, target_snap) > max_snap:
+            return None
+        edges = self.shortest_path(source, target)
+        if edges is None:
+            return None
+        miles = (self.path_totals(edges)[0] +
+                 (source_snap + target_snap) / 1000 * MILES_PER_KM)
+        nodes = [source] + self.targets[edges].tolist()
+        shape = ([(start_lat, start_lon)] +
+                 list(zip(self.lat[nodes].tolist(), self.lon[nodes].tolist())) +
+                 [(end_lat, end_lon)])
+        return {
+            'summary': {
+                'length': miles / MILES_PER_KM
+            },
+            'legs': [{
+                'shape': polyline.encode(shape, 6)
+            }],
+        }
+
+
+_FIELDS = [
+    'lat', 'lon', 'ele', 'offsets', 'targets', 'distance', 'gain', 'loss',
+    'landmark_distances'
+]
+
+
+def time_queries(network, count=100, seed=46):
+    """Returns the mean seconds a shortest_path() query between random
+    connected nodes takes."""
+    rng = np.random.RandomState(seed)
+    components = network.components()
+    (sources, targets) = rng.randint(0, len(network.lat), (2, count * 10))
+    pairs = [(s, t) for (s, t) in zip(sources, targets)
+             if s != t and components[s] == components[t]][:count]
+    if not pairs:
+        return np.nan
+    start = time.perf_counter()
+    for (source, target) in pairs:
+        network.shortest_path(source, target)
+    return (time.perf_counter() - start) / len(pairs)
+
+
+def add_trail_network_arguments(parser):
+    parser.add_argument(
+        '--trail_network',
+        help='Route on a trail network built by trail_network.py instead of '
+        'the Gaia API (default path: {})'.format(DEFAULT_NETWORK_PATH),
+        nargs='?',
+        const=DEFAULT_NETWORK_PATH,
+        type=str)
+
+
+def router_from_args(args):
+    """Returns the route function of --trail_network, or None for Gaia."""
+    if args.trail_network is None:
+        return None
+    return TrailNetwork.load(args.trail_network).route
+
+
+def main(arguments):
+
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('infiles', help="GPX files", nargs='+', type=str)
+    parser.add_argument('-o',
+                        '--output',
+                        help='Where to save the network',
+                        default=DEFAULT_NETWORK_PATH,
+                        type=str)
+    parser.add_argument('--snap',
+                        help='Size in meters of the cells points snap to',
+                        default=20.,
+                        type=float)
+    parser.add_argument('--landmarks',
+                        help='Number of landmarks to precompute',
+                        default=16,
+                        type=int)
+    parser.add_argument('--store_dir',
+                        help='Directory of converted tracks',
+                        default=track_store.DEFAULT_STORE_DIR,
+                        type=str)
+
+    args = parser.parse_args(arguments)
+
+    tracks = [track_store.load_track(f, args.store_dir) for f in args.infiles]
+    network = TrailNetwork.build(tracks,
+                                 snap=args.snap,
+                                 landmarks=args.landmarks)
+    network.save(args.output)
+    print('{} nodes, {} edges, {:.1f} miles of trail, {} components'.format(
+        len(network.lat),
+        len(network.targets) // 2,
+        network.distance.sum() / 2,
+        network.components().max() + 1))
+    print('{:.1f} ms per query'.format(time_queries(network) * 1000))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
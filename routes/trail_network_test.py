@@ -0,0 +1,120 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Tests for trail_network.py.
+"""
+
+import unittest
+import gpx
+import os
+import polyline
+import shutil
+import tempfile
+import trail_network
+import numpy as np
+
+# About 11 m of latitude.
+STEP = 0.0001
+
+
+def _track(lat, lon, ele=None):
+    return gpx.Track(np.array(lat, dtype=float), np.array(lon, dtype=float),
+                     np.full(len(lat), np.nan) if ele is None else
+                     np.array(ele, dtype=float), np.full(len(lat), np.nan),
+                     np.array([0]))
+
+
+class TestTrailNetwork(unittest.TestCase):
+    def setUp(self):
+        steps = np.arange(200) * STEP
+        self.tracks = [
+            # A south > north trail, climbing 1 m per point.
+            _track(44.1 + steps, np.full(200, -73.9), ele=np.arange(200)),
+            # A west > east trail crossing it in the middle.
+            _track(np.full(200, 44.11), -73.91 + steps),
+            # The first trail again, recorded 5 m off.
+            _track(44.1 + steps, np.full(200, -73.89994)),
+            # A separate trail 10 km away.
+            _track(44.2 + steps[:20], np.full(20, -73.9)),
+        ]
+        self.network = trail_network.TrailNetwork.build(self.tracks,
+                                                        landmarks=4)
+
+    def _route_miles(self, start, end):
+        trip = self.network.route({
+            'lat': start[0],
+            'long': start[1]
+        }, {
+            'lat': end[0],
+            'long': end[1]
+        })
+        if trip is None:
+            return None
+        return trip['summary']['length'] * trail_network.MILES_PER_KM
+
+    def test_routes_along_trails(self):
+        # South end of the first trail to the west end of the second: up to
+        # the crossing, then west.
+        miles = self._route_miles((44.1, -73.9), (44.11, -73.91))
+        self.assertAlmostEqual(miles, 0.69 + 0.49, delta=0.05)
+        self.assertIsNone(self._route_miles((44.1, -73.9), (44.2, -73.9)))
+        self.assertIsNone(self._route_miles((44.1, -73.9), (44.5, -73.9)))
+
+    def test_matches_dijkstra(self):
+        network = self.network
+        rng = np.random.RandomState(46)
+        for (source, target) in rng.randint(0, len(network.lat), (20, 2)):
+            expected = network.distances_from(source)[target]
+            edges = network.shortest_path(source, target)
+            if np.isinf(expected):
+                self.assertIsNone(edges)
+            else:
+                self.assertAlmostEqual(
+                    network.path_totals(edges)[0], expected)
+
+    def test_elevation(self):
+        edges = self.network.shortest_path(
+            self.network.nearest_node(44.1, -73.9)[0],
+            self.network.nearest_node(44.1 + 199 * STEP, -73.9)[0])
+        (_, gain, loss) = self.network.path_totals(edges)
+        self.assertAlmostEqual(gain - loss, 199 * 3.28084, delta=20 * 3.28)
+
+    def test_shape(self):
+        trip = self.network.route({
+            'lat': 44.1,
+            'long': -73.9
+        }, {
+            'lat': 44.11,
+            'long': -73.9
+        })
+        # ps2gpx.py decodes shapes at precision 5 and divides by 10.
+        shape = [(lat / 10, lon / 10)
+                 for (lat, lon) in polyline.decode(trip['legs'][0]['shape'])]
+        self.assertEqual(shape[0], (44.1, -73.9))
+        self.assertEqual(shape[-1], (44.11, -73.9))
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'network.npz')
+            self.network.save(path)
+            loaded = trail_network.TrailNetwork.load(path)
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(list(loaded.targets), list(self.network.targets))
+        np.testing.assert_array_equal(loaded.landmark_distances,
+                                      self.network.landmark_distances)
+
+
+    def test_time_queries(self):
+        seconds = trail_network.time_queries(self.network, count=10)
+        self.assertTrue(0 < seconds < 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
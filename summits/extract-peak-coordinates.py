@@ -8,13 +8,16 @@
 """
 Extracts peak coordinates from, e.g.
 https://www.peakbagger.com/peak.aspx?pid=6048.
+
+See scrape_peaks.py to fetch and parse a whole list of peaks at once.
 """
 
 from __future__ import print_function
 import os
 import sys
 import argparse
-from bs4 import BeautifulSoup
+
+import scrape_peaks
 
 
 def main(arguments):
@@ -26,19 +29,11 @@ def main(arguments):
 
     args = parser.parse_args(arguments)
 
-    print("Peak name, Description, Lat, Long")
+    print(scrape_peaks.HEADER)
     for filename in args.infiles.split(","):
         with open(filename, 'r') as f:
-            soup = BeautifulSoup(f.read())
-            info = [l.text for l in soup.find_all("td") if '&deg' in l.text][1]
-            lat = info[info.find("W4") + 1:info.find(",", info.find("W4"))]
-            long = info[info.find(" ", info.find("W4")):info.
-                        find(" ",
-                             info.find(" ", info.find("W4")) + 1)]
-            el = [l.text for l in soup.find_all("h2")][0]
-            name = [l.text for l in soup.find_all("h1")][0]
-            print("%s, \"%s (%s)\", %s,%s" %
-                  (name[:name.find(",")], name, el, lat, long))
+            print(scrape_peaks.csv_line(scrape_peaks.parse_peak_page(
+                f.read())))
 
 
 if __name__ == '__main__':
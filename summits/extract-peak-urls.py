@@ -13,7 +13,8 @@ from __future__ import print_function
 import os
 import sys
 import argparse
-from bs4 import BeautifulSoup
+
+import scrape_peaks
 
 
 def main(arguments):
@@ -27,12 +28,7 @@ def main(arguments):
 
     args = parser.parse_args(arguments)
 
-    soup = BeautifulSoup(args.infile.read())
-    urls = [
-        "https://www.peakbagger.com/" + a['href']
-        for a in soup.find_all('a', href=True) if 'peak.aspx' in a['href']
-    ]
-    for u in urls:
+    for u in scrape_peaks.peak_urls(args.infile.read()):
         print(u)
 
 
@@ -0,0 +1,197 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Scrapes the coordinates of the peaks on a peakbagger.com list, e.g.
+https://www.peakbagger.com/list.aspx?lid=5120 (the 46ers, the default).
+
+Peak pages are fetched concurrently and cached on disk, then parsed in a pool
+of processes, looking only at the elements that hold the name, elevation and
+coordinates. Rows are written to the output csv as soon as they (and the rows
+before them) are ready, so an interrupted run leaves a valid partial file and
+a rerun is served from the cache.
+
+Pages can also be given as saved HTML files or urls instead of a list.
+
+Dev command:
+    python3 summits/scrape_peaks.py -o summits/coordinates.csv
+"""
+
+from __future__ import print_function
+import os
+import sys
+import argparse
+import contextlib
+import hashlib
+import re
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+LIST_URL = 'https://www.peakbagger.com/list.aspx?lid=5120'
+
+HEADER = 'Peak name, Description, Lat, Long'
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+    'fkt-attempt-46ers', 'pages')
+
+# lxml is several times faster, where it's installed.
+try:
+    import lxml
+    PARSER = 'lxml'
+except ImportError:
+    PARSER = 'html.parser'
+
+# Only these elements are built into trees.
+_LINKS = SoupStrainer('a', href=True)
+_PEAK_ELEMENTS = SoupStrainer(['h1', 'h2', 'td'])
+
+# Decimal coordinates follow the degrees/minutes/seconds ones, which end in W.
+_COORDINATES_PATTERN = re.compile(r'W\s*(-?\d+\.\d+),\s*(-?\d+\.\d+)')
+
+
+def peak_urls(html, base_url=LIST_URL):
+    """Returns the absolute urls of the peak pages linked from a list page,
+    in order."""
+    soup = BeautifulSoup(html, PARSER, parse_only=_LINKS)
+    urls = []
+    for a in soup.find_all('a'):
+        if 'peak.aspx' in a['href']:
+            url = urljoin(base_url, a['href'])
+            if url not in urls:
+                urls.append(url)
+    return urls
+
+
+def parse_peak_page(html):
+    """Returns (name, description, lat, long) of a peak page, with
+    coordinates as strings in decimal degrees."""
+    soup = BeautifulSoup(html, PARSER, parse_only=_PEAK_ELEMENTS)
+    title = soup.find('h1').get_text()
+    elevation = soup.find('h2').get_text()
+    for td in soup.find_all('td'):
+        match = _COORDINATES_PATTERN.search(td.get_text())
+        if match is not None:
+            break
+    assert match is not None, 'No coordinates for {}'.format(title)
+    return (title.split(',')[0], '{} ({})'.format(title, elevation),
+            match.group(1), match.group(2))
+
+
+def csv_line(peak):
+    """Formats a parse_peak_page result as a line of coordinates.csv."""
+    return '{}, "{}", {}, {}'.format(*peak)
+
+
+def read_page(source, cache_dir=DEFAULT_CACHE_DIR, session=None):
+    """Returns the HTML of a saved file, or of a url, fetching it only if it
+    isn't cached in `cache_dir`."""
+    if os.path.exists(source):
+        with open(source, 'rb') as f:
+            return f.read().decode('utf-8')
+    path = os.path.join(cache_dir,
+                        hashlib.sha256(source.encode('utf-8')).hexdigest())
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read().decode('utf-8')
+    if session is None:
+        import requests as session
+    response = session.get(source)
+    response.raise_for_status()
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(response.content)
+    os.replace(path + '.tmp', path)
+    return response.content.decode('utf-8')
+
+
+def scrape(sources, out, cache_dir=DEFAULT_CACHE_DIR, workers=8, jobs=None):
+    """Writes a coordinates.csv line to `out` for each page in `sources`, in
+    order, as they are ready. Returns the number of lines written."""
+    import requests
+    session = requests.Session()
+    written = 0
+    with ThreadPoolExecutor(max_workers=workers) as fetchers, \
+            ProcessPoolExecutor(max_workers=jobs) as parsers:
+        fetches = {
+            fetchers.submit(read_page, source, cache_dir, session): i
+            for (i, source) in enumerate(sources)
+        }
+        # Parses by index in `sources`, until they are written.
+        parses = {}
+        pending = set(fetches)
+        while pending:
+            (done, pending) = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in fetches:
+                    parse = parsers.submit(parse_peak_page, future.result())
+                    parses[fetches[future]] = parse
+                    pending.add(parse)
+            while written in parses and parses[written].done():
+                print(csv_line(parses.pop(written).result()), file=out)
+                out.flush()
+                written += 1
+    return written
+
+
+def main(arguments):
+
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pages',
+                        help='Peak page urls or saved HTML files (instead of '
+                        'a list)',
+                        nargs='*',
+                        type=str)
+    parser.add_argument('-l',
+                        '--list',
+                        help='Url or saved HTML file of a peakbagger list '
+                        '(default: the 46ers, if no pages are given)',
+                        type=str)
+    parser.add_argument('-o',
+                        '--output',
+                        help='csv file to write coordinates to (default: '
+                        'stdout)',
+                        type=str)
+    parser.add_argument('-w',
+                        '--workers',
+                        help='Number of pages to fetch concurrently',
+                        default=8,
+                        type=int)
+    parser.add_argument('-j',
+                        '--jobs',
+                        help='Number of processes parsing pages (default: '
+                        'one per CPU)',
+                        type=int)
+    parser.add_argument('--cache_dir',
+                        help='Directory of cached pages',
+                        default=DEFAULT_CACHE_DIR,
+                        type=str)
+
+    args = parser.parse_args(arguments)
+
+    sources = list(args.pages)
+    if args.list or not sources:
+        list_source = args.list or LIST_URL
+        sources += peak_urls(read_page(list_source, args.cache_dir),
+                             base_url=list_source
+                             if '://' in list_source else LIST_URL)
+
+    with (contextlib.nullcontext(sys.stdout)
+          if args.output is None else open(args.output, 'w')) as out:
+        print(HEADER, file=out)
+        out.flush()
+        count = scrape(sources, out, args.cache_dir, args.workers, args.jobs)
+    print('Scraped {} peaks'.format(count), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,129 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2019 Devon Proctor <devon.proctor@gmail.com>
+#
+# Distributed under terms of the MIT license.
+"""
+Tests for scrape_peaks.py, against pages saved in testdata/.
+"""
+
+import unittest
+import os
+import scrape_peaks
+import shutil
+import tempfile
+import threading
+
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from io import StringIO
+from unittest import mock
+
+TESTDATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'testdata')
+
+
+def _read(name):
+    with open(os.path.join(TESTDATA_DIR, name)) as f:
+        return f.read()
+
+
+class _TestdataHandler(SimpleHTTPRequestHandler):
+    requests = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=TESTDATA_DIR, **kwargs)
+
+    def do_GET(self):
+        _TestdataHandler.requests.append(self.path)
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestParse(unittest.TestCase):
+    def test_peak_urls(self):
+        self.assertEqual(scrape_peaks.peak_urls(_read('list.html')), [
+            'https://www.peakbagger.com/peak.aspx?pid=6048',
+            'https://www.peakbagger.com/peak.aspx?pid=6043'
+        ])
+
+    def test_parse_peak_page(self):
+        peak = scrape_peaks.parse_peak_page(_read('marcy.html'))
+        self.assertEqual(
+            peak, ('Mount Marcy',
+                   'Mount Marcy, New York (Elevation: 5344 feet, 1629 meters)',
+                   '44.112857', '-73.923784'))
+        # The line checked in for Mount Marcy.
+        with open(os.path.join(TESTDATA_DIR, '..', 'coordinates.csv')) as f:
+            self.assertIn(scrape_peaks.csv_line(peak) + '\n', list(f))
+
+
+class TestScrape(unittest.TestCase):
+    def setUp(self):
+        _TestdataHandler.requests = []
+        self.server = HTTPServer(('localhost', 0), _TestdataHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://localhost:{}/'.format(self.server.server_port)
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir)
+
+    def test_writes_in_order_and_caches(self):
+        sources = [
+            self.url + 'esther.html', self.url + 'marcy.html',
+            os.path.join(TESTDATA_DIR, 'esther.html')
+        ]
+        for _ in range(2):
+            out = StringIO()
+            count = scrape_peaks.scrape(sources,
+                                        out,
+                                        cache_dir=self.cache_dir,
+                                        workers=3,
+                                        jobs=2)
+            self.assertEqual(count, 3)
+            self.assertEqual(
+                [line.split(',')[0] for line in out.getvalue().splitlines()],
+                ['Esther Mountain', 'Mount Marcy', 'Esther Mountain'])
+        # Each url is fetched once, and files are read directly.
+        self.assertEqual(sorted(_TestdataHandler.requests),
+                         ['/esther.html', '/marcy.html'])
+
+    def test_writes_before_all_pages_are_fetched(self):
+        release = threading.Event()
+        read_page = scrape_peaks.read_page
+
+        def slow_read_page(source, *args):
+            if source == 'last':
+                assert release.wait(10)
+                raise IOError('Fetch failed')
+            return read_page(source, *args)
+
+        out = StringIO()
+        marcy = os.path.join(TESTDATA_DIR, 'marcy.html')
+        with mock.patch.object(scrape_peaks, 'read_page', slow_read_page):
+            scraper = threading.Thread(
+                target=self.assertRaises,
+                args=(IOError, scrape_peaks.scrape, [marcy, marcy, 'last'],
+                      out, self.cache_dir))
+            scraper.start()
+            # The pages before the pending one are written without waiting
+            # for it, and stay written when it fails.
+            for _ in range(100):
+                if len(out.getvalue().splitlines()) == 2:
+                    break
+                scraper.join(0.1)
+            release.set()
+            scraper.join()
+        self.assertEqual(
+            [line.split(',')[0] for line in out.getvalue().splitlines()],
+            ['Mount Marcy', 'Mount Marcy'])
+
+
+if __name__ == '__main__':
+    unittest.main()